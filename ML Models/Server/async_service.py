@@ -0,0 +1,383 @@
+import asyncio
+import contextvars
+import itertools
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from aiohttp import web
+from dotenv import load_dotenv
+from helper_functions import load_saved_models, make_fleet_predictions, MODEL_BUNDLE_PATH
+from replay_store import get_replay_store
+from machine_history import MachineHistory
+from db_writer import (MACHINE_COLUMNS, PredictionWriter, create_connection_pool, fetch_latest_prediction,
+                       fetch_pointers, prediction_record)
+from model_manager import ModelManager, bundle_version
+from tracing import get_tracer, trace_context
+from metrics import (render as render_metrics, CYCLE_SECONDS, DB_SECONDS, DROPPED_TICKS,
+                     MACHINES_FAILED, MACHINES_PROCESSED, MODEL_LOAD_SECONDS, STAGE_SECONDS)
+
+# Asyncio service mode: the same replay cycle as flask-ml-api.py, but the periodic loop, the
+# database I/O and the HTTP handlers share one event loop, and scoring runs in a thread pool.
+# Run with: python async_service.py
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO,
+                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+tracer = get_tracer(__name__)
+
+CSV_FILE_PATH = os.getenv("REPLAY_DATA_PATH", './static/cnc_machine_static_data.csv')
+DATABASE_URL = os.getenv("DATABASE_URL")
+PROCESS_INTERVAL_SECONDS = float(os.getenv("PROCESS_INTERVAL_SECONDS", "6"))
+ML_WORKERS = int(os.getenv("ML_WORKERS", "1"))
+ML_CHUNK_SIZE = int(os.getenv("ML_CHUNK_SIZE", "256"))
+MODEL_WATCH_SECONDS = float(os.getenv("MODEL_WATCH_SECONDS", "0"))
+CANARY_ROWS = int(os.getenv("CANARY_ROWS", "32"))
+HISTORY_PATH = os.getenv("HISTORY_PATH")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "5000"))
+
+REPLAY_TIMER = STAGE_SECONDS.labels('replay')
+DB_FETCH_TIMER = DB_SECONDS.labels('fetch_pointers')
+DB_WRITE_TIMER = DB_SECONDS.labels('write')
+DB_PREDICTION_TIMER = DB_SECONDS.labels('fetch_prediction')
+
+
+class AsyncPostgres:
+    # asyncpg connection pool; queries yield to the event loop while waiting on the server
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    @classmethod
+    async def connect(cls, database_url, max_connections=10):
+        import asyncpg
+        return cls(await asyncpg.create_pool(database_url, min_size=1, max_size=max_connections))
+
+    async def fetch_pointers(self):
+        rows = await self.pool.fetch('SELECT id, row_idx FROM factory')
+        return [{'id': row['id'], 'row_idx': row['row_idx']} for row in rows]
+
+    async def fetch_latest_prediction(self, machine_id):
+        row = await self.pool.fetchrow(f'''
+            SELECT {', '.join(MACHINE_COLUMNS)} FROM machine
+            WHERE id = $1
+            ORDER BY timestamp DESC
+            LIMIT 1
+        ''', machine_id)
+        return None if row is None else dict(row)
+
+    async def write_predictions(self, records, pointers):
+        # Same single transaction as PredictionWriter: bulk COPY the rows, then one pointer UPDATE
+        records = [(r[0], pd.Timestamp(r[1]).to_pydatetime()) + tuple(r[2:]) for r in records]
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                if records:
+                    await conn.copy_records_to_table('machine', records=records, columns=MACHINE_COLUMNS)
+                if pointers:
+                    await conn.execute('''
+                        UPDATE factory
+                        SET row_idx = v.row_idx
+                        FROM unnest($1::int[], $2::int[]) AS v(row_idx, id)
+                        WHERE factory.id = v.id
+                    ''', [row_idx for row_idx, _ in pointers], [machine_id for _, machine_id in pointers])
+
+    async def close(self):
+        await self.pool.close()
+
+
+class AsyncSQLite:
+    # SQLite has no async driver here: the blocking db_writer calls run on one dedicated thread
+
+    def __init__(self, database_url):
+        self.pool = create_connection_pool(database_url)
+        self.writer = PredictionWriter(self.pool)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite')
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def fetch_pointers(self):
+        pointers = await self._run(fetch_pointers, self.pool)
+        return self.writer.apply_pending(pointers)
+
+    async def fetch_latest_prediction(self, machine_id):
+        return await self._run(fetch_latest_prediction, self.pool, machine_id)
+
+    async def write_predictions(self, records, pointers):
+        # score_chunk returns one pointer per record, in the same order
+        def write():
+            for record, (next_row_idx, _) in zip(records, pointers):
+                self.writer.add(record, next_row_idx)
+            self.writer.flush()
+        await self._run(write)
+
+    async def close(self):
+        self.executor.shutdown()
+
+
+async def connect_database(database_url, max_connections=10):
+    if database_url.startswith('sqlite:///'):
+        return AsyncSQLite(database_url)
+    return await AsyncPostgres.connect(database_url, max_connections)
+
+
+# Score one slice of the fleet; runs on a worker thread and returns (records, pointers) to write
+def score_chunk(store, chunk, models, history):
+    machine_ids = [pointer['id'] for pointer in chunk]
+    row_indices = [pointer['row_idx'] for pointer in chunk]
+    with REPLAY_TIMER.time():
+        batch_df = store.rows(row_indices)
+    batch_df.index = machine_ids
+    results_df = make_fleet_predictions(batch_df, models, history=history)
+
+    records, pointers = [], []
+    for machine_id, row_idx in zip(machine_ids, row_indices):
+        try:
+            results = results_df.loc[machine_id]
+            records.append(prediction_record(machine_id, batch_df.loc[machine_id], results))
+            pointers.append(((row_idx + 1) % 10000, machine_id))
+            if tracer.info_enabled:
+                with trace_context(machine_id=machine_id):
+                    tracer.info('machine_processed', row_idx=row_idx, is_anomaly=int(results['predicted_anomaly']))
+        except Exception as e:
+            logger.error(f"Error processing machine {machine_id}: {e}")
+    return records, pointers
+
+
+async def run_periodic(interval, job, on_skipped=None):
+    """
+    Run `await job()` every `interval` seconds, on a fixed schedule:
+    1. Tick times are start + k * interval, so the time a cycle takes never shifts later ticks
+    2. Ticks missed while a cycle overran are skipped (on_skipped(n) is called), not queued up
+    """
+    loop = asyncio.get_running_loop()
+    next_run = loop.time()
+    while True:
+        try:
+            await job()
+        except Exception as e:
+            logger.error(f"Periodic job {getattr(job, '__name__', job)} failed: {e}")
+        next_run += interval
+        now = loop.time()
+        if now > next_run:
+            missed = int((now - next_run) // interval) + 1
+            next_run += missed * interval
+            if on_skipped is not None:
+                on_skipped(missed)
+        await asyncio.sleep(next_run - now)
+
+
+class AsyncService:
+    """
+    Owns the service state: models, database, scoring pool and the processing loop.
+    1. A cycle fetches the pointers, scores the fleet in chunks on the thread pool
+       (ML_WORKERS threads) and writes everything in one transaction
+    2. One cycle runs at a time; a scheduled tick or /trigger that finds one running is skipped
+    """
+
+    def __init__(self, database_url=DATABASE_URL, workers=ML_WORKERS, chunk_size=ML_CHUNK_SIZE,
+                 interval=PROCESS_INTERVAL_SECONDS):
+        self.database_url = database_url
+        self.chunk_size = chunk_size
+        self.interval = interval
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ml-worker')
+        self.workers = workers
+        self.history = MachineHistory()
+        self.cycle_lock = asyncio.Lock()
+        self.cycle_ids = itertools.count(1)
+        self.cycle_stats = {
+            'cycles': 0,
+            'last_cycle_seconds': None,
+            'last_processed': 0,
+            'last_machines': 0,
+            'queue_depth': 0,
+            'dropped_ticks': 0,
+        }
+        self.db = None
+        self.model_manager = None
+        self._tasks = []
+
+    async def run_blocking(self, func, *args):
+        # Run on the scoring pool, carrying the current trace context (cycle ID) along
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self.executor, context.run, func, *args)
+
+    def canary_batch(self):
+        store = get_replay_store(CSV_FILE_PATH)
+        batch_df = store.rows(range(min(len(store), CANARY_ROWS * 4))).dropna().head(CANARY_ROWS)
+        return batch_df.reset_index(drop=True)
+
+    async def start(self):
+        load_start = time.perf_counter()
+        models = await self.run_blocking(load_saved_models)
+        MODEL_LOAD_SECONDS.labels('all').set(time.perf_counter() - load_start)
+        logger.info("ML models loaded successfully")
+        self.model_manager = ModelManager(models, load_saved_models, MODEL_BUNDLE_PATH,
+                                          canary=self.canary_batch, score=make_fleet_predictions)
+
+        if HISTORY_PATH and os.path.exists(HISTORY_PATH):
+            try:
+                await self.run_blocking(self.history.load, HISTORY_PATH, bundle_version(models))
+                logger.info(f"Loaded history for {len(self.history)} machines from {HISTORY_PATH}")
+            except Exception as e:
+                logger.error(f"Error loading machine history: {e}")
+
+        self.db = await connect_database(self.database_url, DB_POOL_SIZE)
+        self._tasks.append(asyncio.create_task(run_periodic(self.interval, self.scheduled_cycle, self.on_skipped_ticks)))
+        if MODEL_WATCH_SECONDS > 0:
+            self._tasks.append(asyncio.create_task(run_periodic(MODEL_WATCH_SECONDS, self.check_for_update)))
+        logger.info("Processing loop started")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        # Let a cycle in progress finish writing before the pools go away
+        async with self.cycle_lock:
+            if self.db is not None:
+                await self.db.close()
+        self.executor.shutdown()
+
+    async def check_for_update(self):
+        await self.run_blocking(self.model_manager.check_for_update)
+
+    def on_skipped_ticks(self, missed):
+        self.cycle_stats['dropped_ticks'] += missed
+        DROPPED_TICKS.inc(missed)
+        logger.warning(f"Skipped {missed} scheduled processing cycle(s) (previous cycle ran past its tick)")
+
+    async def scheduled_cycle(self):
+        await self.process_all_machines()
+
+    async def process_all_machines(self):
+        if self.cycle_lock.locked():
+            self.on_skipped_ticks(1)
+            return 0
+        async with self.cycle_lock:
+            with trace_context(cycle_id=next(self.cycle_ids)):
+                return await self.run_processing_cycle()
+
+    async def run_processing_cycle(self):
+        logger.info("Starting processing cycle for all machines")
+        cycle_start = time.perf_counter()
+        with DB_FETCH_TIMER.time():
+            pointers = await self.db.fetch_pointers()
+
+        store = await self.run_blocking(get_replay_store, CSV_FILE_PATH)
+        n_rows = len(store)
+        # Take the models reference once: a reload during this cycle only affects the next one
+        models = self.model_manager.current
+
+        valid = []
+        for pointer in pointers:
+            if pointer['row_idx'] >= n_rows:
+                logger.warning(f"Row index {pointer['row_idx']} out of bounds for machine {pointer['id']}")
+            else:
+                valid.append(pointer)
+
+        chunks = [valid[i:i + self.chunk_size] for i in range(0, len(valid), self.chunk_size)]
+        self.cycle_stats['queue_depth'] = len(chunks)
+
+        async def score(chunk):
+            try:
+                return await self.run_blocking(score_chunk, store, chunk, models, self.history)
+            except Exception as e:
+                logger.error(f"Error running batch predictions: {e}")
+                return [], []
+            finally:
+                self.cycle_stats['queue_depth'] -= 1
+
+        records, row_pointers = [], []
+        for chunk_records, chunk_pointers in await asyncio.gather(*(score(chunk) for chunk in chunks)):
+            records.extend(chunk_records)
+            row_pointers.extend(chunk_pointers)
+
+        # Write the whole cycle in one transaction
+        processed_count = 0
+        try:
+            with DB_WRITE_TIMER.time():
+                await self.db.write_predictions(records, row_pointers)
+            processed_count = len(records)
+        except Exception as e:
+            logger.error(f"Error writing predictions: {e}")
+
+        if HISTORY_PATH and valid:
+            try:
+                await self.run_blocking(self.history.save, HISTORY_PATH)
+            except Exception as e:
+                logger.error(f"Error saving machine history: {e}")
+
+        cycle_seconds = time.perf_counter() - cycle_start
+        CYCLE_SECONDS.observe(cycle_seconds)
+        # Both counts come from this cycle's own records, never from what the writer had buffered
+        MACHINES_PROCESSED.inc(processed_count)
+        MACHINES_FAILED.inc(len(pointers) - processed_count)
+        self.cycle_stats['cycles'] += 1
+        self.cycle_stats['last_cycle_seconds'] = cycle_seconds
+        self.cycle_stats['last_processed'] = processed_count
+        self.cycle_stats['last_machines'] = len(pointers)
+
+        logger.info(f"Completed processing cycle. Processed {processed_count}/{len(pointers)} machines in {cycle_seconds:.2f}s.")
+        return processed_count
+
+
+# API endpoints, served on the same event loop as the processing loop
+routes = web.RouteTableDef()
+
+@routes.get('/status')
+async def get_status(request):
+    service = request.app['service']
+    return web.json_response({
+        'status': 'running',
+        'message': 'ML prediction service is active',
+        'workers': service.workers,
+        'cycle': dict(service.cycle_stats),
+        'models': dict(service.model_manager.status)
+    })
+
+@routes.get('/metrics')
+async def get_metrics(request):
+    return web.Response(text=render_metrics(), content_type='text/plain', charset='utf-8')
+
+@routes.get('/trigger')
+async def trigger_processing(request):
+    machines_processed = await request.app['service'].process_all_machines()
+    return web.json_response({
+        'status': 'success',
+        'machines_processed': machines_processed
+    })
+
+@routes.get('/machine/{machine_id:\\d+}')
+async def get_machine_predictions(request):
+    machine_id = int(request.match_info['machine_id'])
+    with DB_PREDICTION_TIMER.time():
+        prediction = await request.app['service'].db.fetch_latest_prediction(machine_id)
+
+    if prediction:
+        prediction['timestamp'] = str(prediction['timestamp'])
+        return web.json_response(prediction)
+    else:
+        return web.json_response({'error': 'No predictions found for this machine'}, status=404)
+
+
+def create_app(service=None):
+    app = web.Application()
+    app['service'] = service or AsyncService()
+    app.add_routes(routes)
+
+    async def lifecycle(app):
+        await app['service'].start()
+        yield
+        await app['service'].stop()
+
+    app.cleanup_ctx.append(lifecycle)
+    return app
+
+
+if __name__ == '__main__':
+    web.run_app(create_app(), host=HOST, port=PORT)
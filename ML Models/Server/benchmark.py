@@ -0,0 +1,221 @@
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import platform
+import sqlite3
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import sklearn
+from dataset_io import read_frame
+from db_writer import MACHINE_COLUMNS
+from feature_schema import FEATURE_SCHEMA
+from helper_functions import load_saved_models, make_fleet_predictions
+from machine_history import MachineHistory
+
+STAGES = ['features', 'scaling', 'iso_forest', 'type_classifier', 'health_regressor', 'lstm', 'end_to_end']
+# The repository's sample dataset, next to the training scripts
+DEFAULT_DATA_PATH = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cnc_machine_data.csv'))
+
+
+def latency_summary(seconds, rows):
+    # Percentiles over individual calls, throughput over the total time spent in the stage
+    seconds = np.asarray(seconds)
+    total = seconds.sum()
+    return {
+        'calls': len(seconds),
+        'p50_ms': float(np.percentile(seconds, 50) * 1000),
+        'p95_ms': float(np.percentile(seconds, 95) * 1000),
+        'p99_ms': float(np.percentile(seconds, 99) * 1000),
+        'mean_ms': float(seconds.mean() * 1000),
+        'rows_per_sec': float(rows / total) if total > 0 else None,
+    }
+
+
+# Replay the data as a fleet: machine i reads row i (wrapping around), indexed by machine ID
+def fleet_frame(data, fleet_size, offset=0):
+    rows = data.iloc[(np.arange(fleet_size) + offset) % len(data)].reset_index(drop=True)
+    rows.index = np.arange(1, fleet_size + 1)
+    return rows
+
+
+# Time each model stage separately, in the same order and on the same inputs as score_static_models
+def time_stages(batch_df, models, histories, timings, rows):
+    # histories: one MachineHistory per stage that appends to one ('lstm', 'end_to_end'), so
+    # each sees every reading exactly once; rows counts the rows each stage actually scored
+    def timed(stage, func, *args, n_rows=len(batch_df)):
+        start = time.perf_counter()
+        result = func(*args)
+        timings[stage].append(time.perf_counter() - start)
+        rows[stage] += n_rows
+        return result
+
+    X = timed('features', FEATURE_SCHEMA.matrix_from_frame, batch_df)
+
+    def scale(X):
+        X_anomaly_scaled = models['scaler_anomaly'].transform(X)
+        column_means = np.nanmean(X_anomaly_scaled, axis=0)
+        X_anomaly_scaled = np.where(np.isnan(X_anomaly_scaled), column_means, X_anomaly_scaled)
+        return X_anomaly_scaled, models['scaler_X_maint'].transform(X)
+    X_anomaly_scaled, X_maint_scaled = timed('scaling', scale, X)
+
+    anomaly_scores = timed('iso_forest', models['iso_forest'].decision_function, X_anomaly_scaled)
+    anomaly_mask = anomaly_scores < 0
+    X_anomalies = X[anomaly_mask] if anomaly_mask.any() else X[:1]
+    timed('type_classifier', models['anomaly_type_classifier'].predict, X_anomalies, n_rows=len(X_anomalies))
+    timed('health_regressor', models['health_score_predictor'].predict, X)
+
+    def lstm(X_maint_scaled):
+        X_seq = histories['lstm'].append_many(batch_df.index, X_maint_scaled)
+        return models['scaler_y_maint'].inverse_transform(models['maintenance_predictor'].predict(X_seq))
+    timed('lstm', lstm, X_maint_scaled)
+
+    timed('end_to_end', make_fleet_predictions, batch_df, models, 48, histories['end_to_end'])
+
+
+def benchmark_stages(data, models, fleet_size, batch_size, repeats):
+    timings = {stage: [] for stage in STAGES}
+    rows = dict.fromkeys(STAGES, 0)
+    histories = {'lstm': MachineHistory(), 'end_to_end': MachineHistory()}
+    for repeat in range(repeats + 1):
+        # Each repeat is one tick: every machine moves on to its next reading
+        fleet_df = fleet_frame(data, fleet_size, offset=repeat)
+        # The first tick is a warm-up (history buffers, lazy model loads) and is not reported
+        run_timings = timings if repeat > 0 else {stage: [] for stage in STAGES}
+        run_rows = rows if repeat > 0 else dict.fromkeys(STAGES, 0)
+        for start in range(0, fleet_size, batch_size):
+            time_stages(fleet_df.iloc[start:start + batch_size], models, histories, run_timings, run_rows)
+
+    return {stage: latency_summary(seconds, rows[stage]) for stage, seconds in timings.items()}
+
+
+# SQLite stand-in for the factory/machine tables used by flask-ml-api.py
+def create_sqlite_standin(path, fleet_size, n_rows):
+    conn = sqlite3.connect(path)
+    conn.execute('DROP TABLE IF EXISTS machine')
+    conn.execute('DROP TABLE IF EXISTS factory')
+    conn.execute(f"CREATE TABLE machine ({', '.join(MACHINE_COLUMNS)})")
+    conn.execute('CREATE TABLE factory (id INTEGER PRIMARY KEY, row_idx INTEGER)')
+    conn.executemany('INSERT INTO factory VALUES (?, ?)', [(i, (i - 1) % n_rows) for i in range(1, fleet_size + 1)])
+    conn.commit()
+    conn.close()
+
+
+def load_api(data_path, db_path):
+    # The API reads its configuration at import time
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ['REPLAY_DATA_PATH'] = data_path
+    os.environ['PROCESS_INTERVAL_SECONDS'] = str(10 ** 9)
+    api_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'flask-ml-api.py')
+    spec = importlib.util.spec_from_file_location('flask_ml_api', api_path)
+    api = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(api)
+    return api
+
+
+def benchmark_cycles(api, db_path, fleet_size, chunk_size, cycles, n_rows):
+    create_sqlite_standin(db_path, fleet_size, n_rows)
+    api.ML_CHUNK_SIZE = chunk_size
+    # Warm-up cycle, then the timed ones
+    api.process_all_machines()
+    seconds = []
+    for _ in range(cycles):
+        start = time.perf_counter()
+        api.process_all_machines()
+        seconds.append(time.perf_counter() - start)
+    return latency_summary(seconds, fleet_size * cycles)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def print_comparison(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {(r['fleet_size'], r['batch_size']): r['stages'] for r in baseline['stages']}
+    print(f"\nChange in p50 vs {baseline_path} ({baseline['meta'].get('commit')}):")
+    for result in results['stages']:
+        before = previous.get((result['fleet_size'], result['batch_size']))
+        if before is None:
+            continue
+        changes = [f"{stage} {(stats['p50_ms'] / before[stage]['p50_ms'] - 1) * 100:+.0f}%"
+                   for stage, stats in result['stages'].items() if before.get(stage, {}).get('p50_ms')]
+        print(f"- fleet {result['fleet_size']}, batch {result['batch_size']}: {', '.join(changes)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark prediction latency and throughput")
+    parser.add_argument('--data', default=DEFAULT_DATA_PATH, help='Replay data (CSV or columnar)')
+    parser.add_argument('--fleet-sizes', type=int, nargs='+', default=[1, 100, 1000, 10000])
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[256])
+    parser.add_argument('--repeats', type=int, default=5, help='Ticks timed per fleet/batch size')
+    parser.add_argument('--cycles', type=int, default=3, help='Timed process_all_machines cycles (0 to skip)')
+    parser.add_argument('--out', default='benchmark_results.json')
+    parser.add_argument('--baseline', help='Earlier results JSON to compare against')
+    args = parser.parse_args()
+
+    data = read_frame(args.data)
+    models = load_saved_models()
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'sklearn': sklearn.__version__,
+            'model_version': getattr(models, 'version', 'unversioned'),
+            'data': args.data,
+            'repeats': args.repeats,
+            'cycles': args.cycles,
+        },
+        'stages': [],
+        'cycles': [],
+    }
+
+    for fleet_size in args.fleet_sizes:
+        for batch_size in args.batch_sizes:
+            stages = benchmark_stages(data, models, fleet_size, batch_size, args.repeats)
+            results['stages'].append({'fleet_size': fleet_size, 'batch_size': batch_size, 'stages': stages})
+            print(f"fleet {fleet_size}, batch {batch_size}: "
+                  + ', '.join(f"{stage} p50 {stats['p50_ms']:.2f} ms" for stage, stats in stages.items()))
+
+    if args.cycles > 0:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = os.path.join(tmp_dir, 'benchmark.sqlite')
+            create_sqlite_standin(db_path, 1, len(data))
+            # Per-machine log lines would dominate the measurement
+            logging.disable(logging.INFO)
+            api = load_api(args.data, db_path)
+            try:
+                for fleet_size in args.fleet_sizes:
+                    for batch_size in args.batch_sizes:
+                        stats = benchmark_cycles(api, db_path, fleet_size, batch_size, args.cycles, len(data))
+                        results['cycles'].append({'fleet_size': fleet_size, 'chunk_size': batch_size,
+                                                  'workers': api.ML_WORKERS, 'cycle': stats})
+                        print(f"cycle, fleet {fleet_size}, chunk {batch_size}: p50 {stats['p50_ms']:.1f} ms, "
+                              f"{stats['rows_per_sec']:.0f} machines/s")
+            finally:
+                api.scheduler.shutdown()
+                logging.disable(logging.NOTSET)
+
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {args.out}")
+
+    if args.baseline:
+        print_comparison(results, args.baseline)
+
+
+if __name__ == '__main__':
+    main()
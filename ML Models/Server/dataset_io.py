@@ -0,0 +1,236 @@
+import argparse
+import json
+import os
+import re
+import uuid
+import numpy as np
+import pandas as pd
+
+# Name of the schema file inside a columnar dataset directory
+SCHEMA_FILE = 'schema.json'
+
+# Column files of a columnar dataset: NNN.npy, or NNN-<generation>.npy
+COLUMN_FILE = re.compile(r'\d{3}(-[0-9a-f]+)?\.npy')
+
+# Columns parsed as timestamps when converting from CSV
+TIMESTAMP_COLUMNS = ['timestamp']
+
+
+def is_columnar_dataset(path):
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, SCHEMA_FILE))
+
+
+# Convert a DataFrame to a directory with one .npy file per column
+def write_columnar(df, out_dir):
+    """
+    Layout: <out_dir>/schema.json plus one <out_dir>/NNN-<generation>.npy per column, in column order
+    1. Numeric columns keep their dtype
+    2. Datetimes are stored as datetime64[ns]
+    3. Text columns are stored as int32 category codes, with the categories in the schema
+    Every file can then be memory-mapped and read without parsing.
+    Rewriting a dataset never touches the files it already has: the new columns get fresh
+    names, the schema is swapped in atomically, and only then are the old columns removed,
+    so a reader sees either the old dataset or the new one (and open memory maps stay valid).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    generation = uuid.uuid4().hex[:12]
+    columns = []
+    for i, name in enumerate(df.columns):
+        series = df[name]
+        file_name = f'{i:03d}-{generation}.npy'
+        if pd.api.types.is_datetime64_any_dtype(series):
+            values = series.to_numpy(dtype='datetime64[ns]')
+            column = {'name': name, 'kind': 'datetime'}
+        elif pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+            values = series.to_numpy()
+            column = {'name': name, 'kind': 'numeric'}
+        else:
+            categorical = pd.Categorical(series)
+            values = categorical.codes.astype(np.int32)
+            column = {'name': name, 'kind': 'category', 'categories': [str(c) for c in categorical.categories]}
+        np.save(os.path.join(out_dir, file_name), values)
+        column.update({'file': file_name, 'dtype': str(values.dtype)})
+        columns.append(column)
+
+    # Write the schema last so a half-written directory is never picked up as a dataset
+    schema = {'n_rows': len(df), 'columns': columns}
+    tmp_path = os.path.join(out_dir, f'{SCHEMA_FILE}.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(schema, f, indent=2)
+    os.replace(tmp_path, os.path.join(out_dir, SCHEMA_FILE))
+
+    # Columns of earlier writes (or of a write that died part way) are no longer referenced
+    current = {column['file'] for column in columns}
+    for file_name in os.listdir(out_dir):
+        if COLUMN_FILE.fullmatch(file_name) and file_name not in current:
+            os.remove(os.path.join(out_dir, file_name))
+    return out_dir
+
+
+def read_schema(path):
+    with open(os.path.join(path, SCHEMA_FILE)) as f:
+        return json.load(f)
+
+
+# Load (a projection of) a columnar dataset as {column: array}
+def load_columns(path, columns=None, mmap=True):
+    """
+    With mmap=True, numeric and datetime columns are read-only memory maps;
+    nothing is read from disk until it is used. Category columns are decoded
+    to object arrays.
+    """
+    schema = read_schema(path)
+    by_name = {column['name']: column for column in schema['columns']}
+    if columns is None:
+        columns = [column['name'] for column in schema['columns']]
+    missing = [name for name in columns if name not in by_name]
+    if missing:
+        raise KeyError(f"Columns not in dataset {path}: {missing}")
+
+    arrays = {}
+    for name in columns:
+        column = by_name[name]
+        values = np.load(os.path.join(path, column['file']), mmap_mode='r' if mmap else None)
+        if column['kind'] == 'category':
+            codes = np.asarray(values)
+            categories = np.array(column['categories'] + [None], dtype=object)
+            # Missing values have code -1, which picks the trailing None
+            values = categories[codes]
+        arrays[name] = values
+    return arrays
+
+
+# Read a dataset from CSV, Parquet, Feather or a columnar directory, optionally projected to some columns
+def read_frame(path, columns=None, mmap=True):
+    if is_columnar_dataset(path):
+        return pd.DataFrame(load_columns(path, columns, mmap=mmap), copy=False)
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path, columns=columns)
+    if path.endswith('.feather'):
+        return pd.read_feather(path, columns=columns)
+    parse_dates = [c for c in TIMESTAMP_COLUMNS if columns is None or c in columns]
+    return pd.read_csv(path, usecols=columns, parse_dates=parse_dates)
+
+
+# Write a DataFrame in the format implied by the path (.csv, .parquet, .feather, or a directory)
+def write_frame(df, path):
+    if path.endswith('.csv'):
+        df.to_csv(path, index=False)
+    elif path.endswith('.parquet'):
+        df.to_parquet(path, index=False)
+    elif path.endswith('.feather'):
+        df.reset_index(drop=True).to_feather(path)
+    else:
+        write_columnar(df, path)
+    return path
+
+
+# Convert a CSV file once: timestamps are parsed and types inferred a single time
+def convert_csv(csv_path, out_path):
+    return write_frame(read_frame(csv_path), out_path)
+
+
+# Columns to read for a feature matrix: time features come from the timestamp
+def _source_columns(feature_columns):
+    time_features = {'hour', 'day_of_week'}
+    needed = [c for c in feature_columns if c not in time_features]
+    if time_features & set(feature_columns):
+        needed.append('timestamp')
+    return needed
+
+
+def _fill_feature_matrix(df, feature_columns, dtype):
+    X = np.empty((len(df), len(feature_columns)), dtype=dtype)
+    for i, name in enumerate(feature_columns):
+        if name == 'hour':
+            X[:, i] = pd.DatetimeIndex(df['timestamp']).hour
+        elif name == 'day_of_week':
+            X[:, i] = pd.DatetimeIndex(df['timestamp']).dayofweek
+        else:
+            X[:, i] = df[name]
+    return X
+
+
+# Load the model feature matrix, deriving time features from the timestamp when needed
+def load_feature_matrix(path, feature_columns, dtype=np.float64):
+    df = read_frame(path, columns=_source_columns(feature_columns))
+    return _fill_feature_matrix(df, feature_columns, dtype)
+
+
+# Number of data rows, without loading the dataset when the format allows it
+def count_rows(path):
+    if is_columnar_dataset(path):
+        first = read_schema(path)['columns'][0]
+        return len(np.load(os.path.join(path, first['file']), mmap_mode='r'))
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).metadata.num_rows
+    if path.endswith('.feather'):
+        return len(read_frame(path))
+    # CSV: count line breaks in binary blocks, minus the header
+    n_lines, last = 0, b'\n'
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            n_lines += block.count(b'\n')
+            last = block[-1:]
+    return n_lines + (last != b'\n') - 1
+
+
+# Yield the feature matrix in blocks of at most chunk_rows rows, so memory doesn't grow with the dataset
+def iter_feature_chunks(path, feature_columns, chunk_rows=65536, dtype=np.float64):
+    """
+    1. Columnar directories are memory-mapped and sliced
+    2. CSV files are parsed chunk_rows lines at a time
+    3. Parquet and Feather files are read whole, then sliced
+    """
+    columns = _source_columns(feature_columns)
+    if is_columnar_dataset(path):
+        arrays = load_columns(path, columns, mmap=True)
+        n_rows = len(next(iter(arrays.values())))
+        for start in range(0, n_rows, chunk_rows):
+            df = pd.DataFrame({name: values[start:start + chunk_rows] for name, values in arrays.items()}, copy=False)
+            yield _fill_feature_matrix(df, feature_columns, dtype)
+    elif path.endswith('.parquet') or path.endswith('.feather'):
+        df = read_frame(path, columns=columns)
+        for start in range(0, len(df), chunk_rows):
+            yield _fill_feature_matrix(df.iloc[start:start + chunk_rows], feature_columns, dtype)
+    else:
+        parse_dates = [c for c in TIMESTAMP_COLUMNS if c in columns]
+        for df in pd.read_csv(path, usecols=columns, parse_dates=parse_dates, chunksize=chunk_rows):
+            yield _fill_feature_matrix(df, feature_columns, dtype)
+
+
+# Write transform(X) for the dataset's feature matrix to a .npy file, one chunk at a time
+def write_transformed_matrix(path, feature_columns, transform, out_path, chunk_rows=65536, dtype=np.float32):
+    """
+    The output is created at its full size up front and filled chunk by chunk, so only
+    one chunk is in memory; open it with np.load(out_path, mmap_mode='r').
+    """
+    n_rows = count_rows(path)
+    tmp_path = out_path + '.tmp.npy'
+    out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype, shape=(n_rows, len(feature_columns)))
+    position = 0
+    for X in iter_feature_chunks(path, feature_columns, chunk_rows):
+        out[position:position + len(X)] = transform(X)
+        position += len(X)
+    out.flush()
+    del out
+    if position != n_rows:
+        os.remove(tmp_path)
+        raise ValueError(f"Expected {n_rows} rows in {path}, read {position}")
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert CSV datasets to a typed columnar format")
+    parser.add_argument('csv_path')
+    parser.add_argument('out_path', help='A directory (one .npy per column), or a .parquet/.feather file')
+    args = parser.parse_args()
+
+    convert_csv(args.csv_path, args.out_path)
+    print(f"Converted {args.csv_path} to {args.out_path}")
+
+
+if __name__ == '__main__':
+    main()
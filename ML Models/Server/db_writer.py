@@ -0,0 +1,228 @@
+import logging
+import sqlite3
+import threading
+import pandas as pd
+
+from metrics import PREDICTIONS_DROPPED
+
+logger = logging.getLogger(__name__)
+
+# Columns written to the machine table, in insert order
+MACHINE_COLUMNS = [
+    'id', 'timestamp', 'anomaly_score', 'predicted_anomaly', 'predicted_anomaly_type',
+    'predicted_health_score', 'predicted_days_to_maintenance',
+    'motor_temp_C', 'power_consumption_W', 'cutting_force_N'
+]
+
+
+# Build the machine-table row for one prediction
+def prediction_record(machine_id, test_df, results):
+    timestamp_value = test_df.get('timestamp', pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S'))
+    # Select important features to store alongside predictions
+    return (
+        machine_id,
+        timestamp_value,
+        float(results['anomaly_score']),
+        int(results['predicted_anomaly']),
+        results['predicted_anomaly_type'],
+        float(results['predicted_health_score']),
+        float(results['predicted_days_to_maintenance']),
+        float(test_df.get('motor_temp_C', 60)),
+        float(test_df.get('power_consumption_W', 5000)),
+        float(test_df.get('cutting_force_N', 200)),
+    )
+
+
+class SQLiteConnectionPool:
+    # Stand-in for psycopg2's pool API, backed by a SQLite file, for local runs and tests
+
+    def __init__(self, path):
+        self.path = path
+
+    def getconn(self):
+        return sqlite3.connect(self.path, check_same_thread=False)
+
+    def putconn(self, conn):
+        conn.close()
+
+    def closeall(self):
+        pass
+
+
+# Create a psycopg2 connection pool (or a SQLite stand-in for sqlite:/// URLs)
+def create_connection_pool(database_url, min_connections=1, max_connections=10):
+    if database_url.startswith('sqlite:///'):
+        return SQLiteConnectionPool(database_url[len('sqlite:///'):])
+    from psycopg2.pool import ThreadedConnectionPool
+    return ThreadedConnectionPool(min_connections, max_connections, database_url)
+
+
+# Read every machine's current replay pointer as a list of {'id', 'row_idx'} dicts
+def fetch_pointers(pool):
+    conn = pool.getconn()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT id, row_idx FROM factory')
+        rows = cursor.fetchall()
+        cursor.close()
+        # End the read transaction before the connection goes back to the pool
+        conn.rollback()
+    finally:
+        pool.putconn(conn)
+    return [{'id': machine_id, 'row_idx': row_idx} for machine_id, row_idx in rows]
+
+
+# Latest prediction written for one machine, as a dict, or None
+def fetch_latest_prediction(pool, machine_id):
+    conn = pool.getconn()
+    try:
+        cursor = conn.cursor()
+        placeholder = '?' if isinstance(conn, sqlite3.Connection) else '%s'
+        cursor.execute(f'''
+            SELECT {', '.join(MACHINE_COLUMNS)} FROM machine
+            WHERE id = {placeholder}
+            ORDER BY timestamp DESC
+            LIMIT 1
+        ''', (machine_id,))
+        row = cursor.fetchone()
+        cursor.close()
+        conn.rollback()
+    finally:
+        pool.putconn(conn)
+    return None if row is None else dict(zip(MACHINE_COLUMNS, row))
+
+
+class PredictionWriter:
+    """
+    Accumulates a cycle's predictions and writes them in one transaction:
+    1. A single multi-row INSERT into machine
+    2. A single UPDATE ... FROM (VALUES ...) advancing every factory.row_idx pointer
+    If the transaction fails, the records go back into the buffer and are retried by the
+    next flush; until then apply_pending() keeps their machines from being scored again.
+    A batch that fails again is written row by row, so one bad row cannot hold back the rest.
+    A row is dropped (and counted in ml_predictions_dropped) after max_attempts failed
+    writes, or when the buffer grows past max_pending.
+    """
+
+    def __init__(self, pool, page_size=1000, max_attempts=3, max_pending=100000):
+        self.pool = pool
+        self.page_size = page_size
+        self.max_attempts = max_attempts
+        self.max_pending = max_pending
+        # Buffered writes as (record, next_row_idx or None, failed attempts so far)
+        self._pending = []
+        self._lock = threading.Lock()
+        # Held from taking the records until they are committed, so flushes from several
+        # threads commit in the order their records were added
+        self._flush_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, record, next_row_idx=None):
+        # next_row_idx=None leaves the machine's pointer untouched
+        with self._lock:
+            self._pending.append((record, next_row_idx, 0))
+
+    def apply_pending(self, pointers):
+        # Pointers fetched from the database, advanced past any buffered (unwritten) predictions
+        with self._lock:
+            pending = {record[0]: next_row_idx for record, next_row_idx, _ in self._pending
+                       if next_row_idx is not None}
+        return [{**pointer, 'row_idx': pending[pointer['id']]} if pointer['id'] in pending else pointer
+                for pointer in pointers]
+
+    def flush(self):
+        # Write everything accumulated so far; returns the number of predictions written
+        with self._flush_lock:
+            with self._lock:
+                entries, self._pending = self._pending, []
+            if not entries:
+                return 0
+            if all(attempts == 0 for _, _, attempts in entries):
+                try:
+                    self._write_entries(entries)
+                    return len(entries)
+                except Exception:
+                    # Put the records back ahead of anything added meanwhile, to be retried in order
+                    self._requeue([(record, next_row_idx, 1) for record, next_row_idx, _ in entries])
+                    raise
+            return self._write_rows(entries)
+
+    def _write_entries(self, entries):
+        # One transaction; a retried flush can hold two pointers for one machine, the later one wins
+        latest = {record[0]: next_row_idx for record, next_row_idx, _ in entries if next_row_idx is not None}
+        self._write([record for record, _, _ in entries],
+                    [(next_row_idx, machine_id) for machine_id, next_row_idx in latest.items()])
+
+    def _write_rows(self, entries):
+        # Write each row in its own transaction, keeping every machine's rows in order: after
+        # a machine's row fails, its later rows wait too, so its pointer never moves backwards
+        written, failed, blocked = 0, [], set()
+        for record, next_row_idx, attempts in entries:
+            if record[0] in blocked:
+                failed.append((record, next_row_idx, attempts))
+                continue
+            try:
+                self._write_entries([(record, next_row_idx, attempts)])
+                written += 1
+            except Exception as e:
+                if attempts + 1 >= self.max_attempts:
+                    self._drop(1, f"prediction for machine {record[0]} failed {attempts + 1} writes: {e}")
+                    continue
+                failed.append((record, next_row_idx, attempts + 1))
+                blocked.add(record[0])
+        self._requeue(failed)
+        return written
+
+    def _requeue(self, entries):
+        with self._lock:
+            self._pending = entries + self._pending
+            overflow = len(self._pending) - self.max_pending
+            if overflow > 0:
+                # Oldest first; they are the ones least worth writing late
+                del self._pending[:overflow]
+        if overflow > 0:
+            self._drop(overflow, f"write buffer is over {self.max_pending} predictions")
+
+    def _drop(self, count, reason):
+        PREDICTIONS_DROPPED.inc(count)
+        logger.error(f"Dropped {count} prediction(s): {reason}")
+
+    def _write(self, records, pointers):
+        conn = self.pool.getconn()
+        try:
+            if isinstance(conn, sqlite3.Connection):
+                self._write_sqlite(conn, records, pointers)
+            else:
+                self._write_postgres(conn, records, pointers)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.pool.putconn(conn)
+
+    def _write_postgres(self, conn, records, pointers):
+        from psycopg2.extras import execute_values
+        cursor = conn.cursor()
+        columns = ', '.join(MACHINE_COLUMNS)
+        if records:
+            execute_values(cursor, f'INSERT INTO machine ({columns}) VALUES %s',
+                           records, page_size=self.page_size)
+        if pointers:
+            execute_values(cursor, '''
+                UPDATE factory
+                SET row_idx = v.row_idx
+                FROM (VALUES %s) AS v(row_idx, id)
+                WHERE factory.id = v.id
+            ''', pointers, page_size=self.page_size)
+        cursor.close()
+
+    def _write_sqlite(self, conn, records, pointers):
+        columns = ', '.join(MACHINE_COLUMNS)
+        placeholders = ', '.join(['?'] * len(MACHINE_COLUMNS))
+        # SQLite cannot bind pandas timestamps, store them as text
+        records = [(r[0], str(r[1])) + tuple(r[2:]) for r in records]
+        conn.executemany(f'INSERT INTO machine ({columns}) VALUES ({placeholders})', records)
+        conn.executemany('UPDATE factory SET row_idx = ? WHERE id = ?', pointers)
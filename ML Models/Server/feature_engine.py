@@ -0,0 +1,157 @@
+import math
+import threading
+import numpy as np
+import pandas as pd
+
+
+class RollingStats:
+    """
+    Mean and sample standard deviation over the last `window` values, updated in O(1).
+    Matches pandas .rolling(window, min_periods=1).mean() / .std():
+    1. The mean is defined from the first value
+    2. The standard deviation (ddof=1) is NaN until two values have been seen
+    3. Once the window is full, the oldest value is swapped out with a sliding Welford update
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self._values = np.empty(window)
+        self._pos = 0
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def update(self, x):
+        x = float(x)
+        if self.count < self.window:
+            # Standard Welford step while the window is still filling
+            self.count += 1
+            delta = x - self.mean
+            self.mean += delta / self.count
+            self._m2 += delta * (x - self.mean)
+        else:
+            # Replace the oldest value: both moments move by the difference
+            old = self._values[self._pos]
+            old_mean = self.mean
+            self.mean += (x - old) / self.window
+            self._m2 += (x - old) * (x - self.mean + old - old_mean)
+        self._values[self._pos] = x
+        self._pos = (self._pos + 1) % self.window
+        return self
+
+    @property
+    def std(self):
+        if self.count < 2:
+            return math.nan
+        return math.sqrt(max(self._m2, 0.0) / (self.count - 1))
+
+
+class MachineFeatureState:
+    # Running state needed to derive the engineered features for one machine
+
+    def __init__(self):
+        self.vibration = RollingStats(24)
+        self.motor_temp = RollingStats(24)
+        self.spindle_current = RollingStats(12)
+        self.last_motor_temp = None
+        self.last_tool_usage = None
+
+
+class OnlineFeatureEngine:
+    """
+    Computes the engineered features from raw readings as they arrive, one machine at a time.
+    Definitions match data_generation.py:
+    - vibration_trend / motor_temp_trend: 24-sample rolling mean
+    - vibration_std_24h: 24-sample rolling std, current_stability: 12-sample rolling std
+    - temp_rate_change / tool_wear_rate: first difference, 0 for the first reading
+    - power_efficiency: rpm / power_consumption_W * 1000
+    - hour / day_of_week: from the timestamp, when present
+    """
+
+    ENGINEERED_FEATURES = [
+        'vibration_trend', 'motor_temp_trend', 'power_efficiency', 'tool_wear_rate',
+        'vibration_std_24h', 'temp_rate_change', 'current_stability'
+    ]
+    # Raw readings the engineered features are computed from
+    RAW_FEATURES = ['vibration_rms', 'motor_temp_C', 'spindle_current_A', 'tool_usage_min',
+                    'rpm', 'power_consumption_W']
+
+    @staticmethod
+    def check_machine_id(machine_id):
+        # Machine IDs key the per-machine state, so they must be plain scalars
+        if isinstance(machine_id, bool) or not isinstance(machine_id, (int, str)):
+            raise ValueError(f"machine_id must be an integer or a string, got {machine_id!r}")
+        return machine_id
+
+    @classmethod
+    def raw_values(cls, reading):
+        # The raw values as floats, or ValueError if one is missing, not finite, or would divide by zero
+        values = {}
+        for name in cls.RAW_FEATURES:
+            value = reading.get(name)
+            if value is None:
+                raise ValueError(f"Missing raw feature {name}")
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+                raise ValueError(f"Feature {name} must be a finite number")
+            values[name] = float(value)
+        if values['power_consumption_W'] == 0:
+            raise ValueError("power_consumption_W must be non-zero")
+        return values
+
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._states)
+
+    def reset(self, machine_id=None):
+        with self._lock:
+            if machine_id is None:
+                self._states.clear()
+            else:
+                self._states.pop(machine_id, None)
+
+    def update(self, machine_id, reading):
+        # Fold one raw reading into the machine's state and return it with the engineered features added
+        # Everything that can fail (ValueError) runs first, so a bad reading leaves the state untouched
+        self.check_machine_id(machine_id)
+        values = self.raw_values(reading)
+        features = dict(reading)
+        features['power_efficiency'] = values['rpm'] / values['power_consumption_W'] * 1000
+        if reading.get('timestamp') is not None:
+            try:
+                timestamp = pd.Timestamp(reading['timestamp'])
+            except (ValueError, TypeError, OverflowError):
+                timestamp = pd.NaT
+            if timestamp is pd.NaT:
+                raise ValueError(f"Invalid timestamp: {reading['timestamp']!r}")
+            features['hour'] = timestamp.hour
+            features['day_of_week'] = timestamp.dayofweek
+
+        with self._lock:
+            state = self._states.get(machine_id)
+            if state is None:
+                state = self._states[machine_id] = MachineFeatureState()
+
+            vibration = state.vibration.update(values['vibration_rms'])
+            motor_temp = state.motor_temp.update(values['motor_temp_C'])
+            spindle_current = state.spindle_current.update(values['spindle_current_A'])
+
+            features['vibration_trend'] = vibration.mean
+            features['motor_temp_trend'] = motor_temp.mean
+            features['vibration_std_24h'] = vibration.std
+            features['current_stability'] = spindle_current.std
+
+            temp = values['motor_temp_C']
+            tool_usage = values['tool_usage_min']
+            features['temp_rate_change'] = 0.0 if state.last_motor_temp is None else temp - state.last_motor_temp
+            features['tool_wear_rate'] = 0.0 if state.last_tool_usage is None else tool_usage - state.last_tool_usage
+            state.last_motor_temp = temp
+            state.last_tool_usage = tool_usage
+
+        return features
+
+    def update_many(self, machine_ids, readings):
+        # Readings are applied in order, so repeated machine IDs see each other's updates
+        return [self.update(machine_id, reading) for machine_id, reading in zip(machine_ids, readings)]
@@ -0,0 +1,149 @@
+import copy
+import math
+import numpy as np
+import pandas as pd
+
+
+class FeatureSchema:
+    """
+    The model input columns, defined once and shared by training and serving:
+    1. Names, dtypes, positions and defaults (used when a reading lacks a feature)
+    2. A name -> position map built once, so records are written straight into a float32 row
+    3. Time features (hour, day_of_week) are derived from the timestamp when one is present
+    4. validate() checks a fitted model against the schema once, at load time, and returns
+       the model to score with (a copy when it had to be changed)
+    """
+
+    TIME_FEATURES = {
+        'hour': lambda timestamps: timestamps.hour,
+        'day_of_week': lambda timestamps: timestamps.dayofweek,
+    }
+
+    def __init__(self, features, dtype=np.float32):
+        # features: list of (name, dtype, default) in model input order
+        self.features = list(features)
+        self.names = [name for name, _, _ in self.features]
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.dtype = dtype
+        self.defaults = np.array([default for _, _, default in self.features], dtype=dtype)
+        self.defaults.setflags(write=False)
+        self.time_positions = {name: self.index[name] for name in self.TIME_FEATURES if name in self.index}
+
+    def __len__(self):
+        return len(self.names)
+
+    def empty(self, n_rows):
+        # Preallocated matrix with every feature at its default
+        return np.tile(self.defaults, (n_rows, 1))
+
+    def row_from_record(self, record, out=None):
+        # Write one reading (dict or Series) into a float32 row; unknown keys are ignored
+        row = self.defaults.copy() if out is None else out
+        if out is not None:
+            row[:] = self.defaults
+        index = self.index
+        for name, value in record.items():
+            position = index.get(name)
+            if position is not None and value is not None:
+                row[position] = value
+        timestamp = record.get('timestamp')
+        if timestamp is not None and self.time_positions:
+            timestamp = pd.Timestamp(timestamp)
+            for name, position in self.time_positions.items():
+                row[position] = self.TIME_FEATURES[name](timestamp)
+        return row
+
+    def check_values(self, record):
+        # Raise ValueError unless every feature the record carries is a finite number and its
+        # timestamp (if any) parses; None counts as absent
+        for name in self.names:
+            value = record.get(name)
+            if value is None:
+                continue
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+                raise ValueError(f"Feature {name} must be a finite number")
+        timestamp = record.get('timestamp')
+        if timestamp is not None:
+            try:
+                parsed = pd.Timestamp(timestamp)
+            except (ValueError, TypeError, OverflowError):
+                parsed = pd.NaT
+            if parsed is pd.NaT:
+                raise ValueError(f"Invalid timestamp: {timestamp!r}")
+        return record
+
+    def fill_defaults(self, record, names):
+        # Replace missing or NaN values of the given features with their defaults, in place
+        for name in names:
+            value = record.get(name)
+            if value is None or value != value:
+                record[name] = float(self.defaults[self.index[name]])
+        return record
+
+    def matrix_from_records(self, records):
+        X = self.empty(len(records))
+        for i, record in enumerate(records):
+            self.row_from_record(record, out=X[i])
+        return X
+
+    def matrix_from_frame(self, df):
+        # Fill a preallocated matrix column by column; missing features keep their default
+        if isinstance(df, pd.Series):
+            df = df.to_frame().T
+        X = self.empty(len(df))
+        for name, position in self.index.items():
+            if name in df.columns:
+                X[:, position] = df[name].to_numpy(dtype=self.dtype, na_value=np.nan)
+        if 'timestamp' in df.columns and self.time_positions:
+            timestamps = pd.DatetimeIndex(pd.to_datetime(df['timestamp']))
+            for name, position in self.time_positions.items():
+                X[:, position] = self.TIME_FEATURES[name](timestamps)
+        return X
+
+    def validate(self, model, name):
+        # Raise if a fitted model was trained on different features than the schema
+        fitted_names = getattr(model, 'feature_names_in_', None)
+        if fitted_names is not None:
+            fitted_names = list(fitted_names)
+            if fitted_names != self.names:
+                missing = [feature for feature in self.names if feature not in fitted_names]
+                extra = [feature for feature in fitted_names if feature not in self.names]
+                raise ValueError(f"{name} was fitted on different features than the schema "
+                                 f"(missing: {missing}, extra: {extra}, or a different order)")
+            # The order is known to match, so skip sklearn's column name check on every call.
+            # A shallow copy: the caller's estimator keeps its names, the fitted arrays are shared
+            model = copy.copy(model)
+            del model.feature_names_in_
+            return model
+
+        n_features = getattr(model, 'n_features_in_', None)
+        if n_features is None and getattr(model, 'input_shape', None) is not None:
+            n_features = model.input_shape[-1]
+        if n_features is not None and n_features != len(self):
+            raise ValueError(f"{name} expects {n_features} features, the schema has {len(self)}")
+        return model
+
+
+# Feature columns used in training, in model input order; every matrix is built as float32
+FEATURE_SCHEMA = FeatureSchema([
+    ('vibration_rms', 'float32', 0.0),
+    ('motor_temp_C', 'float32', 0.0),
+    ('spindle_current_A', 'float32', 0.0),
+    ('rpm', 'float32', 0.0),
+    ('tool_usage_min', 'float32', 0.0),
+    ('coolant_temp_C', 'float32', 0.0),
+    ('cutting_force_N', 'float32', 0.0),
+    ('power_consumption_W', 'float32', 0.0),
+    ('acoustic_level_dB', 'float32', 0.0),
+    ('machine_hours_today', 'float32', 0.0),
+    ('total_machine_hours', 'float32', 0.0),
+    ('vibration_trend', 'float32', 0.0),
+    ('motor_temp_trend', 'float32', 0.0),
+    ('power_efficiency', 'float32', 0.0),
+    ('tool_wear_rate', 'float32', 0.0),
+    ('vibration_std_24h', 'float32', 0.0),
+    ('temp_rate_change', 'float32', 0.0),
+    ('current_stability', 'float32', 0.0),
+    ('hour', 'float32', 0.0),
+    ('day_of_week', 'float32', 0.0),
+])
@@ -1,14 +1,32 @@
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify, request
 import pandas as pd
-import psycopg2
-from psycopg2.extras import RealDictCursor
 import joblib
 import time
 import logging
+import threading
+import itertools
+import contextvars
+import math
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.events import EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED
 import os
 from dotenv import load_dotenv
-from helper_functions import load_saved_models, create_sequences, prepare_test_data, make_predictions
+from helper_functions import load_saved_models, make_fleet_predictions, MODEL_BUNDLE_PATH
+from replay_store import get_replay_store
+from machine_history import MachineHistory
+from db_writer import (PredictionWriter, create_connection_pool, fetch_latest_prediction,
+                       fetch_pointers, prediction_record)
+from feature_engine import OnlineFeatureEngine
+from feature_schema import FEATURE_SCHEMA
+from ingestion import IngestionPipeline, StreamScorer, create_source
+from micro_batcher import MicroBatcher
+from model_manager import ModelManager, bundle_version
+from tracing import get_tracer, trace_context
+from metrics import (render as render_metrics, CYCLE_SECONDS, DB_SECONDS, DROPPED_TICKS,
+                     MACHINES_FAILED, MACHINES_PROCESSED, MODEL_LOAD_SECONDS, PREDICT_BATCH_ROWS,
+                     PREDICT_SECONDS, STAGE_SECONDS)
 
 # Load environment variables
 load_dotenv()
@@ -19,122 +37,336 @@ app = Flask(__name__)
 logging.basicConfig(level=logging.INFO,
                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
+# Per-machine events go through the tracer, so they can be level-gated and sampled (TRACE_LEVEL, TRACE_SAMPLE_RATE)
+tracer = get_tracer(__name__)
 
 # Define scheduler at module level so it can be accessed in the shutdown code
 scheduler = BackgroundScheduler()
 
-# Load the ML models
+# Load the ML models; the service cannot do anything without them, so fail at startup
 try:
+    load_start = time.perf_counter()
     models = load_saved_models()
+    MODEL_LOAD_SECONDS.labels('all').set(time.perf_counter() - load_start)
     logger.info("ML models loaded successfully")
 except Exception as e:
     logger.error(f"Error loading models: {e}")
+    raise
 
-# Path to the CSV file containing features
-CSV_FILE_PATH = './static/cnc_machine_static_data.csv'
+# Replay data: a CSV file, or a columnar dataset directory converted with dataset_io.py
+CSV_FILE_PATH = os.getenv("REPLAY_DATA_PATH", './static/cnc_machine_static_data.csv')
 
 # PostgreSQL connection string
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-# Database connection function
-def get_db_connection():
-    conn = psycopg2.connect(DATABASE_URL)
-    return conn
+# Processing cycle settings: interval, worker threads, and machines scored per chunk
+PROCESS_INTERVAL_SECONDS = float(os.getenv("PROCESS_INTERVAL_SECONDS", "6"))
+ML_WORKERS = int(os.getenv("ML_WORKERS", "1"))
+ML_CHUNK_SIZE = int(os.getenv("ML_CHUNK_SIZE", "256"))
 
-# Function to process a single machine unit
-def process_machine_unit(machine_id, row_idx):
+# Thread pool for scoring chunks concurrently (NumPy releases the GIL for the heavy math)
+executor = ThreadPoolExecutor(max_workers=ML_WORKERS, thread_name_prefix='ml-worker') if ML_WORKERS > 1 else None
+
+# Guards against overlapping cycles, plus per-cycle statistics reported on /status
+cycle_lock = threading.Lock()
+stats_lock = threading.Lock()
+cycle_stats = {
+    'cycles': 0,
+    'last_cycle_seconds': None,
+    'last_processed': 0,
+    'last_machines': 0,
+    'queue_depth': 0,
+    'dropped_ticks': 0,
+}
+
+# Optional file to persist per-machine LSTM history across restarts
+HISTORY_PATH = os.getenv("HISTORY_PATH")
+
+# Last 48 scaled readings per machine, fed to the LSTM as its input sequence
+machine_history = MachineHistory()
+if HISTORY_PATH and os.path.exists(HISTORY_PATH):
     try:
-        # Read the CSV file
-        df = pd.read_csv(CSV_FILE_PATH)
-        # df = df[feature_columns]
-
-        # Check if the row_idx is valid
-        if row_idx >= len(df):
-            logger.warning(f"Row index {row_idx} out of bounds for machine {machine_id}")
-            return False
-        
-        # Extract features for the specific row
-        test_df = df.iloc[row_idx]
-        results = make_predictions(test_df, models)
+        machine_history.load(HISTORY_PATH, version=bundle_version(models))
+        logger.info(f"Loaded history for {len(machine_history)} machines from {HISTORY_PATH}")
+    except Exception as e:
+        logger.error(f"Error loading machine history: {e}")
+
+# Connection pool and batched prediction writer, created on first use
+db_pool = None
+prediction_writer = None
+
+def get_db_pool():
+    global db_pool, prediction_writer
+    if db_pool is None:
+        db_pool = create_connection_pool(DATABASE_URL)
+        prediction_writer = PredictionWriter(db_pool)
+    return db_pool
+
+def get_prediction_writer():
+    get_db_pool()
+    return prediction_writer
+
+# Seconds between checks for a rewritten model bundle (0 disables file-watch reloads)
+MODEL_WATCH_SECONDS = float(os.getenv("MODEL_WATCH_SECONDS", "0"))
+# Replay rows scored by a new bundle before it replaces the live one
+CANARY_ROWS = int(os.getenv("CANARY_ROWS", "32"))
+
+# A few complete replay rows, one per pseudo-machine
+def canary_batch():
+    store = get_replay_store(CSV_FILE_PATH)
+    batch_df = store.rows(range(min(len(store), CANARY_ROWS * 4))).dropna().head(CANARY_ROWS)
+    return batch_df.reset_index(drop=True)
+
+# Live models; reloads swap model_manager.current without a restart
+model_manager = ModelManager(models, load_saved_models, MODEL_BUNDLE_PATH,
+                             canary=canary_batch, score=make_fleet_predictions)
+
+# Replay lookups and database round trips, timed for /metrics
+REPLAY_TIMER = STAGE_SECONDS.labels('replay')
+DB_FETCH_TIMER = DB_SECONDS.labels('fetch_pointers')
+DB_WRITE_TIMER = DB_SECONDS.labels('write')
+
+# POST /predict: concurrent requests are scored together in micro-batches
+PREDICT_MAX_BATCH = int(os.getenv("PREDICT_MAX_BATCH", "256"))
+PREDICT_MAX_WAIT_MS = float(os.getenv("PREDICT_MAX_WAIT_MS", "5"))
+PREDICT_TIMEOUT_SECONDS = float(os.getenv("PREDICT_TIMEOUT_SECONDS", "10"))
+PREDICTION_FIELDS = ['anomaly_score', 'predicted_anomaly', 'predicted_anomaly_type',
+                     'predicted_health_score', 'predicted_days_to_maintenance']
+
+# Live readings keep their own engineered-feature state and LSTM windows, apart from the replay
+live_features = OnlineFeatureEngine()
+live_history = MachineHistory()
+
+# Validate one posted reading and fill in engineered features when only raw values were sent
+def prepare_record(record):
+    if not isinstance(record, dict):
+        raise ValueError("Each record must be a JSON object")
+    # Check values before they reach the live feature state or the shared micro-batch,
+    # so a bad reading is rejected here rather than failing the requests batched with it
+    FEATURE_SCHEMA.check_values(record)
+    machine_id = record.get('machine_id')
+    if machine_id is not None:
+        OnlineFeatureEngine.check_machine_id(machine_id)
+    # A null value counts as missing
+    derivable = set(FEATURE_SCHEMA.time_positions) if record.get('timestamp') is not None else set()
+    missing = [name for name in FEATURE_SCHEMA.names if record.get(name) is None and name not in derivable]
+    if missing and machine_id is not None and set(missing) <= set(OnlineFeatureEngine.ENGINEERED_FEATURES):
+        # Raw readings from a known machine: engineered features come from its running state;
+        # update() raises ValueError (e.g. zero power) before changing that state
+        record = live_features.update(machine_id, record)
+        # A rolling std is undefined for the first reading; use the schema default so the
+        # NaN doesn't sit in the machine's LSTM window for the next time_steps readings
+        FEATURE_SCHEMA.fill_defaults(record, OnlineFeatureEngine.ENGINEERED_FEATURES)
+        missing = []
+    if missing:
+        raise ValueError(f"Missing features: {missing}")
+    return record
+
+def prediction_json(machine_id, values):
+    prediction = {} if machine_id is None else {'machine_id': machine_id}
+    for field, value in zip(PREDICTION_FIELDS, values):
+        if isinstance(value, str):
+            prediction[field] = value
+        else:
+            value = value.item() if hasattr(value, 'item') else value
+            prediction[field] = value if math.isfinite(value) else None
+    return prediction
+
+# Runs on the micro-batcher thread: one models reference and one scoring pass per batch
+def score_prediction_batch(records):
+    models = model_manager.current
+    # Built before live_history is touched: if it fails, MicroBatcher rescores each request alone
+    X = FEATURE_SCHEMA.matrix_from_records(records)
+    machine_ids = [record.get('machine_id') for record in records]
+    predictions = [None] * len(records)
+    # Records with a machine ID use (and extend) that machine's window; the rest repeat their reading
+    with_history = [i for i, machine_id in enumerate(machine_ids) if machine_id is not None]
+    without_history = [i for i, machine_id in enumerate(machine_ids) if machine_id is None]
+    for rows, history in ((with_history, live_history), (without_history, None)):
+        if not rows:
+            continue
+        index = [machine_ids[i] for i in rows] if history is not None else None
+        results_df = make_fleet_predictions(X[rows], models, history=history, index=index)
+        for i, values in zip(rows, results_df[PREDICTION_FIELDS].itertuples(index=False)):
+            predictions[i] = prediction_json(machine_ids[i], values)
+    return predictions
+
+predict_batcher = MicroBatcher(score_prediction_batch, max_batch_size=PREDICT_MAX_BATCH,
+                               max_wait_ms=PREDICT_MAX_WAIT_MS,
+                               on_batch=lambda n_requests, n_items, seconds: PREDICT_BATCH_ROWS.observe(n_items))
+
+# Streaming ingestion: with INGEST_SOURCE set (see ingestion.create_source), readings from a
+# message source replace the CSV replay; they extend machine_history like replayed rows do
+INGEST_SOURCE = os.getenv("INGEST_SOURCE")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+INGEST_MAX_BATCH = int(os.getenv("INGEST_MAX_BATCH", "256"))
+INGEST_MAX_WAIT_MS = float(os.getenv("INGEST_MAX_WAIT_MS", "50"))
+INGEST_MAX_QUEUE = int(os.getenv("INGEST_MAX_QUEUE", "10000"))
+ingestion_pipeline = None
+
+def create_ingestion_pipeline(source):
+    scorer = StreamScorer(lambda: model_manager.current, get_prediction_writer(), machine_history)
+    return IngestionPipeline(source, scorer, workers=INGEST_WORKERS, max_queue=INGEST_MAX_QUEUE,
+                             max_batch=INGEST_MAX_BATCH, max_wait_ms=INGEST_MAX_WAIT_MS)
+
+def save_machine_history():
+    try:
+        machine_history.save(HISTORY_PATH)
+    except Exception as e:
+        logger.error(f"Error saving machine history: {e}")
+
+# Cycle IDs attached to every trace event emitted during a cycle
+cycle_ids = itertools.count(1)
+
+# Per-machine outcome, as a sampled trace event rather than an unconditional log line
+def trace_machine_processed(machine_id, row_idx, results):
+    if tracer.info_enabled:
+        with trace_context(machine_id=machine_id):
+            tracer.info('machine_processed', row_idx=row_idx, is_anomaly=int(results['predicted_anomaly']))
+
+# Score one slice of the fleet and queue its predictions for writing; returns how many were queued
+def process_machine_chunk(store, chunk, models):
+    machine_ids = [pointer['id'] for pointer in chunk]
+    row_indices = [pointer['row_idx'] for pointer in chunk]
     
-        # Store predictions in the database
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        timestamp_value = test_df.get('timestamp', pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S'))
-        # Select important features to store alongside predictions
-        important_features = {
-            'id': machine_id,
-            'timestamp': timestamp_value,
-            'anomaly_score': results['anomaly_score'],
-            'predicted_anomaly': results['predicted_anomaly'],
-            'predicted_anomaly_type': results['predicted_anomaly_type'], 
-            'predicted_health_score': results['predicted_health_score'],
-            'predicted_days_to_maintenance': results['predicted_days_to_maintenance'],
-            'motor_temp_C': test_df.get('motor_temp_C', 60),
-            'power_consumption_W': test_df.get('power_consumption_W', 5000),
-            'cutting_force_N': test_df.get('cutting_force_N', 200),
-        }
-        
-        # Prepare SQL INSERT dynamically
-        columns = ', '.join(important_features.keys())
-        placeholders = ', '.join(['%s'] * len(important_features))
-        values = list(important_features.values())
-
-        # Build query
-        query = f'''
-            INSERT INTO machine ({columns})
-            VALUES ({placeholders})
-        '''
-
-        # Execute
-        cursor.execute(query, values)
-                
-        # Update the row index in the 'Pointers' table
-        cursor.execute('''
-            UPDATE factory 
-            SET row_idx = %s 
-            WHERE id = %s
-        ''', ((row_idx + 1) % 10000, machine_id))
-        
-        conn.commit()
-        conn.close()
-        
-        # Fixed is_anomaly reference by using the predicted_anomaly from results
-        logger.info(f"Processed machine_id: {machine_id}, row_idx: {row_idx}, is_anomaly: {results['predicted_anomaly']}")
-        return True
+    # Build one feature matrix for the chunk and score it in a single pass
+    with REPLAY_TIMER.time():
+        batch_df = store.rows(row_indices)
+    batch_df.index = machine_ids
+    results_df = make_fleet_predictions(batch_df, models, history=machine_history)
     
-    except Exception as e:
-        logger.error(f"Error processing machine {machine_id}: {e}")
-        return False
+    writer = get_prediction_writer()
+    queued = 0
+    for machine_id, row_idx in zip(machine_ids, row_indices):
+        try:
+            results = results_df.loc[machine_id]
+            writer.add(prediction_record(machine_id, batch_df.loc[machine_id], results), (row_idx + 1) % 10000)
+            queued += 1
+            trace_machine_processed(machine_id, row_idx, results)
+        except Exception as e:
+            logger.error(f"Error processing machine {machine_id}: {e}")
+    return queued
 
 # Function to process all machine units
 def process_all_machines():
+    # Never let two cycles overlap (a slow scheduled cycle vs. the next tick or /trigger)
+    if not cycle_lock.acquire(blocking=False):
+        with stats_lock:
+            cycle_stats['dropped_ticks'] += 1
+        DROPPED_TICKS.inc()
+        logger.warning("Previous processing cycle still running, skipping this one")
+        return 0
+    try:
+        with trace_context(cycle_id=next(cycle_ids)):
+            return run_processing_cycle()
+    finally:
+        cycle_lock.release()
+
+def run_processing_cycle():
     logger.info("Starting processing cycle for all machines")
-    conn = get_db_connection()
-    # Use RealDictCursor to get dictionary-like results
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    
+    cycle_start = time.perf_counter()
     # Get all machine IDs and their current row indices
-    cursor.execute('SELECT id, row_idx FROM factory')
-    pointers = cursor.fetchall()
-    conn.close()
+    with DB_FETCH_TIMER.time():
+        pointers = fetch_pointers(get_db_pool())
+    # Machines whose last predictions failed to write are already past those rows
+    pointers = get_prediction_writer().apply_pending(pointers)
     
-    processed_count = 0
+    store = get_replay_store(CSV_FILE_PATH)
+    n_rows = len(store)
+    # Take the models reference once: a reload during this cycle only affects the next one
+    models = model_manager.current
+    
+    # Skip machines whose pointer is past the end of the replay data
+    valid = []
     for pointer in pointers:
-        machine_id = pointer['id']
-        row_idx = pointer['row_idx']
-        success = process_machine_unit(machine_id, row_idx)
-        if success:
-            processed_count += 1
+        if pointer['row_idx'] >= n_rows:
+            logger.warning(f"Row index {pointer['row_idx']} out of bounds for machine {pointer['id']}")
+        else:
+            valid.append(pointer)
+    
+    # Split the fleet into chunks; with ML_WORKERS > 1 they are scored concurrently
+    chunks = [valid[i:i + ML_CHUNK_SIZE] for i in range(0, len(valid), ML_CHUNK_SIZE)]
+    with stats_lock:
+        cycle_stats['queue_depth'] = len(chunks)
+    
+    # Predictions this cycle queued; the writer's buffer may also hold retries and streamed readings
+    scored_count = 0
+    if executor is None:
+        futures = []
+        for chunk in chunks:
+            try:
+                scored_count += process_machine_chunk(store, chunk, models)
+            except Exception as e:
+                logger.error(f"Error running batch predictions: {e}")
+            with stats_lock:
+                cycle_stats['queue_depth'] -= 1
+    else:
+        # Each task runs in a copy of this context, so its trace events carry the cycle ID
+        futures = [executor.submit(contextvars.copy_context().run, process_machine_chunk, store, chunk, models)
+                   for chunk in chunks]
+    for future in as_completed(futures):
+        try:
+            scored_count += future.result()
+        except Exception as e:
+            logger.error(f"Error running batch predictions: {e}")
+        with stats_lock:
+            cycle_stats['queue_depth'] -= 1
     
-    logger.info(f"Completed processing cycle. Processed {processed_count}/{len(pointers)} machines.")
+    # Write the whole cycle in one transaction
+    processed_count = 0
+    try:
+        with DB_WRITE_TIMER.time():
+            get_prediction_writer().flush()
+        processed_count = scored_count
+    except Exception as e:
+        logger.error(f"Error writing predictions: {e}")
+    
+    if HISTORY_PATH and valid:
+        try:
+            machine_history.save(HISTORY_PATH)
+        except Exception as e:
+            logger.error(f"Error saving machine history: {e}")
+    
+    cycle_seconds = time.perf_counter() - cycle_start
+    CYCLE_SECONDS.observe(cycle_seconds)
+    # Both counts come from this cycle's own records, never from what the writer had buffered
+    MACHINES_PROCESSED.inc(processed_count)
+    MACHINES_FAILED.inc(len(pointers) - processed_count)
+    with stats_lock:
+        cycle_stats['cycles'] += 1
+        cycle_stats['last_cycle_seconds'] = cycle_seconds
+        cycle_stats['last_processed'] = processed_count
+        cycle_stats['last_machines'] = len(pointers)
+    
+    logger.info(f"Completed processing cycle. Processed {processed_count}/{len(pointers)} machines in {cycle_seconds:.2f}s.")
     return processed_count
 
+# Count scheduler ticks that were skipped because the previous cycle was still running
+def on_skipped_tick(event):
+    with stats_lock:
+        cycle_stats['dropped_ticks'] += 1
+    DROPPED_TICKS.inc()
+    logger.warning("Skipped a scheduled processing cycle (previous cycle still running)")
+
 # Schedule the processing function to run periodically
 def initialize():
-    global scheduler
-    # Run the processing function every 5 minutes (adjust as needed)
-    scheduler.add_job(func=process_all_machines, trigger="interval", minutes=0.1)
+    global scheduler, ingestion_pipeline
+    if INGEST_SOURCE:
+        # Readings are scored as they arrive; only the history snapshot runs on a timer
+        ingestion_pipeline = create_ingestion_pipeline(create_source(INGEST_SOURCE)).start()
+        logger.info(f"Streaming ingestion started from {INGEST_SOURCE}")
+        if HISTORY_PATH:
+            scheduler.add_job(func=save_machine_history, trigger="interval", seconds=PROCESS_INTERVAL_SECONDS,
+                              max_instances=1, coalesce=True)
+    else:
+        # One instance at a time; missed ticks are coalesced into a single run instead of piling up
+        scheduler.add_job(func=process_all_machines, trigger="interval", seconds=PROCESS_INTERVAL_SECONDS,
+                          max_instances=1, coalesce=True)
+        scheduler.add_listener(on_skipped_tick, EVENT_JOB_MAX_INSTANCES | EVENT_JOB_MISSED)
+    if MODEL_WATCH_SECONDS > 0:
+        # Reloads run in this job's own thread, never inside a processing cycle
+        scheduler.add_job(func=model_manager.check_for_update, trigger="interval", seconds=MODEL_WATCH_SECONDS,
+                          max_instances=1, coalesce=True)
     scheduler.start()
     logger.info("Scheduler started")
 
@@ -146,11 +378,22 @@ with app.app_context():
 # API endpoints
 @app.route('/status', methods=['GET'])
 def get_status():
+    with stats_lock:
+        stats = dict(cycle_stats)
     return jsonify({
         'status': 'running',
-        'message': 'ML prediction service is active'
+        'message': 'ML prediction service is active',
+        'workers': ML_WORKERS,
+        'cycle': stats,
+        'models': dict(model_manager.status),
+        'ingestion': ingestion_pipeline.describe() if ingestion_pipeline is not None else None
     })
 
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    # Prometheus text format; rendering only reads the current counter and bucket values
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/trigger', methods=['GET'])
 def trigger_processing():
     machines_processed = process_all_machines()
@@ -159,23 +402,48 @@ def trigger_processing():
         'machines_processed': machines_processed
     })
 
-@app.route('/machine/<machine_id>', methods=['GET'])
+@app.route('/admin/reload', methods=['POST'])
+def reload_models():
+    # Load the bundle at MODEL_BUNDLE_PATH in the background; progress is reported on /status
+    if not model_manager.reload_async():
+        return jsonify({'status': 'error', 'message': 'A reload is already in progress'}), 409
+    return jsonify({
+        'status': 'accepted',
+        'current_version': model_manager.status['version']
+    }), 202
+
+@app.route('/predict', methods=['POST'])
+def predict():
+    # One reading (object) or several (array), each with the FEATURE_SCHEMA fields;
+    # with a machine_id, raw readings are enough and the engineered features are derived
+    with PREDICT_SECONDS.time():
+        payload = request.get_json(silent=True)
+        records = payload if isinstance(payload, list) else [payload]
+        if payload is None or not records:
+            return jsonify({'error': 'Expected a JSON object or a non-empty array of objects'}), 400
+        try:
+            records = [prepare_record(record) for record in records]
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        try:
+            predictions = predict_batcher.submit(records).result(timeout=PREDICT_TIMEOUT_SECONDS)
+        except FutureTimeoutError:
+            return jsonify({'error': 'Prediction timed out'}), 503
+        except Exception as e:
+            logger.error(f"Error running predictions: {e}")
+            return jsonify({'error': 'Prediction failed'}), 500
+        
+        return jsonify(predictions if isinstance(payload, list) else predictions[0])
+
+@app.route('/machine/<int:machine_id>', methods=['GET'])
 def get_machine_predictions(machine_id):
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    
     # Get the latest prediction for the specified machine
-    cursor.execute('''
-        SELECT * FROM predictions 
-        WHERE machine_id = %s 
-        ORDER BY timestamp DESC 
-        LIMIT 1
-    ''', (machine_id,))
-    
-    prediction = cursor.fetchone()
-    conn.close()
+    with DB_SECONDS.labels('fetch_prediction').time():
+        prediction = fetch_latest_prediction(get_db_pool(), machine_id)
     
     if prediction:
+        prediction['timestamp'] = str(prediction['timestamp'])
         return jsonify(dict(prediction))
     else:
         return jsonify({'error': 'No predictions found for this machine'}), 404
@@ -186,4 +454,6 @@ if __name__ == '__main__':
         app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=False)
     except (KeyboardInterrupt, SystemExit):
         # Shut down the scheduler gracefully
-        scheduler.shutdown()
\ No newline at end of file
+        scheduler.shutdown()
+        if ingestion_pipeline is not None:
+            ingestion_pipeline.stop()
\ No newline at end of file
@@ -1,37 +1,90 @@
 import pandas as pd
 import numpy as np
+import os
 import joblib
-import tensorflow as tf
-from tensorflow.keras.models import load_model
 from sklearn.preprocessing import StandardScaler
+from lstm_runtime import NumpyLSTMModel
+from tree_runtime import compile_forest
+from sequences import sliding_windows, repeated_window, predict_windows
+from feature_schema import FEATURE_SCHEMA
+from model_bundle import COMPONENT_SOURCES, MANIFEST_FILE, open_model_bundle
+from model_manager import bundle_version
+from metrics import STAGE_SECONDS
+from tracing import get_tracer
+
+# Structured events for this module (see tracing.py); stage events are debug-level
+tracer = get_tracer(__name__)
+
+# Feature columns used in training, in model input order (see feature_schema.py)
+FEATURE_COLUMNS = FEATURE_SCHEMA.names
+
+# Per-stage latency histograms (see metrics.py), looked up once here rather than on every call
+FEATURES_TIMER = STAGE_SECONDS.labels('features')
+SCALING_TIMER = STAGE_SECONDS.labels('scaling')
+ISO_FOREST_TIMER = STAGE_SECONDS.labels('iso_forest')
+TYPE_CLASSIFIER_TIMER = STAGE_SECONDS.labels('type_classifier')
+HEALTH_REGRESSOR_TIMER = STAGE_SECONDS.labels('health_regressor')
+LSTM_TIMER = STAGE_SECONDS.labels('lstm')
+
+# Versioned model bundle built with model_bundle.py; loose files in ./static/ are the fallback
+MODEL_BUNDLE_PATH = os.getenv('MODEL_BUNDLE_PATH', './static/model_bundle')
 
 # Load models and scalers
-def load_saved_models():
-    print("Loading saved models...")
+def load_saved_models(bundle_path=None):
+    bundle_path = bundle_path or MODEL_BUNDLE_PATH
+    if os.path.exists(os.path.join(bundle_path, MANIFEST_FILE)):
+        # Every component is loaded (memory-mapped) now rather than on first use: build_bundle
+        # replaces the files in place, so a component first opened mid-cycle could belong to a
+        # newer build and fail its checksum against this manifest
+        models = open_model_bundle(bundle_path, preload=True)
+        tracer.info('models_opened', source='bundle', path=bundle_path, version=models.version)
+        return models
+    
+    tracer.info('models_loading', source='static')
     
+    # Fail up front, naming every missing file, instead of on the first one
+    missing = [source for name, source in COMPONENT_SOURCES.items()
+               if not os.path.exists(os.path.join('./static', source))
+               and not (name == 'maintenance_predictor' and os.path.exists('./static/maintenance_predictor_lstm.h5'))]
+    if missing:
+        raise FileNotFoundError(f"No model bundle at {bundle_path} and missing model files in ./static: {missing}")
+    
+    # Every model is checked against the feature schema once, here, instead of on every prediction
+    # Forests are compiled into packed node arrays (see tree_runtime.py) for fast small-batch scoring;
+    # large batches still go through the sklearn forest kept inside
     # Load anomaly detection model
-    iso_forest = joblib.load('./static/isolation_forest_model.pkl')
+    iso_forest = compile_forest(FEATURE_SCHEMA.validate(
+        joblib.load('./static/isolation_forest_model.pkl'), 'iso_forest'))
     
     # Load anomaly type classifier
-    anomaly_type_classifier = joblib.load('./static/anomaly_type_classifier.pkl')
+    anomaly_type_classifier = compile_forest(FEATURE_SCHEMA.validate(
+        joblib.load('./static/anomaly_type_classifier.pkl'), 'anomaly_type_classifier'))
     
     # Load health score predictor
-    health_score_predictor = joblib.load('./static/health_score_predictor.pkl')
+    health_score_predictor = compile_forest(FEATURE_SCHEMA.validate(
+        joblib.load('./static/health_score_predictor.pkl'), 'health_score_predictor'))
     
-    # Load LSTM maintenance predictor with custom_objects to handle 'mse'
-    # Define the custom objects dictionary with the correct TensorFlow function
-    custom_objects = {
-        'mse': tf.keras.losses.MeanSquaredError,  # Try the losses module instead of metrics
-        'mean_squared_error': tf.keras.losses.MeanSquaredError
-    }
-    maintenance_predictor = load_model('./static/maintenance_predictor_lstm.h5', custom_objects=custom_objects)
+    # Load LSTM maintenance predictor
+    # Prefer the NumPy export (see lstm_runtime.py), which avoids importing TensorFlow at all
+    if os.path.exists('./static/maintenance_predictor_lstm.npz'):
+        maintenance_predictor = NumpyLSTMModel.load('./static/maintenance_predictor_lstm.npz')
+    else:
+        import tensorflow as tf
+        from tensorflow.keras.models import load_model
+        # Define the custom objects dictionary with the correct TensorFlow function
+        custom_objects = {
+            'mse': tf.keras.losses.MeanSquaredError,  # Try the losses module instead of metrics
+            'mean_squared_error': tf.keras.losses.MeanSquaredError
+        }
+        maintenance_predictor = load_model('./static/maintenance_predictor_lstm.h5', custom_objects=custom_objects)
+    FEATURE_SCHEMA.validate(maintenance_predictor, 'maintenance_predictor')
     
     # Load scalers
-    scaler_anomaly = joblib.load('./static/scaler_anomaly.pkl')
-    scaler_X_maint = joblib.load('./static/scaler_X_maint.pkl')
+    scaler_anomaly = FEATURE_SCHEMA.validate(joblib.load('./static/scaler_anomaly.pkl'), 'scaler_anomaly')
+    scaler_X_maint = FEATURE_SCHEMA.validate(joblib.load('./static/scaler_X_maint.pkl'), 'scaler_X_maint')
     scaler_y_maint = joblib.load('./static/scaler_y_maint.pkl')
     
-    print("Models loaded successfully.")
+    tracer.info('models_loaded', source='static')
     
     return {
         'iso_forest': iso_forest,
@@ -59,25 +112,8 @@ def prepare_test_data(df):
         df['day_of_month'] = df['timestamp'].dt.day
         df['month'] = df['timestamp'].dt.month
     
-    # Define the same feature columns used in training
-    feature_columns = [
-        'vibration_rms', 'motor_temp_C', 'spindle_current_A', 'rpm', 
-        'tool_usage_min', 'coolant_temp_C', 'cutting_force_N', 
-        'power_consumption_W', 'acoustic_level_dB', 'machine_hours_today',
-        'total_machine_hours', 'vibration_trend', 'motor_temp_trend',
-        'power_efficiency', 'tool_wear_rate', 'vibration_std_24h',
-        'temp_rate_change', 'current_stability', 'hour', 'day_of_week'
-    ]
-    
-    # Check if all features are available in the test data
-    missing_features = [feat for feat in feature_columns if feat not in df.columns]
-    if missing_features:
-        print(f"Warning: Missing features in test data: {missing_features}")
-        print("These features will be initialized with zeros.")
-        for feat in missing_features:
-            df[feat] = 0
-    
-    return df, feature_columns
+    # Missing features are not added here: FEATURE_SCHEMA.matrix_from_frame fills them with their defaults
+    return df, FEATURE_COLUMNS
 
 # Function to create sequences for LSTM (same as in training)
 def create_sequences(X, time_steps=48):
@@ -87,121 +123,141 @@ def create_sequences(X, time_steps=48):
         
     # For single sample predictions, handle differently
     if len(X.shape) == 1 or (len(X.shape) == 2 and X.shape[0] == 1):
-        # If we have a single sample, replicate it to create a sequence
-        sample = X.reshape(1, -1) if len(X.shape) == 1 else X
-        repeated = np.tile(sample, (time_steps, 1))
-        return np.array([repeated])
-    
-    # Normal sequence creation for multiple samples
-    Xs = []
-    for i in range(len(X) - time_steps + 1):
-        Xs.append(X[i:(i + time_steps)])
-    return np.array(Xs)
+        # If we have a single sample, repeat it to create a sequence (a view, no copy)
+        return repeated_window(X, time_steps)
+    
+    # Normal sequence creation for multiple samples (a read-only view, no copy)
+    return sliding_windows(X, time_steps)
 
-# Main prediction function
-def make_predictions(test_df, models):
-    # Prepare test data
-    df, feature_columns = prepare_test_data(test_df)
+# Run the anomaly, anomaly type and health models over a feature matrix (in FEATURE_SCHEMA order)
+def score_static_models(X, models):
+    # Scale data using the same scaler used in training
+    with SCALING_TIMER.time():
+        X_anomaly_scaled = models['scaler_anomaly'].transform(X)
+        # Fill missing values with the column mean, without a round trip through pandas
+        column_means = np.nanmean(X_anomaly_scaled, axis=0)
+        X_anomaly_scaled = np.where(np.isnan(X_anomaly_scaled), column_means, X_anomaly_scaled)
     
-    # Make a copy of the DataFrame to add predictions
-    results_df = df.copy()
+    # Predict anomalies: predict() is just decision_function() < 0, so don't score twice
+    with ISO_FOREST_TIMER.time():
+        anomaly_scores = models['iso_forest'].decision_function(X_anomaly_scaled)
+    predicted_anomalies = (anomaly_scores < 0).astype(int)
     
-    # 1. Anomaly Detection
-    print("Running anomaly detection...")
-    X_anomaly = df[feature_columns].copy()
+    # Classify anomaly types, only for the rows predicted as anomalies
+    predicted_types = np.full(len(predicted_anomalies), 'normal', dtype=object)
+    anomaly_mask = predicted_anomalies == 1
+    if anomaly_mask.any():
+        with TYPE_CLASSIFIER_TIMER.time():
+            predicted_types[anomaly_mask] = models['anomaly_type_classifier'].predict(X[anomaly_mask])
     
-    # Scale data using the same scaler used in training
-    X_anomaly_scaled = models['scaler_anomaly'].transform(X_anomaly)
-    X_anomaly_scaled = pd.DataFrame(X_anomaly_scaled)
-    X_anomaly_scaled = X_anomaly_scaled.fillna(X_anomaly_scaled.mean())
-    X_anomaly_scaled = X_anomaly_scaled.values
-    
-    # Predict anomalies
-    anomaly_scores = models['iso_forest'].decision_function(X_anomaly_scaled)
-    predicted_anomalies = (models['iso_forest'].predict(X_anomaly_scaled) == -1).astype(int)
-    
-    # Convert to float for single row case
-    if isinstance(anomaly_scores, np.ndarray) and len(anomaly_scores) == 1:
-        anomaly_scores = float(anomaly_scores[0])
-        predicted_anomalies = int(predicted_anomalies[0])
-    
-    # 2. Anomaly Type Classification (only for predicted anomalies)
-    print("Classifying anomaly types...")
-    if isinstance(predicted_anomalies, int):
-        # Handle single row case
-        if predicted_anomalies == 1:
-            X_type = df[feature_columns]
-            predicted_type = models['anomaly_type_classifier'].predict(X_type)[0]
-        else:
-            predicted_type = 'normal'
-    else:
-        # Handle multiple rows
-        anomaly_rows = results_df[results_df['predicted_anomaly'] == 1]
-        if not anomaly_rows.empty:
-            X_type = anomaly_rows[feature_columns]
-            predicted_types = models['anomaly_type_classifier'].predict(X_type)
-            anomaly_types = pd.Series(index=anomaly_rows.index, data=predicted_types)
-            results_df['predicted_anomaly_type'] = None
-            results_df.loc[anomaly_rows.index, 'predicted_anomaly_type'] = anomaly_types
-        else:
-            results_df['predicted_anomaly_type'] = 'normal'
+    # Predict health scores
+    with HEALTH_REGRESSOR_TIMER.time():
+        predicted_health_scores = models['health_score_predictor'].predict(X)
+    
+    return anomaly_scores, predicted_anomalies, predicted_types, predicted_health_scores
+
+# Main prediction function
+def make_predictions(test_df, models, time_steps=48, default_days_to_maintenance=30):
+    """
+    Score a single reading (Series or 1-row DataFrame) or a history of readings.
+    1. A single reading returns a dictionary with the four predictions
+    2. Multiple rows (DataFrame or ndarray in feature order) are treated as consecutive
+       readings and returned as a DataFrame with the four predictions as aligned columns
+    """
+    # A bare feature matrix is interpreted in the training column order
+    if isinstance(test_df, np.ndarray):
+        test_df = pd.DataFrame(np.atleast_2d(test_df), columns=FEATURE_COLUMNS)
     
-    # 3. Health Score Prediction
-    print("Predicting machine health scores...")
-    X_health = df[feature_columns]
-    predicted_health_scores = models['health_score_predictor'].predict(X_health)
+    # Prepare test data
+    with FEATURES_TIMER.time():
+        df, feature_columns = prepare_test_data(test_df)
+        X = FEATURE_SCHEMA.matrix_from_frame(df)
+    single_row = isinstance(test_df, pd.Series) or len(df) == 1
     
-    if isinstance(predicted_health_scores, np.ndarray) and len(predicted_health_scores) == 1:
-        predicted_health_score = float(predicted_health_scores[0])
-    else:
-        results_df['predicted_health_score'] = predicted_health_scores
+    # 1-3. Anomaly detection, anomaly type classification and health score prediction
+    if tracer.debug_enabled:
+        tracer.debug('scoring_static_models', rows=len(X))
+    anomaly_scores, predicted_anomalies, predicted_types, predicted_health_scores = score_static_models(X, models)
     
     # 4. Maintenance Prediction (LSTM)
-    print("Predicting days to maintenance...")
-    X_maint = df[feature_columns].copy()
+    if tracer.debug_enabled:
+        tracer.debug('predicting_days_to_maintenance', rows=len(X), time_steps=time_steps)
+    with SCALING_TIMER.time():
+        X_maint_scaled = models['scaler_X_maint'].transform(X)
+    predicted_days = np.full(len(X_maint_scaled), float(default_days_to_maintenance))
     
-    # Scale the data
-    X_maint_scaled = models['scaler_X_maint'].transform(X_maint)
-    
-    # For single sample, we need special handling
-    if len(X_maint_scaled) == 1:
+    if single_row:
         # Create a sequence by repeating the single sample
-        X_seq = create_sequences(X_maint_scaled, time_steps=48)
-        y_pred_maint_scaled = models['maintenance_predictor'].predict(X_seq)
-        y_pred_maint = models['scaler_y_maint'].inverse_transform(y_pred_maint_scaled)
-        predicted_days_to_maintenance = float(y_pred_maint[0][0])
-    else:
-        # Create sequences for LSTM
-        time_steps = 48  # Same as in training
-        
-        # Check if we have enough data for sequences
-        if len(X_maint_scaled) >= time_steps:
-            X_seq = create_sequences(X_maint_scaled, time_steps)
-            
-            # Predict using LSTM
+        with LSTM_TIMER.time():
+            X_seq = create_sequences(X_maint_scaled, time_steps=time_steps)
             y_pred_maint_scaled = models['maintenance_predictor'].predict(X_seq)
-            
-            # Inverse transform to get actual values
-            y_pred_maint = models['scaler_y_maint'].inverse_transform(y_pred_maint_scaled)
-            
-            # Add predictions to results (aligned properly with sequence offset)
-            results_df['predicted_days_to_maintenance'] = 30
-            for i in range(len(y_pred_maint)):
-                idx = i + time_steps - 1
-                if idx < len(results_df):
-                    results_df.iloc[idx, results_df.columns.get_loc('predicted_days_to_maintenance')] = y_pred_maint[i][0]
-        else:
-            print(f"Warning: Not enough data for maintenance prediction. Need at least {time_steps} rows.")
-            results_df['predicted_days_to_maintenance'] = 30
+            predicted_days[:] = models['scaler_y_maint'].inverse_transform(y_pred_maint_scaled)[:, 0]
+    elif len(X_maint_scaled) >= time_steps:
+        # Feed the windows to the LSTM in fixed-size batches
+        with LSTM_TIMER.time():
+            y_pred_maint_scaled = predict_windows(models['maintenance_predictor'], X_maint_scaled, time_steps)
+            # Sequence i ends at row i + time_steps - 1; earlier rows keep the default
+            predicted_days[time_steps - 1:] = models['scaler_y_maint'].inverse_transform(y_pred_maint_scaled)[:, 0]
+    else:
+        tracer.warning('insufficient_history', rows=len(X_maint_scaled), required=time_steps)
     
     # For single row prediction, return a dictionary instead of DataFrame
-    if isinstance(test_df, pd.Series) or len(df) == 1:
+    if single_row:
         return {
-            'anomaly_score': anomaly_scores,
-            'predicted_anomaly': predicted_anomalies,
-            'predicted_anomaly_type': predicted_type if predicted_anomalies == 1 else 'normal',
-            'predicted_health_score': predicted_health_score,
-            'predicted_days_to_maintenance': predicted_days_to_maintenance if 'predicted_days_to_maintenance' in locals() else 30
+            'anomaly_score': float(anomaly_scores[0]),
+            'predicted_anomaly': int(predicted_anomalies[0]),
+            'predicted_anomaly_type': predicted_types[0],
+            'predicted_health_score': float(predicted_health_scores[0]),
+            'predicted_days_to_maintenance': float(predicted_days[0])
         }
+    
+    # Shallow copy: the new columns don't touch the caller's frame and no data is duplicated
+    results_df = df.copy(deep=False)
+    results_df['anomaly_score'] = anomaly_scores
+    results_df['predicted_anomaly'] = predicted_anomalies
+    results_df['predicted_anomaly_type'] = predicted_types
+    results_df['predicted_health_score'] = predicted_health_scores
+    results_df['predicted_days_to_maintenance'] = predicted_days
+    return results_df
+
+# Batch prediction across a fleet: one row per machine, each model runs once
+def make_fleet_predictions(test_df, models, time_steps=48, history=None, index=None):
+    # Unlike make_predictions on a multi-row DataFrame, rows here are
+    # independent machines, not consecutive readings of a single machine.
+    # With a MachineHistory, the frame must be indexed by machine ID and each
+    # machine's LSTM input is its own recent readings
+    # A matrix already in FEATURE_SCHEMA order (e.g. from matrix_from_records) is used as is,
+    # with `index` giving its machine IDs
+    if isinstance(test_df, np.ndarray):
+        X = test_df
+        index = pd.RangeIndex(len(X)) if index is None else pd.Index(index)
     else:
-        return results_df
\ No newline at end of file
+        # The frame goes straight into a float32 matrix: no timestamp columns added, no column-selection copy
+        df = test_df.to_frame().T if isinstance(test_df, pd.Series) else test_df
+        with FEATURES_TIMER.time():
+            X = FEATURE_SCHEMA.matrix_from_frame(df)
+        index = df.index
+    results_df = pd.DataFrame(index=index)
+    
+    # 1-3. Anomaly detection, anomaly type classification and health score prediction
+    (results_df['anomaly_score'], results_df['predicted_anomaly'],
+     results_df['predicted_anomaly_type'], results_df['predicted_health_score']) = score_static_models(X, models)
+    
+    # 4. Maintenance Prediction (LSTM)
+    # Every machine contributes one sequence, all predicted in one call
+    with SCALING_TIMER.time():
+        X_maint_scaled = models['scaler_X_maint'].transform(X)
+    with LSTM_TIMER.time():
+        if history is not None:
+            X_seq = history.append_many(index, X_maint_scaled, version=bundle_version(models))
+        else:
+            # Without history, each machine's sample is repeated
+            X_seq = np.broadcast_to(X_maint_scaled[:, np.newaxis, :],
+                                    (len(X_maint_scaled), time_steps, X_maint_scaled.shape[1]))
+        y_pred_maint_scaled = models['maintenance_predictor'].predict(X_seq)
+        y_pred_maint = models['scaler_y_maint'].inverse_transform(y_pred_maint_scaled)
+    results_df['predicted_days_to_maintenance'] = y_pred_maint[:, 0]
+    
+    if tracer.debug_enabled:
+        tracer.debug('fleet_scored', rows=len(X), anomalies=int(results_df['predicted_anomaly'].sum()))
+    return results_df
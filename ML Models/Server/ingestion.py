@@ -0,0 +1,374 @@
+import json
+import logging
+import os
+import queue
+import socketserver
+import threading
+import time
+import pandas as pd
+from db_writer import prediction_record
+from feature_engine import OnlineFeatureEngine
+from feature_schema import FEATURE_SCHEMA
+from helper_functions import make_fleet_predictions
+from metrics import INGEST_QUEUE_DEPTH, INGEST_READINGS
+
+logger = logging.getLogger(__name__)
+
+# Raw sensor values every streamed reading must carry; the engineered features are derived
+# from them and hour/day_of_week from the timestamp
+REQUIRED_FIELDS = [name for name in FEATURE_SCHEMA.names
+                   if name not in OnlineFeatureEngine.ENGINEERED_FEATURES and name not in FEATURE_SCHEMA.time_positions]
+
+
+# Decode one message (JSON text/bytes or a dict) into a reading, or raise ValueError
+def parse_reading(message):
+    if isinstance(message, (bytes, bytearray)):
+        message = message.decode('utf-8')
+    if isinstance(message, str):
+        try:
+            message = json.loads(message)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON: {e}")
+    if not isinstance(message, dict):
+        raise ValueError("A reading must be a JSON object")
+    if message.get('machine_id') is None:
+        raise ValueError("A reading must have a machine_id")
+    OnlineFeatureEngine.check_machine_id(message['machine_id'])
+    missing = [name for name in REQUIRED_FIELDS if message.get(name) is None]
+    if missing:
+        raise ValueError(f"Reading for machine {message['machine_id']} is missing {missing}")
+    # Bad values are rejected here, one reading at a time, rather than failing a whole batch
+    FEATURE_SCHEMA.check_values(message)
+    OnlineFeatureEngine.raw_values(message)
+    if message.get('timestamp') is None:
+        # Stamp readings on arrival so the stored prediction and the time features have one
+        message['timestamp'] = pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')
+    return message
+
+
+class QueueSource:
+    # In-process stand-in for a message broker: producers call put()
+
+    def __init__(self, maxsize=0):
+        self.queue = queue.Queue(maxsize)
+
+    def put(self, message, timeout=None):
+        self.queue.put(message, timeout=timeout)
+
+    def run(self, emit, stop):
+        while not stop.is_set():
+            try:
+                message = self.queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            emit(message)
+
+
+class FileTailSource:
+    # Follows a JSON-lines file like `tail -F`: appended lines are read as they are written,
+    # and the file is reopened from the start when it is rotated or truncated
+
+    def __init__(self, path, from_start=False, poll_interval=0.2):
+        self.path = path
+        self.from_start = from_start
+        self.poll_interval = poll_interval
+
+    def _open(self, from_start):
+        while True:
+            try:
+                f = open(self.path, 'r')
+                break
+            except FileNotFoundError:
+                time.sleep(self.poll_interval)
+        if not from_start:
+            f.seek(0, os.SEEK_END)
+        return f
+
+    def _rotated(self, f):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        return stat.st_ino != os.fstat(f.fileno()).st_ino or stat.st_size < f.tell()
+
+    def run(self, emit, stop):
+        f = self._open(self.from_start)
+        partial = ''
+        try:
+            while not stop.is_set():
+                line = f.readline()
+                if line:
+                    partial += line
+                    # Only complete lines are parsed; a half-written one waits for the rest
+                    if partial.endswith('\n'):
+                        if partial.strip():
+                            emit(partial)
+                        partial = ''
+                    continue
+                if self._rotated(f):
+                    f.close()
+                    f = self._open(from_start=True)
+                    partial = ''
+                    continue
+                stop.wait(self.poll_interval)
+        finally:
+            f.close()
+
+
+class SocketSource:
+    # TCP server reading newline-delimited JSON; each gateway keeps one connection, so its
+    # readings arrive in order, and a full pipeline stalls the connection (TCP flow control)
+
+    def __init__(self, host='0.0.0.0', port=9000):
+        self.host = host
+        self.port = port
+        self.server_address = None
+        self.ready = threading.Event()
+
+    def run(self, emit, stop):
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    if stop.is_set():
+                        break
+                    if line.strip():
+                        emit(line)
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        server = socketserver.ThreadingTCPServer((self.host, self.port), Handler)
+        server.daemon_threads = True
+        self.server_address = server.server_address
+        serve_thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.2},
+                                        name='ingest-socket', daemon=True)
+        serve_thread.start()
+        self.ready.set()
+        try:
+            stop.wait()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class MQTTSource:
+    # Subscribes to an MQTT topic (requires paho-mqtt); a blocked pipeline holds up the network loop
+
+    def __init__(self, host, port=1883, topic='cnc/readings', qos=1):
+        self.host = host
+        self.port = port
+        self.topic = topic
+        self.qos = qos
+
+    def run(self, emit, stop):
+        import paho.mqtt.client as mqtt
+        if hasattr(mqtt, 'CallbackAPIVersion'):
+            client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        else:
+            client = mqtt.Client()
+        client.on_connect = lambda client, userdata, *args: client.subscribe(self.topic, qos=self.qos)
+        client.on_message = lambda client, userdata, message: emit(message.payload)
+        client.connect(self.host, self.port)
+        client.loop_start()
+        try:
+            stop.wait()
+        finally:
+            client.loop_stop()
+            client.disconnect()
+
+
+class KafkaSource:
+    # Consumes a Kafka topic (requires kafka-python); producers should key messages by
+    # machine_id so each machine's readings stay in one partition, in order
+
+    def __init__(self, bootstrap_servers, topic, group_id='ml-ingestion'):
+        self.bootstrap_servers = bootstrap_servers
+        self.topic = topic
+        self.group_id = group_id
+
+    def run(self, emit, stop):
+        from kafka import KafkaConsumer
+        consumer = KafkaConsumer(self.topic, bootstrap_servers=self.bootstrap_servers.split(','),
+                                 group_id=self.group_id, enable_auto_commit=True)
+        try:
+            while not stop.is_set():
+                # Not polling again until every message is handed over is the backpressure
+                for messages in consumer.poll(timeout_ms=200).values():
+                    for message in messages:
+                        emit(message.value)
+        finally:
+            consumer.close()
+
+
+# Build a source from a spec string, e.g. from the INGEST_SOURCE environment variable
+def create_source(spec):
+    """
+    1. queue                          -> QueueSource (in-process, for tests and embedding)
+    2. file:<path>                    -> FileTailSource over a JSON-lines file
+    3. socket:<host>:<port>           -> SocketSource
+    4. mqtt://<host>[:<port>]/<topic> -> MQTTSource
+    5. kafka://<servers>/<topic>      -> KafkaSource (servers comma-separated)
+    """
+    if spec == 'queue':
+        return QueueSource()
+    if spec.startswith('file:'):
+        return FileTailSource(spec[len('file:'):])
+    if spec.startswith('socket:'):
+        host, _, port = spec[len('socket:'):].rpartition(':')
+        return SocketSource(host or '0.0.0.0', int(port))
+    if spec.startswith('mqtt://'):
+        address, _, topic = spec[len('mqtt://'):].partition('/')
+        host, _, port = address.partition(':')
+        return MQTTSource(host, int(port or 1883), topic or 'cnc/readings')
+    if spec.startswith('kafka://'):
+        servers, _, topic = spec[len('kafka://'):].partition('/')
+        return KafkaSource(servers, topic)
+    raise ValueError(f"Unknown ingestion source: {spec}")
+
+
+class StreamScorer:
+    """
+    Scores one micro-batch of raw readings and queues the predictions for writing:
+    1. The feature engine derives the engineered features, in reading order per machine
+    2. The models reference is taken once per batch
+    3. Each machine's LSTM window is extended by its readings, in order
+    """
+
+    def __init__(self, get_models, writer, history, feature_engine=None):
+        self.get_models = get_models
+        self.writer = writer
+        self.history = history
+        self.feature_engine = feature_engine or OnlineFeatureEngine()
+
+    def __call__(self, readings):
+        models = self.get_models()
+        machine_ids = [reading['machine_id'] for reading in readings]
+        features = self.feature_engine.update_many(machine_ids, readings)
+        for record in features:
+            # Rolling stds are undefined for a machine's first reading
+            FEATURE_SCHEMA.fill_defaults(record, OnlineFeatureEngine.ENGINEERED_FEATURES)
+        X = FEATURE_SCHEMA.matrix_from_records(features)
+        results_df = make_fleet_predictions(X, models, history=self.history, index=machine_ids)
+
+        # Positional, since a machine can appear more than once in a batch
+        for i, (machine_id, reading) in enumerate(zip(machine_ids, readings)):
+            self.writer.add(prediction_record(machine_id, reading, results_df.iloc[i]))
+        return self.writer.flush()
+
+
+class IngestionPipeline:
+    """
+    Streams readings from a source into micro-batched scoring:
+    1. The source runs on its own thread and hands each reading to a bounded queue;
+       when the queue is full the source blocks, which pushes back on the producer
+    2. Readings are sharded by machine_id across the workers, so a machine's readings
+       are always handled by one worker, in arrival order
+    3. Each worker scores up to max_batch readings at a time, waiting at most
+       max_wait_ms for a batch to fill
+    """
+
+    def __init__(self, source, handle_batch, workers=1, max_queue=10000, max_batch=256, max_wait_ms=50.0):
+        self.source = source
+        self.handle_batch = handle_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queues = [queue.Queue(max(1, max_queue // workers)) for _ in range(workers)]
+        self._stop = threading.Event()
+        self._threads = []
+        self._stats_lock = threading.Lock()
+        self.stats = {'received': 0, 'rejected': 0, 'scored': 0, 'failed': 0, 'batches': 0}
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self.stats[key] += amount
+        INGEST_READINGS.labels(key).inc(amount)
+
+    def queue_depth(self):
+        return sum(q.qsize() for q in self._queues)
+
+    def offer(self, message):
+        # Called by the source for every message; blocks while the worker's queue is full.
+        # Never raises: an exception here would end the source thread, and with it ingestion
+        try:
+            reading = parse_reading(message)
+        except ValueError as e:
+            self._count('rejected')
+            logger.warning(f"Rejected reading: {e}")
+            return False
+        except Exception as e:
+            self._count('rejected')
+            logger.error(f"Rejected unreadable message: {e}")
+            return False
+        self._count('received')
+        shard = self._queues[hash(reading['machine_id']) % len(self._queues)]
+        while not self._stop.is_set():
+            try:
+                shard.put(reading, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _collect(self, shard, first):
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                reading = shard.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if reading is None:
+                # Stop marker: finish this batch, then exit
+                shard.put(None)
+                break
+            batch.append(reading)
+        return batch
+
+    def _work(self, shard):
+        while True:
+            first = shard.get()
+            if first is None:
+                return
+            batch = self._collect(shard, first)
+            try:
+                self.handle_batch(batch)
+                self._count('scored', len(batch))
+            except Exception as e:
+                self._count('failed', len(batch))
+                logger.error(f"Error scoring ingested batch of {len(batch)} readings: {e}")
+            with self._stats_lock:
+                self.stats['batches'] += 1
+            INGEST_QUEUE_DEPTH.set(self.queue_depth())
+
+    def _run_source(self):
+        try:
+            self.source.run(self.offer, self._stop)
+        except Exception as e:
+            logger.error(f"Ingestion source stopped: {e}")
+
+    def start(self):
+        for i, shard in enumerate(self._queues):
+            thread = threading.Thread(target=self._work, args=(shard,), name=f'ingest-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        source_thread = threading.Thread(target=self._run_source, name='ingest-source', daemon=True)
+        source_thread.start()
+        self._source_thread = source_thread
+        return self
+
+    def stop(self, timeout=10.0):
+        # Stop reading, then let the workers drain what is already queued
+        self._stop.set()
+        self._source_thread.join(timeout)
+        for shard in self._queues:
+            shard.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def describe(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats['queue_depth'] = self.queue_depth()
+        stats['source'] = type(self.source).__name__
+        return stats
@@ -0,0 +1,261 @@
+import argparse
+import json
+import time
+import numpy as np
+
+
+# Activations used by the Keras layers we export
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'tanh': np.tanh,
+    'sigmoid': lambda x: 1.0 / (1.0 + np.exp(-x)),
+    # Keras 3 definition (relu6(x + 3) / 6); Keras 2 used 0.2 * x + 0.5
+    'hard_sigmoid': lambda x: np.clip(x / 6.0 + 0.5, 0.0, 1.0),
+}
+
+
+def _activation(layer, config, key):
+    # The activation's name, or ValueError if the runtime cannot compute it
+    name = config[key]
+    if name not in ACTIVATIONS:
+        raise ValueError(f"Unsupported {key} for export in layer {layer.name}: {name!r}")
+    return name
+
+
+def _lstm_spec(layer):
+    config = layer.get_config()
+    weights = layer.get_weights()
+    return {
+        'type': 'lstm',
+        'units': config['units'],
+        'activation': _activation(layer, config, 'activation'),
+        'recurrent_activation': _activation(layer, config, 'recurrent_activation'),
+        'return_sequences': config['return_sequences'],
+        'go_backwards': config.get('go_backwards', False),
+    }, {
+        'kernel': weights[0],
+        'recurrent_kernel': weights[1],
+        'bias': weights[2] if len(weights) > 2 else np.zeros(weights[0].shape[1], dtype=weights[0].dtype),
+    }
+
+
+# Save the weights and layer configuration of a Keras LSTM stack to a single .npz file
+def export_lstm_model(keras_model, path):
+    """
+    Supported layers: LSTM, Bidirectional(LSTM), Dense, and Dropout (dropped,
+    it is a no-op at inference). Anything else raises, so an unsupported
+    architecture can never be exported silently wrong.
+    """
+    layers = []
+    arrays = {}
+    for i, layer in enumerate(keras_model.layers):
+        kind = type(layer).__name__
+        if kind == 'Dropout':
+            continue
+        if kind == 'LSTM':
+            spec, weights = _lstm_spec(layer)
+            for name, value in weights.items():
+                arrays[f'layer{i}_{name}'] = value
+        elif kind == 'Bidirectional':
+            forward_spec, forward_weights = _lstm_spec(layer.forward_layer)
+            backward_spec, backward_weights = _lstm_spec(layer.backward_layer)
+            spec = {
+                'type': 'bidirectional',
+                'merge_mode': layer.merge_mode,
+                'forward': forward_spec,
+                'backward': backward_spec,
+                'return_sequences': forward_spec['return_sequences'],
+            }
+            for name, value in forward_weights.items():
+                arrays[f'layer{i}_forward_{name}'] = value
+            for name, value in backward_weights.items():
+                arrays[f'layer{i}_backward_{name}'] = value
+        elif kind == 'Dense':
+            config = layer.get_config()
+            weights = layer.get_weights()
+            spec = {'type': 'dense', 'activation': _activation(layer, config, 'activation')}
+            arrays[f'layer{i}_kernel'] = weights[0]
+            arrays[f'layer{i}_bias'] = weights[1] if len(weights) > 1 else np.zeros(weights[0].shape[1], dtype=weights[0].dtype)
+        else:
+            raise ValueError(f"Unsupported layer for export: {layer.name} ({kind})")
+        spec['index'] = i
+        layers.append(spec)
+
+    architecture = {'input_shape': list(keras_model.input_shape[1:]), 'layers': layers}
+    arrays['architecture'] = np.array(json.dumps(architecture))
+    np.savez(path, **arrays)
+    return path
+
+
+class NumpyLSTMModel:
+    """
+    NumPy-only inference for an exported LSTM stack.
+    Exposes predict(X) like the Keras model, so it can replace it in the models dict.
+    Gate order and math follow Keras: i, f, c, o with
+    c = f * c + i * act(z_c) and h = o * act(c).
+    """
+
+    def __init__(self, input_shape, layers, weights, dtype=np.float32):
+        self.input_shape = (None,) + tuple(input_shape)
+        self.layers = layers
+        self.weights = weights
+        self.dtype = dtype
+
+    @classmethod
+    def load(cls, path, dtype=np.float32):
+        with np.load(path) as data:
+            architecture = json.loads(str(data['architecture']))
+            weights = {name: data[name].astype(dtype) for name in data.files if name != 'architecture'}
+        # Files exported before export checked activations fail here rather than in predict()
+        for spec in architecture['layers']:
+            for layer_spec in (spec['forward'], spec['backward']) if spec['type'] == 'bidirectional' else (spec,):
+                for key in ('activation', 'recurrent_activation'):
+                    if key in layer_spec and layer_spec[key] not in ACTIVATIONS:
+                        raise ValueError(f"Unsupported {key} in {path}: {layer_spec[key]!r}")
+        return cls(architecture['input_shape'], architecture['layers'], weights, dtype)
+
+    def _run_lstm(self, spec, prefix, X):
+        kernel = self.weights[f'{prefix}_kernel']
+        recurrent_kernel = self.weights[f'{prefix}_recurrent_kernel']
+        bias = self.weights[f'{prefix}_bias']
+        activation = ACTIVATIONS[spec['activation']]
+        recurrent_activation = ACTIVATIONS[spec['recurrent_activation']]
+        units = spec['units']
+
+        batch_size, time_steps, _ = X.shape
+        if spec['go_backwards']:
+            X = X[:, ::-1]
+
+        # Input projections for every time step in one matrix multiply
+        z_input = X @ kernel + bias
+
+        h = np.zeros((batch_size, units), dtype=self.dtype)
+        c = np.zeros((batch_size, units), dtype=self.dtype)
+        outputs = np.empty((batch_size, time_steps, units), dtype=self.dtype) if spec['return_sequences'] else None
+        for t in range(time_steps):
+            z = z_input[:, t] + h @ recurrent_kernel
+            i = recurrent_activation(z[:, :units])
+            f = recurrent_activation(z[:, units:2 * units])
+            c = f * c + i * activation(z[:, 2 * units:3 * units])
+            h = recurrent_activation(z[:, 3 * units:]) * activation(c)
+            if outputs is not None:
+                outputs[:, t] = h
+
+        if outputs is None:
+            return h
+        # Keras returns backward sequences in their original time order
+        return outputs[:, ::-1] if spec['go_backwards'] else outputs
+
+    def predict(self, X, batch_size=None, **kwargs):
+        # Extra Keras keyword arguments (verbose, ...) are accepted and ignored
+        X = np.asarray(X, dtype=self.dtype)
+        if batch_size is None or len(X) <= batch_size:
+            return self._forward(X)
+        return np.concatenate([self._forward(X[start:start + batch_size])
+                               for start in range(0, len(X), batch_size)])
+
+    def _forward(self, X):
+        for spec in self.layers:
+            prefix = f"layer{spec['index']}"
+            if spec['type'] == 'lstm':
+                X = self._run_lstm(spec, prefix, X)
+            elif spec['type'] == 'bidirectional':
+                forward = self._run_lstm(spec['forward'], f'{prefix}_forward', X)
+                backward = self._run_lstm(spec['backward'], f'{prefix}_backward', X)
+                merge_mode = spec['merge_mode']
+                if merge_mode == 'concat':
+                    X = np.concatenate([forward, backward], axis=-1)
+                elif merge_mode == 'sum':
+                    X = forward + backward
+                elif merge_mode == 'mul':
+                    X = forward * backward
+                elif merge_mode == 'ave':
+                    X = (forward + backward) / 2
+                else:
+                    raise ValueError(f"Unsupported merge mode: {merge_mode}")
+            else:
+                X = ACTIVATIONS[spec['activation']](X @ self.weights[f'{prefix}_kernel'] + self.weights[f'{prefix}_bias'])
+        return X
+
+
+def _load_keras_model(h5_path):
+    import tensorflow as tf
+    from tensorflow.keras.models import load_model
+    custom_objects = {
+        'mse': tf.keras.losses.MeanSquaredError,
+        'mean_squared_error': tf.keras.losses.MeanSquaredError
+    }
+    return load_model(h5_path, custom_objects=custom_objects)
+
+
+# Compare the NumPy runtime against Keras on the same inputs
+def check_parity(keras_model, numpy_model, X, atol=1e-4):
+    expected = keras_model.predict(X, verbose=0)
+    actual = numpy_model.predict(X)
+    max_abs_diff = float(np.max(np.abs(expected - actual)))
+    return max_abs_diff <= atol, max_abs_diff
+
+
+def _time_batches(model, X, batch_size, repeats):
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.predict(X[:batch_size], verbose=0)
+        latencies.append(time.perf_counter() - start)
+    return float(np.median(latencies))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the Keras maintenance LSTM to a NumPy runtime")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help='Export an .h5 model to .npz')
+    export_parser.add_argument('h5_path')
+    export_parser.add_argument('npz_path')
+    export_parser.add_argument('--check', action='store_true', help='Verify outputs against Keras after export')
+
+    bench_parser = subparsers.add_parser('benchmark', help='Compare cold start and batch latency')
+    bench_parser.add_argument('npz_path')
+    bench_parser.add_argument('--h5-path', help='Also benchmark (and check parity against) the Keras model')
+    bench_parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 32, 256])
+    bench_parser.add_argument('--repeats', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        keras_model = _load_keras_model(args.h5_path)
+        export_lstm_model(keras_model, args.npz_path)
+        print(f"Exported {args.h5_path} to {args.npz_path}")
+        if args.check:
+            numpy_model = NumpyLSTMModel.load(args.npz_path)
+            X = np.random.default_rng(0).random((64,) + tuple(keras_model.input_shape[1:]), dtype=np.float32)
+            ok, max_abs_diff = check_parity(keras_model, numpy_model, X)
+            print(f"Parity check {'passed' if ok else 'FAILED'}: max abs difference {max_abs_diff:.2e}")
+            if not ok:
+                raise SystemExit(1)
+        return
+
+    start = time.perf_counter()
+    numpy_model = NumpyLSTMModel.load(args.npz_path)
+    X = np.random.default_rng(0).random((max(args.batch_sizes),) + numpy_model.input_shape[1:], dtype=np.float32)
+    numpy_model.predict(X[:1])
+    results = {'numpy': {'cold_start_s': time.perf_counter() - start}}
+
+    if args.h5_path:
+        start = time.perf_counter()
+        keras_model = _load_keras_model(args.h5_path)
+        keras_model.predict(X[:1], verbose=0)
+        results['keras'] = {'cold_start_s': time.perf_counter() - start}
+        ok, max_abs_diff = check_parity(keras_model, numpy_model, X)
+        results['parity'] = {'passed': ok, 'max_abs_diff': max_abs_diff}
+
+    for batch_size in args.batch_sizes:
+        results['numpy'][f'batch_{batch_size}_s'] = _time_batches(numpy_model, X, batch_size, args.repeats)
+        if args.h5_path:
+            results['keras'][f'batch_{batch_size}_s'] = _time_batches(keras_model, X, batch_size, args.repeats)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
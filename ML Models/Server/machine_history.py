@@ -0,0 +1,97 @@
+import os
+import threading
+import numpy as np
+
+
+class MachineHistory:
+    """
+    Rolling history of the last time_steps scaled feature vectors per machine.
+    1. Each machine owns a preallocated (2 * time_steps, n_features) float32 buffer
+    2. Every sample is written twice, time_steps apart, so the latest window is
+       always one contiguous slice - no copying or reordering on read
+    3. A machine's first sample fills the whole window, which matches how a
+       single reading used to be repeated to build a sequence
+    4. The samples are only comparable under the scaler that produced them, so the
+       history records the model bundle version and starts over when it changes
+    """
+
+    def __init__(self, time_steps=48, n_features=20, dtype=np.float32):
+        self.time_steps = time_steps
+        self.n_features = n_features
+        self.dtype = dtype
+        self._buffers = {}
+        self._heads = {}
+        # Bundle version whose scaler produced the stored samples (None: not tracked)
+        self.version = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._buffers)
+
+    def __contains__(self, machine_id):
+        return machine_id in self._buffers
+
+    def append(self, machine_id, sample):
+        # Add one sample and return the machine's current window (oldest first)
+        buffer = self._buffers.get(machine_id)
+        if buffer is None:
+            buffer = np.empty((2 * self.time_steps, self.n_features), dtype=self.dtype)
+            buffer[:] = sample
+            self._buffers[machine_id] = buffer
+            self._heads[machine_id] = 0
+            return buffer[:self.time_steps]
+
+        head = self._heads[machine_id]
+        buffer[head] = sample
+        buffer[head + self.time_steps] = sample
+        head = (head + 1) % self.time_steps
+        self._heads[machine_id] = head
+        return buffer[head:head + self.time_steps]
+
+    def window(self, machine_id):
+        head = self._heads[machine_id]
+        return self._buffers[machine_id][head:head + self.time_steps]
+
+    def append_many(self, machine_ids, samples, version=None):
+        # Append one sample per machine (in order) and return the stacked windows.
+        # Samples scaled by a different model version than the stored ones start a fresh history
+        windows = np.empty((len(machine_ids), self.time_steps, self.n_features), dtype=self.dtype)
+        with self._lock:
+            if version is not None and version != self.version:
+                self._buffers.clear()
+                self._heads.clear()
+                self.version = version
+            for i, (machine_id, sample) in enumerate(zip(machine_ids, samples)):
+                windows[i] = self.append(machine_id, sample)
+        return windows
+
+    def save(self, path):
+        # Write to a temporary file first so a crash never leaves a truncated history
+        with self._lock:
+            machine_ids = list(self._buffers)
+            buffers = np.stack([self._buffers[m] for m in machine_ids]) if machine_ids else \
+                np.empty((0, 2 * self.time_steps, self.n_features), dtype=self.dtype)
+            heads = np.array([self._heads[m] for m in machine_ids], dtype=np.int64)
+            version = '' if self.version is None else str(self.version)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, machine_ids=np.array(machine_ids), buffers=buffers, heads=heads, version=np.array(version))
+        os.replace(tmp_path, path)
+
+    def load(self, path, version=None):
+        # With a version, a history saved under other models is refused (ValueError), not mixed in
+        with np.load(path) as data:
+            saved_version = str(data['version']) if 'version' in data.files else ''
+            if version is not None and saved_version != str(version):
+                raise ValueError(f"History in {path} was built with models {saved_version or 'unknown'}, "
+                                 f"current models are {version}; starting a new history")
+            buffers = data['buffers']
+            if buffers.shape[1:] != (2 * self.time_steps, self.n_features):
+                raise ValueError(f"History in {path} has shape {buffers.shape[1:]}, "
+                                 f"expected {(2 * self.time_steps, self.n_features)}")
+            with self._lock:
+                for machine_id, buffer, head in zip(data['machine_ids'].tolist(), buffers, data['heads']):
+                    self._buffers[machine_id] = buffer.astype(self.dtype)
+                    self._heads[machine_id] = int(head)
+                self.version = version if version is not None else (saved_version or None)
+        return self
@@ -0,0 +1,192 @@
+import math
+import threading
+import time
+from bisect import bisect_left
+
+# Default latency buckets in seconds, from 0.5 ms to 30 s
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Every metric created in this process, in creation order
+REGISTRY = []
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class _Timer:
+    # Context manager that observes the elapsed time on exit
+    __slots__ = ('metric', 'start')
+
+    def __init__(self, metric):
+        self.metric = metric
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metric.observe(time.perf_counter() - self.start)
+
+
+class _Metric:
+    """
+    Base for the metric types; a metric with labels holds one child per label combination.
+    Updates take a per-child lock and touch a few numbers, rendering only reads them.
+    """
+
+    kind = None
+    # Appended to the name on the HELP/TYPE lines, so they match the sample names
+    suffix = ''
+
+    def __init__(self, name, documentation, labelnames=(), **kwargs):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._kwargs = kwargs
+        self._children = {}
+        self._children_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._init_values()
+        REGISTRY.append(self)
+
+    def _init_values(self):
+        pass
+
+    def labels(self, *labelvalues, **labelkwargs):
+        if labelkwargs:
+            labelvalues = tuple(labelkwargs[name] for name in self.labelnames)
+        key = tuple(str(value) for value in labelvalues)
+        child = self._children.get(key)
+        if child is None:
+            with self._children_lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = type(self).__new__(type(self))
+                    child._lock = threading.Lock()
+                    child._kwargs = self._kwargs
+                    child._init_values()
+                    self._children[key] = child
+        return child
+
+    def _samples(self):
+        # Yields (labelvalues, child) for every series of this metric
+        if self.labelnames:
+            yield from list(self._children.items())
+        else:
+            yield (), self
+
+    def render(self):
+        family = self.name + self.suffix
+        lines = [f'# HELP {family} {self.documentation}', f'# TYPE {family} {self.kind}']
+        for labelvalues, child in self._samples():
+            lines.extend(child._render_series(self.name, self.labelnames, labelvalues))
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+    suffix = '_total'
+
+    def _init_values(self):
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        # Counters only go up; a negative amount is a bug in the caller
+        if amount < 0:
+            raise ValueError(f"Counters can only increase, got {amount}")
+        with self._lock:
+            self.value += amount
+
+    def _render_series(self, name, labelnames, labelvalues):
+        return [f'{name}{self.suffix}{_format_labels(labelnames, labelvalues)} {_format_value(self.value)}']
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def _init_values(self):
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def _render_series(self, name, labelnames, labelvalues):
+        return [f'{name}{_format_labels(labelnames, labelvalues)} {_format_value(self.value)}']
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def _init_values(self):
+        self.buckets = tuple(self._kwargs.get('buckets', DEFAULT_BUCKETS))
+        # Per-bucket counts (not cumulative); the last slot counts values above every bound
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        return _Timer(self)
+
+    def _render_series(self, name, labelnames, labelvalues):
+        with self._lock:
+            counts = list(self.counts)
+            total_sum = self.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            labels = _format_labels(labelnames, labelvalues, ('le', _format_value(bound)))
+            lines.append(f'{name}_bucket{labels} {cumulative}')
+        labels = _format_labels(labelnames, labelvalues)
+        lines.append(f'{name}_sum{labels} {_format_value(total_sum)}')
+        lines.append(f'{name}_count{labels} {cumulative}')
+        return lines
+
+
+# Prometheus text exposition format (version 0.0.4) for every registered metric
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# Metrics for the prediction pipeline, shared by helper_functions.py and the API
+STAGE_SECONDS = Histogram('ml_stage_seconds', 'Time spent in each prediction stage', ['stage'])
+CYCLE_SECONDS = Histogram('ml_cycle_seconds', 'Duration of a full processing cycle')
+MACHINES_PROCESSED = Counter('ml_machines_processed', 'Machines whose predictions were written')
+MACHINES_FAILED = Counter('ml_machines_failed', 'Machines skipped or failed during a cycle')
+PREDICTIONS_DROPPED = Counter('ml_predictions_dropped', 'Predictions discarded after repeated write failures')
+DROPPED_TICKS = Counter('ml_dropped_ticks', 'Scheduler ticks skipped because a cycle was still running')
+DB_SECONDS = Histogram('ml_db_seconds', 'Database round-trip time', ['operation'])
+PREDICT_SECONDS = Histogram('ml_predict_seconds', 'Latency of POST /predict requests, including batching')
+PREDICT_BATCH_ROWS = Histogram('ml_predict_batch_rows', 'Records scored per /predict micro-batch',
+                               buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024))
+MODEL_LOAD_SECONDS = Gauge('ml_model_load_seconds', 'Time taken to load each model component', ['component'])
+INGEST_READINGS = Counter('ml_ingest_readings', 'Streamed readings by outcome', ['outcome'])
+INGEST_QUEUE_DEPTH = Gauge('ml_ingest_queue_depth', 'Streamed readings waiting to be scored')
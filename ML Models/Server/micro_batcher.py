@@ -0,0 +1,105 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent requests into one scoring call:
+    1. Each submit() queues a list of items and returns a Future for their results
+    2. A worker thread takes the first waiting request, then keeps collecting for up to
+       max_wait_ms or until max_batch_size items are queued
+    3. score_batch(items) runs once on everything collected and the results are split
+       back to the requests in order
+    4. If scoring the batch fails, each request is rescored on its own, so a bad
+       request only fails itself; score_batch must therefore fail before changing any state
+    A request larger than max_batch_size is scored on its own, never split.
+    """
+
+    def __init__(self, score_batch, max_batch_size=256, max_wait_ms=5.0, on_batch=None, name='micro-batcher'):
+        self.score_batch = score_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        # on_batch(n_requests, n_items, seconds), called after every scored batch
+        self.on_batch = on_batch
+        self._queue = queue.Queue()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    def submit(self, items):
+        if self._closed:
+            raise RuntimeError("MicroBatcher is closed")
+        future = Future()
+        self._queue.put((list(items), future))
+        return future
+
+    def close(self):
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join()
+
+    def _collect(self, first):
+        # Gather requests until the batch is full or the wait window has passed
+        requests = [first]
+        n_items = len(first[0])
+        deadline = time.perf_counter() + self.max_wait
+        while n_items < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                # Close requested: score what we have, then stop
+                self._queue.put(None)
+                break
+            if n_items + len(request[0]) > self.max_batch_size:
+                # Doesn't fit: it starts the next batch instead
+                self._carry = request
+                break
+            requests.append(request)
+            n_items += len(request[0])
+        return requests
+
+    def _run(self):
+        self._carry = None
+        while True:
+            if self._carry is not None:
+                first, self._carry = self._carry, None
+            else:
+                first = self._queue.get()
+            if first is None:
+                return
+            requests = self._collect(first)
+            items = [item for request_items, _ in requests for item in request_items]
+            start = time.perf_counter()
+            try:
+                results = self.score_batch(items)
+            except Exception as e:
+                if len(requests) == 1:
+                    requests[0][1].set_exception(e)
+                else:
+                    self._score_each(requests)
+                continue
+            offset = 0
+            for request_items, future in requests:
+                future.set_result(results[offset:offset + len(request_items)])
+                offset += len(request_items)
+            if self.on_batch is not None:
+                self.on_batch(len(requests), len(items), time.perf_counter() - start)
+
+    def _score_each(self, requests):
+        # Fallback after a failed batch: the failure stays with the request that caused it
+        for request_items, future in requests:
+            start = time.perf_counter()
+            try:
+                future.set_result(self.score_batch(request_items))
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            if self.on_batch is not None:
+                self.on_batch(1, len(request_items), time.perf_counter() - start)
@@ -0,0 +1,222 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from collections.abc import Mapping
+from datetime import datetime
+import joblib
+import sklearn
+from feature_schema import FEATURE_SCHEMA
+from lstm_runtime import NumpyLSTMModel
+from metrics import MODEL_LOAD_SECONDS
+from tree_runtime import compile_forest
+
+# Name of the manifest file inside a bundle directory
+MANIFEST_FILE = 'manifest.json'
+BUNDLE_FORMAT_VERSION = 1
+
+# Bundle components and the loose training outputs they are built from
+COMPONENT_SOURCES = {
+    'iso_forest': 'isolation_forest_model.pkl',
+    'anomaly_type_classifier': 'anomaly_type_classifier.pkl',
+    'health_score_predictor': 'health_score_predictor.pkl',
+    'maintenance_predictor': 'maintenance_predictor_lstm.npz',
+    'scaler_anomaly': 'scaler_anomaly.pkl',
+    'scaler_X_maint': 'scaler_X_maint.pkl',
+    'scaler_y_maint': 'scaler_y_maint.pkl',
+}
+
+# Components whose input is the feature vector, checked against the schema at build time
+FEATURE_INPUT_COMPONENTS = ['iso_forest', 'anomaly_type_classifier', 'health_score_predictor',
+                            'maintenance_predictor', 'scaler_anomaly', 'scaler_X_maint']
+
+
+class BundleError(Exception):
+    pass
+
+
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def schema_manifest(schema):
+    return [{'name': name, 'dtype': dtype, 'default': float(default)}
+            for name, dtype, default in schema.features]
+
+
+# Load one loose training output as the object the server scores with
+def load_source_component(name, path):
+    if name == 'maintenance_predictor':
+        model = NumpyLSTMModel.load(path)
+    else:
+        model = joblib.load(path)
+    if name in FEATURE_INPUT_COMPONENTS:
+        model = FEATURE_SCHEMA.validate(model, name)
+    if name in ('iso_forest', 'anomaly_type_classifier', 'health_score_predictor'):
+        # Forests are stored already compiled (see tree_runtime.py), so loading does no compile work
+        model = compile_forest(model)
+    return model
+
+
+# Build a bundle directory from the loose files written by models.py
+def build_bundle(source_dir, out_dir, version=None):
+    """
+    Layout: <out_dir>/manifest.json plus one <component>.joblib per model/scaler
+    1. Every component is validated against FEATURE_SCHEMA before it is written
+    2. The manifest records the bundle version, the feature schema and a sha256 per file
+    3. The manifest is written last, so a half-built bundle is never loaded
+    """
+    missing = [source for source in COMPONENT_SOURCES.values()
+               if not os.path.exists(os.path.join(source_dir, source))]
+    if missing:
+        raise BundleError(f"Cannot build bundle, missing files in {source_dir}: {missing}")
+
+    os.makedirs(out_dir, exist_ok=True)
+    version = version or datetime.now().strftime('%Y%m%d-%H%M%S')
+    components = {}
+    for name, source in COMPONENT_SOURCES.items():
+        source_path = os.path.join(source_dir, source)
+        model = load_source_component(name, source_path)
+        file_name = f'{name}.joblib'
+        path = os.path.join(out_dir, file_name)
+        # Uncompressed, so the numpy arrays inside can be memory-mapped on load. Written to a new
+        # file and renamed, so a running server's memory maps of the old bundle stay valid
+        joblib.dump(model, f'{path}.tmp')
+        os.replace(f'{path}.tmp', path)
+        components[name] = {
+            'file': file_name,
+            'type': type(model).__name__,
+            'source': source,
+            'source_sha256': file_sha256(source_path),
+            'sha256': file_sha256(path),
+        }
+
+    manifest = {
+        'format_version': BUNDLE_FORMAT_VERSION,
+        'version': version,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'sklearn_version': sklearn.__version__,
+        'feature_schema': schema_manifest(FEATURE_SCHEMA),
+        'components': components,
+    }
+    tmp_path = os.path.join(out_dir, f'{MANIFEST_FILE}.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(out_dir, MANIFEST_FILE))
+    return manifest
+
+
+class ModelBundle(Mapping):
+    """
+    Read-only models dict backed by a bundle directory:
+    1. Opening reads only the manifest, and fails if the schema differs or any file is missing
+    2. Each component is loaded on first access, with its numpy arrays memory-mapped
+    3. Checksums are verified as components load; load times are kept per component
+    """
+
+    def __init__(self, path, verify=True, mmap_mode='r'):
+        self.path = path
+        self.verify = verify
+        self.mmap_mode = mmap_mode
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            raise BundleError(f"No model bundle at {path} ({MANIFEST_FILE} not found)")
+        with open(manifest_path) as f:
+            self.manifest = json.load(f)
+
+        if self.manifest.get('format_version') != BUNDLE_FORMAT_VERSION:
+            raise BundleError(f"Unsupported bundle format {self.manifest.get('format_version')} in {path}")
+        bundle_features = [feature['name'] for feature in self.manifest['feature_schema']]
+        if bundle_features != FEATURE_SCHEMA.names:
+            raise BundleError(f"Bundle {path} was built for a different feature schema: {bundle_features}")
+        missing = [name for name in COMPONENT_SOURCES if name not in self.manifest['components']]
+        missing += [name for name, component in self.manifest['components'].items()
+                    if not os.path.exists(os.path.join(path, component['file']))]
+        if missing:
+            raise BundleError(f"Bundle {path} is missing components: {missing}")
+
+        self.version = self.manifest['version']
+        self.load_times = {}
+        self._loaded = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        model = self._loaded.get(name)
+        if model is not None:
+            return model
+        if name not in self.manifest['components']:
+            raise KeyError(name)
+        with self._lock:
+            if name not in self._loaded:
+                self._loaded[name] = self._load_component(name)
+        return self._loaded[name]
+
+    def __iter__(self):
+        return iter(self.manifest['components'])
+
+    def __len__(self):
+        return len(self.manifest['components'])
+
+    def _load_component(self, name):
+        component = self.manifest['components'][name]
+        path = os.path.join(self.path, component['file'])
+        start = time.perf_counter()
+        if self.verify and file_sha256(path) != component['sha256']:
+            raise BundleError(f"Checksum mismatch for {name} in bundle {self.path}")
+        model = joblib.load(path, mmap_mode=self.mmap_mode)
+        self.load_times[name] = time.perf_counter() - start
+        MODEL_LOAD_SECONDS.labels(name).set(self.load_times[name])
+        return model
+
+    def preload(self):
+        # Load every component now instead of on first use
+        for name in self:
+            self[name]
+        return self
+
+    def describe(self):
+        return {
+            'path': self.path,
+            'version': self.version,
+            'created_at': self.manifest.get('created_at'),
+            'loaded': sorted(self._loaded),
+            'load_seconds': {name: round(seconds, 4) for name, seconds in self.load_times.items()},
+        }
+
+
+def open_model_bundle(path, verify=True, preload=False):
+    bundle = ModelBundle(path, verify=verify)
+    return bundle.preload() if preload else bundle
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or inspect a versioned model bundle")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help='Bundle the loose files written by models.py')
+    build_parser.add_argument('source_dir', help='Directory with the .pkl/.npz training outputs')
+    build_parser.add_argument('out_dir', help='Bundle directory to write')
+    build_parser.add_argument('--version', help='Bundle version (default: a timestamp)')
+
+    inspect_parser = subparsers.add_parser('inspect', help='Load a bundle and report per-component load times')
+    inspect_parser.add_argument('bundle_dir')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        manifest = build_bundle(args.source_dir, args.out_dir, args.version)
+        print(f"Built bundle {manifest['version']} with {len(manifest['components'])} components in {args.out_dir}")
+    else:
+        bundle = open_model_bundle(args.bundle_dir, preload=True)
+        print(f"Bundle {bundle.version} ({bundle.manifest['created_at']})")
+        for name, seconds in bundle.load_times.items():
+            print(f"- {name}: {seconds * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
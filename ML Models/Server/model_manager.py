@@ -0,0 +1,108 @@
+import logging
+import os
+import threading
+import time
+import numpy as np
+from model_bundle import MANIFEST_FILE
+from metrics import MODEL_LOAD_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+def bundle_version(models):
+    return getattr(models, 'version', 'unversioned')
+
+
+class ModelManager:
+    """
+    Owns the live models dict and replaces it without restarting the service:
+    1. A new bundle is loaded and fully preloaded on a background thread
+    2. It must score a canary batch with finite outputs before it is used
+    3. The swap is a single reference assignment; a cycle reads `current` once
+       and keeps that reference, so in-flight scoring never mixes model versions
+    """
+
+    def __init__(self, models, loader, bundle_path, canary=None, score=None):
+        # loader(bundle_path) -> models; canary() -> DataFrame; score(df, models) -> results DataFrame
+        self.current = models
+        self.loader = loader
+        self.bundle_path = bundle_path
+        self.canary = canary
+        self.score = score
+        self._reload_lock = threading.Lock()
+        self._watched_mtime = self._manifest_mtime()
+        self.status = {
+            'version': bundle_version(models),
+            'loaded_at': time.time(),
+            'reloads': 0,
+            'reloading': False,
+            'last_error': None,
+        }
+
+    def _manifest_mtime(self):
+        try:
+            return os.path.getmtime(os.path.join(self.bundle_path, MANIFEST_FILE))
+        except OSError:
+            return None
+
+    def validate(self, models):
+        # Score the canary batch; raise if anything is missing or non-finite
+        if self.canary is None or self.score is None:
+            return
+        canary_df = self.canary()
+        results_df = self.score(canary_df, models)
+        if len(results_df) != len(canary_df):
+            raise ValueError(f"Canary batch returned {len(results_df)} rows for {len(canary_df)} inputs")
+        numeric = results_df.select_dtypes('number').to_numpy(dtype=np.float64)
+        if not np.isfinite(numeric).all():
+            raise ValueError("Canary batch produced non-finite predictions")
+
+    def reload(self):
+        # Load, validate and swap in the bundle; returns whether the new models went live
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        self.status['reloading'] = True
+        mtime = self._manifest_mtime()
+        try:
+            start = time.perf_counter()
+            models = self.loader(self.bundle_path)
+            # Load every lazy component now, so the first cycle on the new models doesn't pay for it
+            if hasattr(models, 'preload'):
+                models.preload()
+            MODEL_LOAD_SECONDS.labels('all').set(time.perf_counter() - start)
+            self.validate(models)
+
+            previous = bundle_version(self.current)
+            self.current = models
+            self._watched_mtime = mtime
+            self.status.update({
+                'version': bundle_version(models),
+                'loaded_at': time.time(),
+                'reloads': self.status['reloads'] + 1,
+                'last_error': None,
+            })
+            logger.info(f"Swapped models {previous} -> {bundle_version(models)} in {time.perf_counter() - start:.2f}s")
+            return True
+        except Exception as e:
+            # Keep serving the current models; a watched bundle is retried only once it is rewritten
+            self._watched_mtime = mtime
+            self.status['last_error'] = str(e)
+            logger.error(f"Model reload failed, keeping {bundle_version(self.current)}: {e}")
+            return False
+        finally:
+            self.status['reloading'] = False
+            self._reload_lock.release()
+
+    def reload_async(self):
+        # Start a reload on a background thread; returns False if one is already running
+        if self._reload_lock.locked():
+            return False
+        threading.Thread(target=self.reload, name='model-reload', daemon=True).start()
+        return True
+
+    def check_for_update(self):
+        # File-watch mode: reload when the bundle's manifest is rewritten
+        mtime = self._manifest_mtime()
+        if mtime is not None and mtime != self._watched_mtime:
+            logger.info(f"Model bundle at {self.bundle_path} changed, reloading")
+            self.reload()
@@ -0,0 +1,96 @@
+import os
+import threading
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from dataset_io import SCHEMA_FILE, is_columnar_dataset, load_columns, read_frame
+
+# One loaded version of the data; replaced as a whole, never modified
+ReplayData = namedtuple('ReplayData', ['columns', 'arrays', 'n_rows', 'mtime'])
+
+
+class ReplayStore:
+    """
+    Holds the replay data in memory as one array per column, loaded once:
+    1. A CSV is parsed a single time; a columnar dataset directory (see dataset_io.py)
+       is memory-mapped instead, so nothing is parsed at all
+    2. Row lookups index each column directly, O(1) per row
+    3. The data is only reloaded when the file's mtime changes
+    4. A reload publishes a new ReplayData with one assignment; each read takes that
+       reference once, so it never mixes columns from two versions of the file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = ReplayData([], {}, 0, None)
+
+    def __len__(self):
+        return self.refresh().n_rows
+
+    @property
+    def columns(self):
+        return self._data.columns
+
+    @property
+    def arrays(self):
+        return self._data.arrays
+
+    @property
+    def n_rows(self):
+        return self._data.n_rows
+
+    def _watched_file(self):
+        if os.path.isdir(self.path):
+            return os.path.join(self.path, SCHEMA_FILE)
+        return self.path
+
+    def _load(self, mtime):
+        if is_columnar_dataset(self.path):
+            arrays = load_columns(self.path, mmap=True)
+        else:
+            df = read_frame(self.path)
+            arrays = {}
+            for col in df.columns:
+                values = df[col].to_numpy()
+                values.setflags(write=False)
+                arrays[col] = values
+
+        # Swap everything in at once so readers never see a half-loaded store
+        n_rows = len(next(iter(arrays.values()))) if arrays else 0
+        self._data = ReplayData(list(arrays), arrays, n_rows, mtime)
+
+    def refresh(self):
+        # Cheap stat() on every call, full reload only when the data changed; returns the current data
+        mtime = os.path.getmtime(self._watched_file())
+        if mtime != self._data.mtime:
+            with self._lock:
+                if mtime != self._data.mtime:
+                    self._load(mtime)
+        return self._data
+
+    def row(self, row_idx):
+        # Return a single row as a Series, like df.iloc[row_idx]
+        self.refresh()
+        return self.rows([row_idx]).iloc[0].rename(row_idx)
+
+    def rows(self, row_indices):
+        # Return several rows as a DataFrame, like df.iloc[row_indices]
+        data = self.refresh()
+        row_indices = np.asarray(row_indices, dtype=np.intp)
+        return pd.DataFrame({col: values[row_indices] for col, values in data.arrays.items()})
+
+
+# Stores are shared by path so every machine reads from one copy
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_replay_store(path):
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = ReplayStore(path)
+            _stores[path] = store
+    store.refresh()
+    return store
@@ -0,0 +1,94 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+# Build every LSTM window over X without copying it
+def sliding_windows(X, time_steps=48):
+    """
+    Return a read-only (n - time_steps + 1, time_steps, n_features) view of X.
+    Window i covers rows i .. i + time_steps - 1; nothing is copied.
+    """
+    X = np.asarray(X)
+    if X.ndim == 1:
+        X = X.reshape(1, -1)
+    # sliding_window_view puts the window axis last: (n_windows, n_features, time_steps)
+    return sliding_window_view(X, time_steps, axis=0).transpose(0, 2, 1)
+
+
+# Repeat a single sample time_steps times without copying it
+def repeated_window(sample, time_steps=48):
+    sample = np.asarray(sample).reshape(1, -1)
+    return np.broadcast_to(sample[np.newaxis], (1, time_steps, sample.shape[1]))
+
+
+# Yield fixed-size batches of windows so memory stays flat on long histories
+def window_batches(X, time_steps=48, batch_size=1024, y=None, indices=None,
+                   shuffle=False, seed=None, dtype=np.float32):
+    """
+    Yield contiguous batches of windows from X (and their targets, if y is given).
+    1. indices selects which windows to use (all of them by default)
+    2. Only one batch is materialized at a time, in the requested dtype
+    3. With y, yields (X_batch, y_batch) where y_batch is y[indices], so pass
+       targets already aligned to window positions
+    """
+    windows = sliding_windows(X, time_steps)
+    if indices is None:
+        indices = np.arange(len(windows))
+    indices = np.asarray(indices)
+    if shuffle:
+        indices = np.random.default_rng(seed).permutation(indices)
+
+    for start in range(0, len(indices), batch_size):
+        batch_indices = indices[start:start + batch_size]
+        X_batch = windows[batch_indices].astype(dtype, copy=False)
+        if y is None:
+            yield X_batch
+        else:
+            yield X_batch, np.asarray(y)[batch_indices]
+
+
+# Yield shuffled batches of windows while holding at most buffer_size of them in memory
+def shuffled_window_batches(X, y, indices, time_steps=48, batch_size=64, buffer_size=8192,
+                            chunk_size=512, seed=None, dtype=np.float32):
+    """
+    Shuffle for X too large to window in memory (e.g. a memory-mapped .npy):
+    1. The window positions in indices are sorted and cut into chunks of chunk_size;
+       each chunk reads one contiguous block of rows from X
+    2. Chunks are visited in random order, buffer_size // chunk_size at a time; each
+       such buffer is permuted and emitted as (X_batch, y_batch) batches
+    3. y must be aligned to window positions, as in window_batches
+    Leftover windows that don't fill a batch are carried into the next buffer.
+    """
+    rng = np.random.default_rng(seed)
+    indices = np.sort(np.asarray(indices))
+    chunks = [indices[start:start + chunk_size] for start in range(0, len(indices), chunk_size)]
+    order = rng.permutation(len(chunks))
+    chunks_per_buffer = max(1, buffer_size // chunk_size)
+
+    carry_X = np.empty((0, time_steps, X.shape[1]), dtype=dtype)
+    carry_y = None
+    for start in range(0, len(order), chunks_per_buffer):
+        X_parts, y_parts = [carry_X], [] if carry_y is None else [carry_y]
+        for chunk in (chunks[i] for i in order[start:start + chunks_per_buffer]):
+            block = np.asarray(X[chunk[0]:chunk[-1] + time_steps], dtype=dtype)
+            X_parts.append(sliding_windows(block, time_steps)[chunk - chunk[0]])
+            y_parts.append(np.asarray(y[chunk], dtype=dtype))
+        X_buffer, y_buffer = np.concatenate(X_parts), np.concatenate(y_parts)
+        permutation = rng.permutation(len(X_buffer))
+        X_buffer, y_buffer = X_buffer[permutation], y_buffer[permutation]
+
+        n_full = len(X_buffer) - len(X_buffer) % batch_size
+        for batch_start in range(0, n_full, batch_size):
+            yield X_buffer[batch_start:batch_start + batch_size], y_buffer[batch_start:batch_start + batch_size]
+        carry_X, carry_y = X_buffer[n_full:], y_buffer[n_full:]
+
+    if len(carry_X):
+        yield carry_X, carry_y
+
+
+# Run model.predict over all windows of X in fixed-size batches
+def predict_windows(model, X, time_steps=48, batch_size=1024):
+    outputs = [model.predict(X_batch) for X_batch in window_batches(X, time_steps, batch_size)]
+    if not outputs:
+        return np.empty((0, 1))
+    return np.concatenate(outputs)
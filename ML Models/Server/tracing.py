@@ -0,0 +1,79 @@
+import contextvars
+import json
+import logging
+import os
+import random
+from contextlib import contextmanager
+
+# Machine and cycle being processed; attached to every event emitted while they are set
+machine_id_var = contextvars.ContextVar('machine_id', default=None)
+cycle_id_var = contextvars.ContextVar('cycle_id', default=None)
+
+
+@contextmanager
+def trace_context(**values):
+    # Set machine_id and/or cycle_id for the duration of a block
+    variables = {'machine_id': machine_id_var, 'cycle_id': cycle_id_var}
+    tokens = [(variables[name], variables[name].set(value)) for name, value in values.items()]
+    try:
+        yield
+    finally:
+        for variable, token in reversed(tokens):
+            variable.reset(token)
+
+
+class Tracer:
+    """
+    Structured, level-gated and sampled events, written as one JSON line each through logging:
+    1. Events below the tracer's level return after a single comparison; hot paths can also
+       check `debug_enabled`/`info_enabled` first so not even the arguments are built
+    2. Debug and info events are kept with probability `sample_rate`; warnings and errors always are
+    3. The current machine_id and cycle_id are added to every event
+    """
+
+    def __init__(self, name, level=None, sample_rate=None):
+        # A child of the module's logger: events still reach its handlers, but setting the
+        # tracer's level leaves the module's own logger (and its plain log lines) alone
+        self.logger = logging.getLogger(f'{name}.trace')
+        self.sample_rate = float(os.getenv('TRACE_SAMPLE_RATE', '1.0') if sample_rate is None else sample_rate)
+        self.set_level(os.getenv('TRACE_LEVEL', 'INFO') if level is None else level)
+
+    def set_level(self, level):
+        # Accepts a level number or name; an unknown name falls back to INFO instead of
+        # leaving a string level that breaks every comparison below
+        if isinstance(level, str):
+            name = level.strip().upper()
+            level = int(name) if name.isdigit() else logging.getLevelName(name)
+            if not isinstance(level, int):
+                self.logger.warning(f"Unknown trace level {name!r}, using INFO")
+                level = logging.INFO
+        self.level = level
+        self.debug_enabled = self.level <= logging.DEBUG
+        self.info_enabled = self.level <= logging.INFO
+        # Gating happens here, so logging itself must let every emitted event through
+        self.logger.setLevel(self.level)
+
+    def event(self, level, name, **fields):
+        if level < self.level:
+            return
+        if level < logging.WARNING and self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        record = {'event': name, 'machine_id': machine_id_var.get(), 'cycle_id': cycle_id_var.get()}
+        record.update(fields)
+        self.logger.log(level, json.dumps(record, default=str))
+
+    def debug(self, name, **fields):
+        self.event(logging.DEBUG, name, **fields)
+
+    def info(self, name, **fields):
+        self.event(logging.INFO, name, **fields)
+
+    def warning(self, name, **fields):
+        self.event(logging.WARNING, name, **fields)
+
+    def error(self, name, **fields):
+        self.event(logging.ERROR, name, **fields)
+
+
+def get_tracer(name):
+    return Tracer(name)
@@ -0,0 +1,252 @@
+import argparse
+import json
+import time
+import joblib
+import numpy as np
+
+
+# Expected path length of an unsuccessful BST search over n samples (same as sklearn's IsolationForest)
+def average_path_length(n_samples):
+    n_samples = np.asarray(n_samples, dtype=np.float64)
+    result = np.zeros_like(n_samples)
+    result[n_samples == 2] = 1.0
+    mask = n_samples > 2
+    n = n_samples[mask]
+    result[mask] = 2.0 * (np.log(n - 1.0) + np.euler_gamma) - 2.0 * (n - 1.0) / n
+    return result
+
+
+def _node_depths(tree):
+    depths = np.zeros(tree.node_count, dtype=np.int64)
+    for node in range(tree.node_count):
+        # Children always come after their parent in sklearn's node order
+        left, right = tree.children_left[node], tree.children_right[node]
+        if left != -1:
+            depths[left] = depths[node] + 1
+            depths[right] = depths[node] + 1
+    return depths
+
+
+# Flatten fitted sklearn trees into one set of packed node arrays
+def pack_trees(trees, leaf_values, feature_maps=None):
+    """
+    All trees share flat arrays (feature, threshold, left, right, value), with
+    node IDs offset per tree. Leaves point to themselves, so walking every tree a
+    fixed max_depth steps always ends on a leaf.
+    """
+    offsets = np.cumsum([0] + [tree.node_count for tree in trees[:-1]])
+    features, thresholds, lefts, rights, missing_left, values = [], [], [], [], [], []
+    max_depth = 0
+    for i, (tree, offset) in enumerate(zip(trees, offsets)):
+        node_ids = np.arange(tree.node_count)
+        is_leaf = tree.children_left == -1
+        feature = np.where(is_leaf, 0, tree.feature)
+        if feature_maps is not None:
+            feature = np.asarray(feature_maps[i])[feature]
+        features.append(feature)
+        thresholds.append(np.where(is_leaf, 0.0, tree.threshold))
+        lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+        rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+        # Trees fitted on data with NaNs record which way missing values go
+        missing = getattr(tree, 'missing_go_to_left', None)
+        missing_left.append(np.zeros(tree.node_count, dtype=bool) if missing is None else np.asarray(missing, dtype=bool))
+        values.append(leaf_values[i])
+        max_depth = max(max_depth, tree.max_depth)
+
+    return {
+        'roots': offsets.astype(np.int64),
+        'feature': np.concatenate(features).astype(np.int64),
+        'threshold': np.concatenate(thresholds).astype(np.float64),
+        'left': np.concatenate(lefts).astype(np.int64),
+        'right': np.concatenate(rights).astype(np.int64),
+        'missing_left': np.concatenate(missing_left),
+        'value': np.concatenate(values),
+        'max_depth': np.int64(max_depth),
+    }
+
+
+class CompiledForest:
+    """
+    Vectorized scorer over packed tree arrays.
+    Rows and trees are walked together, one level per step, so a whole forest
+    is scored with max_depth rounds of array gathers and no per-tree Python calls.
+    That wins on small batches, where sklearn's per-call overhead dominates; above
+    max_compiled_rows the source sklearn forest (when kept) scores instead.
+    """
+
+    kind = None
+    # Batch size up to which the packed arrays are faster than sklearn's own traversal
+    max_compiled_rows = 256
+
+    def __init__(self, arrays, metadata=None, estimator=None):
+        self.arrays = arrays
+        self.metadata = metadata or {}
+        for name, value in arrays.items():
+            setattr(self, f'_{name}', value)
+        self.n_features_in_ = self.metadata.get('n_features_in')
+        # The fitted sklearn forest, for bulk scoring; not part of the .npz export
+        self.estimator = estimator
+
+    def bulk_estimator(self, X):
+        # The sklearn forest when X is a large batch, else None (score with the packed arrays)
+        estimator = getattr(self, 'estimator', None)
+        if estimator is not None and len(X) > self.max_compiled_rows:
+            return estimator
+        return None
+
+    def apply(self, X):
+        # Return the leaf reached in every tree, shape (n_rows, n_trees)
+        # sklearn evaluates trees in float32, so do the same to match its splits exactly
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(len(X))[:, np.newaxis]
+        nodes = np.broadcast_to(self._roots, (len(X), len(self._roots)))
+        for _ in range(int(self._max_depth)):
+            values = X[rows, self._feature[nodes]]
+            go_left = values <= self._threshold[nodes]
+            go_left |= np.isnan(values) & self._missing_left[nodes]
+            nodes = np.where(go_left, self._left[nodes], self._right[nodes])
+        return nodes
+
+    def save(self, path):
+        np.savez(path, kind=np.array(self.kind), metadata=np.array(json.dumps(self.metadata)), **self.arrays)
+        return path
+
+
+class CompiledForestRegressor(CompiledForest):
+    kind = 'regressor'
+
+    @classmethod
+    def from_sklearn(cls, forest):
+        trees = [estimator.tree_ for estimator in forest.estimators_]
+        leaf_values = [tree.value[:, 0, 0].astype(np.float64) for tree in trees]
+        return cls(pack_trees(trees, leaf_values), {'n_features_in': int(forest.n_features_in_)}, forest)
+
+    def predict(self, X):
+        estimator = self.bulk_estimator(X)
+        if estimator is not None:
+            return estimator.predict(X)
+        return self._value[self.apply(X)].mean(axis=1)
+
+
+class CompiledForestClassifier(CompiledForest):
+    kind = 'classifier'
+
+    @classmethod
+    def from_sklearn(cls, forest):
+        trees = [estimator.tree_ for estimator in forest.estimators_]
+        # Leaf class distributions, normalized the same way as DecisionTreeClassifier.predict_proba
+        leaf_values = []
+        for tree in trees:
+            counts = tree.value[:, 0, :].astype(np.float64)
+            totals = counts.sum(axis=1, keepdims=True)
+            leaf_values.append(counts / np.where(totals == 0, 1.0, totals))
+        metadata = {'n_features_in': int(forest.n_features_in_), 'classes': forest.classes_.tolist()}
+        return cls(pack_trees(trees, leaf_values), metadata, forest)
+
+    @property
+    def classes_(self):
+        return np.array(self.metadata['classes'])
+
+    def predict_proba(self, X):
+        estimator = self.bulk_estimator(X)
+        if estimator is not None:
+            return estimator.predict_proba(X)
+        return self._value[self.apply(X)].mean(axis=1)
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+class CompiledIsolationForest(CompiledForest):
+    kind = 'isolation_forest'
+
+    @classmethod
+    def from_sklearn(cls, forest):
+        trees = [estimator.tree_ for estimator in forest.estimators_]
+        # Each leaf stores its full path length: depth plus the expected remaining depth
+        leaf_values = [_node_depths(tree) + average_path_length(tree.n_node_samples) for tree in trees]
+        metadata = {
+            'n_features_in': int(forest.n_features_in_),
+            'offset': float(forest.offset_),
+            'max_samples': int(forest.max_samples_),
+        }
+        return cls(pack_trees(trees, leaf_values, forest.estimators_features_), metadata, forest)
+
+    def score_samples(self, X):
+        estimator = self.bulk_estimator(X)
+        if estimator is not None:
+            # sklearn's offset_ equals metadata['offset'], so decision_function stays consistent
+            return estimator.score_samples(X)
+        depths = self._value[self.apply(X)].sum(axis=1)
+        denominator = self._roots.shape[0] * average_path_length([self.metadata['max_samples']])[0]
+        return -(2 ** (-depths / denominator))
+
+    def decision_function(self, X):
+        return self.score_samples(X) - self.metadata['offset']
+
+    def predict(self, X):
+        return np.where(self.decision_function(X) < 0, -1, 1)
+
+    def score(self, X):
+        # Anomaly scores and labels from a single pass over the forest
+        scores = self.decision_function(X)
+        return scores, (scores < 0).astype(int)
+
+
+COMPILED_KINDS = {cls.kind: cls for cls in (CompiledForestRegressor, CompiledForestClassifier, CompiledIsolationForest)}
+
+
+# Compile a fitted sklearn forest into the matching packed scorer
+def compile_forest(forest):
+    name = type(forest).__name__
+    if name == 'IsolationForest':
+        return CompiledIsolationForest.from_sklearn(forest)
+    if name in ('RandomForestClassifier', 'ExtraTreesClassifier'):
+        return CompiledForestClassifier.from_sklearn(forest)
+    if name in ('RandomForestRegressor', 'ExtraTreesRegressor'):
+        if forest.n_outputs_ != 1:
+            raise ValueError("Only single-output forest regressors can be compiled")
+        return CompiledForestRegressor.from_sklearn(forest)
+    raise ValueError(f"Unsupported model for compilation: {name}")
+
+
+def load_compiled_forest(path):
+    with np.load(path) as data:
+        kind = str(data['kind'])
+        metadata = json.loads(str(data['metadata']))
+        arrays = {name: data[name] for name in data.files if name not in ('kind', 'metadata')}
+    return COMPILED_KINDS[kind](arrays, metadata)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export fitted sklearn forests to packed node arrays")
+    parser.add_argument('model_path', help='joblib file with a fitted forest')
+    parser.add_argument('output_path', help='.npz file to write')
+    parser.add_argument('--check-csv', help='CSV with the feature columns, to compare outputs and latency')
+    args = parser.parse_args()
+
+    forest = joblib.load(args.model_path)
+    compiled = compile_forest(forest)
+    compiled.save(args.output_path)
+    print(f"Exported {args.model_path} to {args.output_path}")
+
+    if args.check_csv:
+        import pandas as pd
+        df = pd.read_csv(args.check_csv)
+        columns = getattr(forest, 'feature_names_in_', None)
+        X = df[list(columns)].to_numpy() if columns is not None else df.select_dtypes('number').to_numpy()[:, :compiled.n_features_in_]
+        method = 'decision_function' if compiled.kind == 'isolation_forest' else 'predict'
+        expected = getattr(forest, method)(X)
+        actual = getattr(compiled, method)(X)
+        matches = np.allclose(expected, actual) if compiled.kind != 'classifier' else np.array_equal(expected, actual)
+        print(f"Outputs {'match' if matches else 'DIFFER'} on {len(X)} rows")
+
+        for name, model in (('sklearn', forest), ('compiled', compiled)):
+            start = time.perf_counter()
+            for i in range(50):
+                getattr(model, method)(X[i:i + 1])
+            print(f"{name}: {(time.perf_counter() - start) / 50 * 1000:.2f} ms per single-row call")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,8 @@
 import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
+import bisect
 import random
-import matplotlib.pyplot as plt
-
-# Set random seed for reproducibility
-np.random.seed(42)
 
 # Number of data points to generate (hourly readings for 90 days)
 n_samples = 24 * 90
@@ -14,9 +11,14 @@ n_samples = 24 * 90
 start_date = datetime(2025, 1, 1, 0, 0, 0)
 
 # Function to generate normal operating data
-def generate_normal_data(n_samples):
+def generate_normal_data(n_samples, start=start_date, start_hours=5000, tool_usage=None):
+    """
+    start_hours: cumulative machine hours before the first sample
+    tool_usage: tool usage of the previous hour, to continue an earlier chunk
+    (None starts a fresh tool at 0)
+    """
     data = {
-        "timestamp": [start_date + timedelta(hours=i) for i in range(n_samples)],
+        "timestamp": [start + timedelta(hours=i) for i in range(n_samples)],
         "vibration_rms": np.random.normal(0.8, 0.15, n_samples),              # g (gravitational force)
         "motor_temp_C": np.random.normal(65, 4, n_samples),                  # Celsius
         "spindle_current_A": np.random.normal(15, 1.5, n_samples),             # Amperes
@@ -34,7 +36,7 @@ def generate_normal_data(n_samples):
     current_day = data["timestamp"][0].day
     daily_hours = random.uniform(6, 15)
     
-    cumulative_hours = 5000  # Start with some existing hours
+    cumulative_hours = start_hours  # Start with some existing hours
     
     for i in range(n_samples):
         day = data["timestamp"][i].day
@@ -49,10 +51,11 @@ def generate_normal_data(n_samples):
         data["total_machine_hours"][i] = cumulative_hours
     
     # Tool usage increases over time, resetting after maintenance
-    tool_usage = 0
+    continues_tool = tool_usage is not None
+    tool_usage = tool_usage if continues_tool else 0
     for i in range(n_samples):
         # Tool usage increases with time
-        if i > 0:
+        if i > 0 or continues_tool:
             # Reset tool usage periodically (simulating tool change)
             if tool_usage > 4000:
                 tool_usage = 0
@@ -63,9 +66,6 @@ def generate_normal_data(n_samples):
     
     return pd.DataFrame(data)
 
-# Generate base normal data
-df = generate_normal_data(n_samples)
-
 # Define anomaly types and their impact on sensor readings
 anomaly_types = {
     "tool_wear": {
@@ -106,66 +106,86 @@ anomaly_types = {
     }
 }
 
+# Map health scores to days until maintenance
+def days_to_maintenance_from_health(health):
+    # Lower health = fewer days to maintenance; below 40, one day per 10 health points
+    return np.select(
+        [health > 80, health > 60, health > 40],
+        [30, 20, 10],
+        default=np.maximum(0, (health / 10).astype(int))
+    ).astype(float)
+
 # Generate health score and maintenance requirements
-def generate_health_and_maintenance(df):
+def generate_health_and_maintenance(df, state=None):
     """
     Generate health scores and maintenance days with clear patterns:
     1. Health decreases over time
     2. Maintenance days are directly related to health (low health = maintenance needed soon)
     3. After maintenance, health improves
+    4. state (optional) carries health and the hours since the last maintenance from one
+       call to the next when a long history is generated in chunks; it is updated in place
     """
+    n = len(df)
+    
     # Initialize columns
-    df['machine_health_score'] = np.zeros(len(df))
-    df['days_to_maintenance'] = np.zeros(len(df))
-    df['is_anomaly'] = np.zeros(len(df))
+    df['machine_health_score'] = np.zeros(n)
+    df['days_to_maintenance'] = np.zeros(n)
+    df['is_anomaly'] = np.zeros(n)
     df['anomaly_type'] = 'normal'
-    df['anomaly_severity'] = np.zeros(len(df))
+    df['anomaly_severity'] = np.zeros(n)
     
     # Base degradation model: machine health decreases over time
-    # Start with full health
-    current_health = 100.0
+    # Start with full health, or where the previous chunk left off
+    state = {} if state is None else state
+    start_health = state.get('health', 100.0)
+    hours_since_maintenance = state.get('hours_since_maintenance', 0)
     
     # Health degrades with usage
     health_decay_per_hour = 0.02
     
-    # Maintenance schedule - approximately every 30 days
+    # Maintenance schedule - approximately every 30 days since the last one, over the whole span
+    # (3 maintenance events in 90 days)
     maintenance_points = []
-    for i in range(1, 4):  # 3 maintenance events in 90 days
+    n_events = max(3, int(np.ceil((n + hours_since_maintenance) / (30 * 24))))
+    for i in range(1, n_events + 1):
         day = i * 30 + random.randint(-5, 5)  # Add some randomness
         hour = random.randint(0, 23)
-        maintenance_points.append(day * 24 + hour)
-    
-    # Set initial health scores based on natural degradation
-    for i in range(len(df)):
-        if i > 0:
-            # Natural health degradation
-            usage_factor = 1.0 + (df.loc[i, 'total_machine_hours'] - df.loc[i-1, 'total_machine_hours']) / 1000
-            current_health -= health_decay_per_hour * usage_factor
-            
-            # Health can't go below 20 just from normal usage
-            current_health = max(20, current_health)
-        
-        # Set health score
-        df.loc[i, 'machine_health_score'] = current_health
-        
-        # Calculate days to maintenance based on health score
-        # Lower health = fewer days to maintenance
-        if current_health > 80:
-            days_to_maint = 30  # If health is good, maintenance is far away
-        elif current_health > 60:
-            days_to_maint = 20
-        elif current_health > 40:
-            days_to_maint = 10
-        else:
-            days_to_maint = max(0, int(current_health / 10))
-        
-        df.loc[i, 'days_to_maintenance'] = days_to_maint
-        
-        # Check if this is a maintenance point
-        if i in maintenance_points:
-            # After maintenance, health improves significantly
-            current_health = 100.0  # Reset to full health
-            df.loc[i, 'days_to_maintenance'] = 30  # Reset maintenance days
+        maintenance_points.append(max(0, day * 24 + hour - hours_since_maintenance))
+    
+    # Natural health degradation per hour (nothing is lost at the first reading)
+    total_hours = df['total_machine_hours'].to_numpy(dtype=float)
+    usage_factor = 1.0 + np.diff(total_hours, prepend=total_hours[:1]) / 1000
+    decay = health_decay_per_hour * usage_factor
+    decay[0] = 0.0
+    cumulative_decay = np.cumsum(decay)
+    
+    # After maintenance, health restarts from full, so each reading only counts
+    # the decay accumulated since the last maintenance point strictly before it
+    is_maintenance = np.zeros(n, dtype=bool)
+    is_maintenance[[p for p in maintenance_points if 0 <= p < n]] = True
+    last_maintenance = np.maximum.accumulate(np.where(is_maintenance, np.arange(n), 0))
+    previous_maintenance = np.concatenate(([0], last_maintenance[:-1]))
+    maintained_before = np.concatenate(([False], np.maximum.accumulate(is_maintenance)[:-1]))
+    base_health = np.where(maintained_before, 100.0, start_health)
+    health = base_health - (cumulative_decay - cumulative_decay[previous_maintenance])
+    
+    # Health can't go below 20 just from normal usage
+    health[1:] = np.maximum(20, health[1:])
+    
+    # Where the next chunk continues from (one more hour of decay, at the last reading's rate)
+    if is_maintenance.any():
+        state['hours_since_maintenance'] = n - int(np.flatnonzero(is_maintenance)[-1])
+        state['health'] = 100.0 - (cumulative_decay[-1] - cumulative_decay[last_maintenance[-1]]) - decay[-1]
+    else:
+        state['hours_since_maintenance'] = hours_since_maintenance + n
+        state['health'] = health[-1] - decay[-1]
+    state['health'] = max(20.0, state['health'])
+    
+    # Set health score and days to maintenance
+    df['machine_health_score'] = health
+    days_to_maint = days_to_maintenance_from_health(health)
+    days_to_maint[is_maintenance] = 30  # Reset maintenance days
+    df['days_to_maintenance'] = days_to_maint
     
     # Add some noise to make it more realistic
     df['machine_health_score'] += np.random.normal(0, 1, len(df))
@@ -173,8 +193,32 @@ def generate_health_and_maintenance(df):
     
     return df
 
-# Apply base health and maintenance patterns
-df = generate_health_and_maintenance(df)
+# Sorted, non-overlapping [start, end) intervals with O(log n) overlap queries
+class IntervalIndex:
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+    
+    def overlaps(self, start, end):
+        # The interval starting last before `end` is the only one that can reach past `start`
+        k = bisect.bisect_left(self.starts, end)
+        return k > 0 and self.ends[k - 1] > start
+    
+    def add(self, start, end):
+        k = bisect.bisect_left(self.starts, start)
+        self.starts.insert(k, start)
+        self.ends.insert(k, end)
+
+# Map post-anomaly health scores to days until maintenance
+def anomaly_days_to_maintenance(health):
+    return np.select(
+        [health > 80, health > 60, health > 40, health > 20, health > 10],
+        [30, 20, 10, 5, 2],
+        default=0
+    ).astype(float)
+
+# Random start positions tried per anomaly sequence before it is dropped
+MAX_PLACEMENT_ATTEMPTS = 1000
 
 # Function to introduce anomalies
 def introduce_anomalies(df, anomaly_percentage=0.15):
@@ -182,6 +226,8 @@ def introduce_anomalies(df, anomaly_percentage=0.15):
     Introduces anomalies with progressive deterioration patterns,
     ensuring clear correlations between anomalies, health scores,
     and maintenance requirements.
+    On short frames the 48-hour gaps may leave no room for every sequence; a sequence
+    with no free slot after MAX_PLACEMENT_ATTEMPTS tries is dropped.
     """
     # Calculate how many anomaly sequences to generate
     total_hours = len(df)
@@ -203,8 +249,18 @@ def introduce_anomalies(df, anomaly_percentage=0.15):
     # Shuffle to get more realistic distribution
     random.shuffle(sequences)
     
+    # Work on plain arrays and write the columns back once at the end
+    is_anomaly = df['is_anomaly'].to_numpy(dtype=float).copy()
+    anomaly_type_col = df['anomaly_type'].to_numpy(dtype=object).copy()
+    anomaly_severity = df['anomaly_severity'].to_numpy(dtype=float).copy()
+    health_score = df['machine_health_score'].to_numpy(dtype=float).copy()
+    days_to_maintenance = df['days_to_maintenance'].to_numpy(dtype=float).copy()
+    metrics = {}
+    
+    # Placed anomalies, to check overlaps without rescanning the frame
+    placed = IntervalIndex()
+    
     # Now place these sequences in the dataset
-    hours_used = 0
     for seq_length in sequences:
         # Choose an anomaly type
         anomaly_type = random.choice(list(anomaly_types.keys()))
@@ -214,136 +270,171 @@ def introduce_anomalies(df, anomaly_percentage=0.15):
         start_pos = random.randint(48, len(df) - seq_length - 48)
         
         # Ensure we don't overlap with existing anomalies (keep at least 48 hours apart)
-        while any(df.iloc[max(0, start_pos-48):min(len(df), start_pos+seq_length+48)]['is_anomaly'] > 0):
+        def blocked(start_pos):
+            return placed.overlaps(max(0, start_pos - 48), min(len(df), start_pos + seq_length + 48))
+        attempts = 1
+        while blocked(start_pos) and attempts < MAX_PLACEMENT_ATTEMPTS:
             start_pos = random.randint(48, len(df) - seq_length - 48)
+            attempts += 1
+        if blocked(start_pos):
+            # No room left for this sequence
+            continue
+        end_pos = start_pos + seq_length
+        placed.add(start_pos, end_pos)
         
         # Generate a progressive deterioration pattern
         progression_rate = anomaly_config["progression_rate"]
         severity_impact = anomaly_config["severity_impact"]
         
-        # Apply the anomaly with increasing severity
-        for i in range(seq_length):
-            pos = start_pos + i
-            
-            # Calculate severity - starts small and grows
-            base_severity = min(1.0, (i / seq_length) * progression_rate)
-            # Add some noise to severity
-            severity = base_severity + np.random.normal(0, 0.05)
-            severity = max(0.1, min(1.0, severity))
-            
-            # Mark as anomaly
-            df.loc[pos, 'is_anomaly'] = 1
-            df.loc[pos, 'anomaly_type'] = anomaly_type
-            df.loc[pos, 'anomaly_severity'] = severity
-            
-            # Apply changes to affected metrics based on severity
-            for metric, multiplier in anomaly_config.items():
-                if metric in df.columns and metric not in ['severity_impact', 'progression_rate']:
-                    if anomaly_type == "tool_break" and metric == "cutting_force_N" and severity > 0.7:
-                        # Special case: when tool breaks completely, cutting force drops
-                        df.loc[pos, metric] = df.loc[pos, metric] * 0.4
-                    else:
-                        # Apply a proportional effect based on severity
-                        effect = 1.0 + (multiplier - 1.0) * severity
-                        df.loc[pos, metric] = df.loc[pos, metric] * effect
-            
-            # Impact on health score - more severe anomalies reduce health more
-            health_impact = -50 * severity * severity_impact
-            df.loc[pos, 'machine_health_score'] += health_impact
-            
-            # Ensure health score stays in range
-            df.loc[pos, 'machine_health_score'] = max(0, min(100, df.loc[pos, 'machine_health_score']))
-            
-            # Adjust days to maintenance based on new health score
-            current_health = df.loc[pos, 'machine_health_score']
-            if current_health > 80:
-                days_to_maint = 30
-            elif current_health > 60:
-                days_to_maint = 20
-            elif current_health > 40:
-                days_to_maint = 10
-            elif current_health > 20:
-                days_to_maint = 5
-            elif current_health > 10:
-                days_to_maint = 2
-            else:
-                days_to_maint = 0
-            
-            # Add some randomness to maintenance days
-            days_to_maint += np.random.normal(0, 1)
-            df.loc[pos, 'days_to_maintenance'] = max(0, min(30, days_to_maint))
+        # Noise for every hour: severity noise and maintenance-day noise, drawn in the
+        # same interleaved order as one hour at a time
+        noise = np.random.normal(0, 1, (seq_length, 2))
+        
+        # Calculate severity - starts small and grows
+        base_severity = np.minimum(1.0, (np.arange(seq_length) / seq_length) * progression_rate)
+        # Add some noise to severity
+        severity = np.clip(base_severity + 0.05 * noise[:, 0], 0.1, 1.0)
+        
+        # Mark as anomaly
+        is_anomaly[start_pos:end_pos] = 1
+        anomaly_type_col[start_pos:end_pos] = anomaly_type
+        anomaly_severity[start_pos:end_pos] = severity
+        
+        # Apply changes to affected metrics based on severity
+        for metric, multiplier in anomaly_config.items():
+            if metric in df.columns and metric not in ['severity_impact', 'progression_rate']:
+                if metric not in metrics:
+                    metrics[metric] = df[metric].to_numpy(dtype=float).copy()
+                # Apply a proportional effect based on severity
+                effect = 1.0 + (multiplier - 1.0) * severity
+                if anomaly_type == "tool_break" and metric == "cutting_force_N":
+                    # Special case: when tool breaks completely, cutting force drops
+                    effect = np.where(severity > 0.7, 0.4, effect)
+                metrics[metric][start_pos:end_pos] *= effect
+        
+        # Impact on health score - more severe anomalies reduce health more
+        health_impact = -50 * severity * severity_impact
+        # Ensure health score stays in range
+        current_health = np.clip(health_score[start_pos:end_pos] + health_impact, 0, 100)
+        health_score[start_pos:end_pos] = current_health
+        
+        # Adjust days to maintenance based on new health score, with some randomness
+        days_to_maint = anomaly_days_to_maintenance(current_health) + noise[:, 1]
+        days_to_maintenance[start_pos:end_pos] = np.clip(days_to_maint, 0, 30)
+    
+    df['is_anomaly'] = is_anomaly
+    df['anomaly_type'] = anomaly_type_col
+    df['anomaly_severity'] = anomaly_severity
+    df['machine_health_score'] = health_score
+    df['days_to_maintenance'] = days_to_maintenance
+    for metric, values in metrics.items():
+        df[metric] = values
     
     return df
 
-# Apply anomalies to the dataset
-df = introduce_anomalies(df)
-
 # Add more features that can help with prediction
-df["vibration_trend"] = df["vibration_rms"].rolling(window=24, min_periods=1).mean()
-df["motor_temp_trend"] = df["motor_temp_C"].rolling(window=24, min_periods=1).mean()
-df["power_efficiency"] = df["rpm"] / df["power_consumption_W"] * 1000  # Higher is better
-df["tool_wear_rate"] = df["tool_usage_min"].diff().fillna(0)  # Rate of tool wear
+def add_engineered_features(df, history=None):
+    """
+    Add the rolling/trend features used by the models.
+    history: optional preceding rows of the same machine (at least the last 23),
+    so a chunk's windows and diffs continue across the chunk boundary.
+    """
+    if history is not None and len(history):
+        n_history = len(history)
+        df = pd.concat([history, df], ignore_index=True)
+    else:
+        n_history = 0
+    
+    df["vibration_trend"] = df["vibration_rms"].rolling(window=24, min_periods=1).mean()
+    df["motor_temp_trend"] = df["motor_temp_C"].rolling(window=24, min_periods=1).mean()
+    df["power_efficiency"] = df["rpm"] / df["power_consumption_W"] * 1000  # Higher is better
+    df["tool_wear_rate"] = df["tool_usage_min"].diff().fillna(0)  # Rate of tool wear
+    
+    # In real data we'd use time series techniques for these, but for our sample:
+    df["vibration_std_24h"] = df["vibration_rms"].rolling(window=24, min_periods=1).std()
+    df["temp_rate_change"] = df["motor_temp_C"].diff().fillna(0)
+    df["current_stability"] = df["spindle_current_A"].rolling(window=12, min_periods=1).std()
+    
+    if n_history:
+        df = df.iloc[n_history:].reset_index(drop=True)
+    return df
+
+def main():
+    import matplotlib.pyplot as plt
+    
+    # Set random seeds for reproducibility
+    np.random.seed(42)
+    random.seed(42)
+    
+    df = generate_normal_data(n_samples)
+    
+    # Apply base health and maintenance patterns
+    df = generate_health_and_maintenance(df)
+    
+    # Apply anomalies to the dataset
+    df = introduce_anomalies(df)
+    
+    df = add_engineered_features(df)
+    
+    # Save the dataset to a CSV file
+    df.to_csv("cnc_machine_data_improved.csv", index=False)
 
-# In real data we'd use time series techniques for these, but for our sample:
-df["vibration_std_24h"] = df["vibration_rms"].rolling(window=24, min_periods=1).std()
-df["temp_rate_change"] = df["motor_temp_C"].diff().fillna(0)
-df["current_stability"] = df["spindle_current_A"].rolling(window=12, min_periods=1).std()
+    # Visualize the generated data to verify patterns
+    plt.figure(figsize=(15, 12))
 
-# Save the dataset to a CSV file
-df.to_csv("cnc_machine_data_improved.csv", index=False)
+    # Plot health scores
+    plt.subplot(3, 1, 1)
+    plt.plot(df['timestamp'], df['machine_health_score'])
+    plt.title('Machine Health Score Over Time')
+    plt.ylabel('Health Score')
+    plt.grid(True)
 
-# Visualize the generated data to verify patterns
-plt.figure(figsize=(15, 12))
+    # Plot days to maintenance
+    plt.subplot(3, 1, 2)
+    plt.plot(df['timestamp'], df['days_to_maintenance'])
+    plt.title('Days to Maintenance Over Time')
+    plt.ylabel('Days')
+    plt.grid(True)
 
-# Plot health scores
-plt.subplot(3, 1, 1)
-plt.plot(df['timestamp'], df['machine_health_score'])
-plt.title('Machine Health Score Over Time')
-plt.ylabel('Health Score')
-plt.grid(True)
+    # Plot anomaly occurrences
+    plt.subplot(3, 1, 3)
+    for anomaly_type in df['anomaly_type'].unique():
+        if anomaly_type != 'normal':
+            mask = df['anomaly_type'] == anomaly_type
+            plt.scatter(df.loc[mask, 'timestamp'], df.loc[mask, 'anomaly_severity'], 
+                        label=anomaly_type, alpha=0.7)
 
-# Plot days to maintenance
-plt.subplot(3, 1, 2)
-plt.plot(df['timestamp'], df['days_to_maintenance'])
-plt.title('Days to Maintenance Over Time')
-plt.ylabel('Days')
-plt.grid(True)
+    plt.title('Anomaly Occurrences and Severity')
+    plt.ylabel('Severity')
+    plt.legend()
+    plt.tight_layout()
+    plt.savefig('data_visualization.png')
 
-# Plot anomaly occurrences
-plt.subplot(3, 1, 3)
-for anomaly_type in df['anomaly_type'].unique():
-    if anomaly_type != 'normal':
-        mask = df['anomaly_type'] == anomaly_type
-        plt.scatter(df.loc[mask, 'timestamp'], df.loc[mask, 'anomaly_severity'], 
-                    label=anomaly_type, alpha=0.7)
+    print(f"Generated {len(df)} data points with {df['is_anomaly'].sum()} anomaly points")
+    print(f"Dataset saved to cnc_machine_data_improved.csv")
+    print(f"Visualizations saved to data_visualization.png")
 
-plt.title('Anomaly Occurrences and Severity')
-plt.ylabel('Severity')
-plt.legend()
-plt.tight_layout()
-plt.savefig('data_visualization.png')
+    # Dataset summary
+    print("\nDataset Summary:")
+    print(f"Date range: {df['timestamp'].min()} to {df['timestamp'].max()}")
+    print(f"Anomaly types: {df[df['is_anomaly']==1]['anomaly_type'].unique()}")
+    print(f"Health score range: {df['machine_health_score'].min():.1f} to {df['machine_health_score'].max():.1f}")
+    print(f"Days to maintenance range: {df['days_to_maintenance'].min():.1f} to {df['days_to_maintenance'].max():.1f}")
 
-print(f"Generated {len(df)} data points with {df['is_anomaly'].sum()} anomaly points")
-print(f"Dataset saved to cnc_machine_data_improved.csv")
-print(f"Visualizations saved to data_visualization.png")
+    # Display correlation between health score and days to maintenance
+    health_maint_corr = df['machine_health_score'].corr(df['days_to_maintenance'])
+    print(f"\nCorrelation between health score and days to maintenance: {health_maint_corr:.4f}")
 
-# Dataset summary
-print("\nDataset Summary:")
-print(f"Date range: {df['timestamp'].min()} to {df['timestamp'].max()}")
-print(f"Anomaly types: {df[df['is_anomaly']==1]['anomaly_type'].unique()}")
-print(f"Health score range: {df['machine_health_score'].min():.1f} to {df['machine_health_score'].max():.1f}")
-print(f"Days to maintenance range: {df['days_to_maintenance'].min():.1f} to {df['days_to_maintenance'].max():.1f}")
+    # Display percentage of anomalies
+    anomaly_percentage = df['is_anomaly'].mean() * 100
+    print(f"Percentage of anomalies in dataset: {anomaly_percentage:.2f}%")
 
-# Display correlation between health score and days to maintenance
-health_maint_corr = df['machine_health_score'].corr(df['days_to_maintenance'])
-print(f"\nCorrelation between health score and days to maintenance: {health_maint_corr:.4f}")
+    # Display anomaly type distribution
+    anomaly_counts = df[df['is_anomaly']==1]['anomaly_type'].value_counts()
+    print("\nAnomaly distribution:")
+    for anomaly_type, count in anomaly_counts.items():
+        print(f"- {anomaly_type}: {count} instances ({count/df['is_anomaly'].sum()*100:.1f}%)")
 
-# Display percentage of anomalies
-anomaly_percentage = df['is_anomaly'].mean() * 100
-print(f"Percentage of anomalies in dataset: {anomaly_percentage:.2f}%")
 
-# Display anomaly type distribution
-anomaly_counts = df[df['is_anomaly']==1]['anomaly_type'].value_counts()
-print("\nAnomaly distribution:")
-for anomaly_type, count in anomaly_counts.items():
-    print(f"- {anomaly_type}: {count} instances ({count/df['is_anomaly'].sum()*100:.1f}%)")
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+import argparse
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+import numpy as np
+
+from data_generation import (generate_normal_data, generate_health_and_maintenance,
+                             introduce_anomalies, add_engineered_features)
+
+# Rows carried into the next chunk so rolling windows (24h) and diffs continue across chunks
+HISTORY_ROWS = 23
+
+# Raw columns the engineered features are computed from
+RAW_COLUMNS = ['vibration_rms', 'motor_temp_C', 'spindle_current_A', 'rpm',
+               'tool_usage_min', 'power_consumption_W']
+
+
+# Seed derived from the fleet seed and the machine ID, so each machine can be regenerated on its own
+def machine_seed(fleet_seed, machine_id):
+    return int(np.random.SeedSequence([fleet_seed, machine_id]).generate_state(1)[0])
+
+
+def write_chunk(df, out_dir, machine_id, part, file_format):
+    machine_dir = os.path.join(out_dir, f'machine_id={machine_id:05d}')
+    os.makedirs(machine_dir, exist_ok=True)
+    path = os.path.join(machine_dir, f'part-{part:05d}.{file_format}')
+    if file_format == 'parquet':
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+    return path
+
+
+# Generate one machine's history chunk by chunk; only one chunk is held in memory
+def generate_machine(machine_id, days, chunk_days, start, out_dir, file_format, fleet_seed):
+    seed = machine_seed(fleet_seed, machine_id)
+    np.random.seed(seed)
+    random.seed(seed)
+
+    # Machines start with different amounts of prior use
+    start_hours = random.randint(0, 20000)
+    tool_usage = None
+    history = None
+    # Health and the last maintenance carry over, so chunk boundaries are invisible
+    health_state = {}
+    rows = 0
+    part = 0
+    remaining_hours = days * 24
+    chunk_start = start
+
+    chunk_hours = chunk_days * 24
+    while remaining_hours > 0:
+        # A short tail is folded into the last chunk so every chunk has room for anomalies
+        n_samples = remaining_hours if remaining_hours < 2 * chunk_hours else chunk_hours
+        df = generate_normal_data(n_samples, start=chunk_start, start_hours=start_hours, tool_usage=tool_usage)
+        df = generate_health_and_maintenance(df, state=health_state)
+        df = introduce_anomalies(df)
+        df = add_engineered_features(df, history=history)
+        df.insert(0, 'machine_id', machine_id)
+
+        write_chunk(df, out_dir, machine_id, part, file_format)
+
+        # Carry state into the next chunk
+        start_hours = df['total_machine_hours'].iloc[-1]
+        tool_usage = df['tool_usage_min'].iloc[-1]
+        history = df[RAW_COLUMNS].iloc[-HISTORY_ROWS:].reset_index(drop=True)
+        chunk_start += timedelta(hours=n_samples)
+        remaining_hours -= n_samples
+        rows += n_samples
+        part += 1
+
+    return machine_id, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic CNC data for a fleet of machines")
+    parser.add_argument('--machines', type=int, default=100, help='Number of machines')
+    parser.add_argument('--days', type=int, default=365, help='Days of hourly readings per machine')
+    parser.add_argument('--chunk-days', type=int, default=90,
+                        help='Days generated (and held in memory) at a time per machine')
+    parser.add_argument('--start-date', default='2025-01-01', help='First timestamp (YYYY-MM-DD)')
+    parser.add_argument('--out', default='fleet_data', help='Output directory, partitioned by machine_id')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv', help='Output file format')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Parallel worker processes')
+    parser.add_argument('--seed', type=int, default=42, help='Fleet seed; each machine derives its own')
+    args = parser.parse_args()
+
+    # Anomalies keep 48 clear hours on each side of every sequence; shorter spans
+    # may have no room left to place them
+    if args.chunk_days < 30 or args.days < 30:
+        parser.error('--days and --chunk-days must be at least 30')
+
+    start = datetime.strptime(args.start_date, '%Y-%m-%d')
+    os.makedirs(args.out, exist_ok=True)
+
+    print(f"Generating {args.machines} machines x {args.days} days with {args.workers} workers...")
+    started = time.perf_counter()
+    total_rows = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(generate_machine, machine_id, args.days, args.chunk_days, start,
+                                   args.out, args.format, args.seed)
+                   for machine_id in range(1, args.machines + 1)]
+        for done, future in enumerate(as_completed(futures), start=1):
+            machine_id, rows = future.result()
+            total_rows += rows
+            if done % max(1, args.machines // 20) == 0 or done == args.machines:
+                print(f"- {done}/{args.machines} machines done")
+
+    elapsed = time.perf_counter() - started
+    print(f"Generated {total_rows} rows in {elapsed:.1f}s ({total_rows / elapsed:.0f} rows/s)")
+    print(f"Dataset saved to {args.out}/")
+
+
+if __name__ == '__main__':
+    main()
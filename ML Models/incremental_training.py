@@ -0,0 +1,301 @@
+import argparse
+import os
+import sys
+import time
+import warnings
+from datetime import datetime
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.metrics import mean_squared_error
+warnings.filterwarnings('ignore')
+
+from train_pipeline import (MODEL_FILES, add_time_features, feature_columns, read_training_state, run_pipeline,
+                            save_models, time_steps, window_dataset, write_training_state)
+# train_pipeline puts Server/ on the import path
+from dataset_io import count_rows, is_columnar_dataset, read_frame
+
+# Updates the models in place with the rows appended to the dataset since the last training run:
+#   python incremental_training.py --data cnc_machine_data_improved.csv --models ./Server/static
+# A full run of train_pipeline.py writes the starting point (training_state.json); every update
+# continues from the row count recorded there. Exit status 2 means drift was found and a full
+# retrain is needed (or was run, with --retrain-on-drift).
+
+# Features compared for drift; hour and day_of_week depend on when a batch was recorded, not on the machine
+DRIFT_FEATURES = [name for name in feature_columns if name not in ('hour', 'day_of_week')]
+# Update entries kept in the training state
+MAX_UPDATE_HISTORY = 50
+
+
+# Rows start.. of an append-only dataset, with the time features added
+def read_new_rows(path, start):
+    if is_columnar_dataset(path):
+        df = read_frame(path, mmap=True).iloc[start:]
+    elif path.endswith('.parquet') or path.endswith('.feather'):
+        df = read_frame(path).iloc[start:]
+    else:
+        # Skip the old lines without parsing them
+        df = pd.read_csv(path, skiprows=range(1, start + 1), parse_dates=['timestamp'])
+    return add_time_features(df.reset_index(drop=True))
+
+
+def load_models(model_dir):
+    from tensorflow.keras.models import load_model
+    models = {}
+    for name, filename in MODEL_FILES.items():
+        path = os.path.join(model_dir, filename)
+        # The Keras file is needed to keep training; the .npz export is inference only
+        models[name] = load_model(path, compile=False) if name == 'lstm' else joblib.load(path)
+    return models
+
+
+# Scaled LSTM inputs for the context rows plus the new rows, and the positions of the new windows
+def lstm_windows(df, n_context, scalers):
+    """
+    df holds up to time_steps context rows followed by the new rows. A window is new when the
+    row it predicts is new. With a machine_id column, windows never span two machines.
+    Returns X, y aligned to window positions (as window_batches expects), and the window positions.
+    """
+    X = scalers['scaler_X'].transform(df[feature_columns]).astype(np.float32)
+    y = scalers['scaler_y'].transform(df['days_to_maintenance'].values.reshape(-1, 1)).astype(np.float32)
+    if 'machine_id' in df.columns:
+        order = np.argsort(df['machine_id'].values, kind='stable')
+        X, y = X[order], y[order]
+        machine_ids, is_new = df['machine_id'].values[order], order >= n_context
+    else:
+        machine_ids, is_new = np.zeros(len(df)), np.arange(len(df)) >= n_context
+
+    positions = []
+    for target in np.flatnonzero(is_new):
+        start = target - time_steps
+        if start >= 0 and machine_ids[start] == machine_ids[target]:
+            positions.append(start)
+    # Window i predicts row i + time_steps
+    return X, np.concatenate([y[time_steps:], np.zeros((time_steps, 1), dtype=np.float32)]), np.array(positions, dtype=np.int64)
+
+
+def lstm_rmse(model, X, y, positions, scaler_y):
+    if len(positions) == 0:
+        return None
+    y_pred = scaler_y.inverse_transform(model.predict(window_dataset(X, y, positions, 1024), verbose=0))
+    y_true = scaler_y.inverse_transform(y[np.sort(positions)])
+    return float(np.sqrt(mean_squared_error(y_true, y_pred)))
+
+
+def check_drift(models, new_df, windows, baseline, thresholds):
+    """
+    Decide whether the new rows can be absorbed incrementally or need a full retrain:
+    1. Feature drift: a feature's mean moved more than max_mean_shift standard deviations
+       from what the anomaly scaler has seen, or its variance changed by more than max_var_ratio
+    2. Scale drift: more than max_out_of_range of the new values fall outside the range the
+       LSTM scalers were fitted on (the scalers are never refitted incrementally)
+    3. Model drift: health or LSTM error on the new rows exceeds max_error_ratio times the
+       error recorded at the last full training
+    4. Size: the forests would grow past max_trees
+    """
+    reasons = []
+    scaler = models['scaler_anomaly']
+    drift_features = [name for name in DRIFT_FEATURES if name not in thresholds.get('ignore_features', ())]
+    positions = [feature_columns.index(name) for name in drift_features]
+    reference_mean, reference_var = scaler.mean_[positions], scaler.var_[positions]
+    reference_std = np.sqrt(np.where(reference_var > 0, reference_var, 1.0))
+
+    X_new = new_df[drift_features]
+    mean_shift = np.abs(X_new.mean().values - reference_mean) / reference_std
+    var_ratio = X_new.var().values / np.where(reference_var > 0, reference_var, 1.0)
+    shifted = [name for name, shift in zip(drift_features, mean_shift) if shift > thresholds['max_mean_shift']]
+    if shifted:
+        reasons.append(f"mean shift above {thresholds['max_mean_shift']} std in {shifted}")
+    if len(new_df) > 1:
+        spread = [name for name, ratio in zip(drift_features, var_ratio)
+                  if ratio > thresholds['max_var_ratio'] or ratio < 1 / thresholds['max_var_ratio']]
+        if spread:
+            reasons.append(f"variance changed more than {thresholds['max_var_ratio']}x in {spread}")
+
+    # MinMax-scaled LSTM inputs and target: values past the fitted range are extrapolated
+    scaler_X, scaler_y = models['scaler_X'], models['scaler_y']
+    out_of_range = ((X_new.values < scaler_X.data_min_[positions]) | (X_new.values > scaler_X.data_max_[positions])).mean(axis=0)
+    outside = [name for name, share in zip(drift_features, out_of_range) if share > thresholds['max_out_of_range']]
+    target = new_df['days_to_maintenance'].values
+    if np.mean((target < scaler_y.data_min_[0]) | (target > scaler_y.data_max_[0])) > thresholds['max_out_of_range']:
+        outside.append('days_to_maintenance')
+    if outside:
+        reasons.append(f"more than {thresholds['max_out_of_range']:.0%} of values outside the scaler range in {outside}")
+
+    errors = {'health_rmse': float(np.sqrt(mean_squared_error(new_df['machine_health_score'],
+                                                              models['health'].predict(new_df[feature_columns]))))}
+    errors['lstm_rmse'] = lstm_rmse(models['lstm'], *windows, models['scaler_y'])
+    for name, error in errors.items():
+        reference = (baseline or {}).get(name)
+        if error is not None and reference and error > thresholds['max_error_ratio'] * reference:
+            reasons.append(f"{name} {error:.3f} is more than {thresholds['max_error_ratio']}x the baseline {reference:.3f}")
+
+    for name in ['iso_forest', 'health', 'type_classifier']:
+        if models[name].n_estimators + thresholds['new_trees'] > thresholds['max_trees']:
+            reasons.append(f"{name} would exceed {thresholds['max_trees']} trees")
+
+    return {'drift': bool(reasons), 'reasons': reasons, 'errors': errors,
+            'mean_shift': dict(zip(drift_features, mean_shift.round(3).tolist()))}
+
+
+# Fit new_trees more trees on the new rows only; the existing trees are kept as they are
+def add_trees(model, X, y, new_trees):
+    # IsolationForest.fit recomputes offset_ (the anomaly cutoff) from X alone, which would
+    # move the cutoff for every existing tree; keep the one from the full training set
+    offset = getattr(model, 'offset_', None)
+    model.set_params(warm_start=True, n_estimators=model.n_estimators + new_trees)
+    if y is None:
+        model.fit(X)
+    else:
+        model.fit(X, y)
+    model.set_params(warm_start=False)
+    if offset is not None:
+        model.offset_ = offset
+    return model
+
+
+def update_models(models, new_df, windows, options):
+    """
+    1. Scalers: left as they are; the existing trees and LSTM weights expect their scaling,
+       so scale changes go through check_drift and a full retrain instead
+    2. Forests: warm_start appends new_trees trees trained on the new rows
+    3. LSTM: fine-tuned for a few epochs on the new windows only, at a lower learning rate
+    Returns a summary of what changed.
+    """
+    summary = {}
+    X_new = new_df[feature_columns]
+
+    X_anomaly = pd.DataFrame(models['scaler_anomaly'].transform(X_new))
+    X_anomaly = X_anomaly.fillna(X_anomaly.mean()).values
+    add_trees(models['iso_forest'], X_anomaly, None, options['new_trees'])
+    add_trees(models['health'], X_new, new_df['machine_health_score'].values, options['new_trees'])
+    summary['trees'] = {'iso_forest': models['iso_forest'].n_estimators, 'health': models['health'].n_estimators}
+
+    # New trees must predict the same classes as the old ones, so the classifier only grows
+    # when every known anomaly type is present in the new rows
+    anomalies = new_df[new_df['is_anomaly'] == 1]
+    if set(anomalies['anomaly_type']) == set(models['type_classifier'].classes_):
+        add_trees(models['type_classifier'], anomalies[feature_columns], anomalies['anomaly_type'], options['new_trees'])
+        summary['trees']['type_classifier'] = models['type_classifier'].n_estimators
+    else:
+        summary['type_classifier'] = 'skipped: not every anomaly type is present in the new rows'
+
+    X, y, positions = windows
+    if len(positions) >= options['min_windows']:
+        summary['lstm'] = finetune_lstm(models, X, y, positions, options)
+    else:
+        summary['lstm'] = f"skipped: {len(positions)} new windows (minimum {options['min_windows']})"
+    return summary
+
+
+def finetune_lstm(models, X, y, positions, options):
+    import tensorflow as tf
+    from tensorflow.keras.callbacks import EarlyStopping
+    from tensorflow.keras.optimizers import Adam
+    tf.random.set_seed(42)
+
+    # The last 15% of the new windows (in time) validate the fine-tuning
+    positions = np.sort(positions)
+    n_fit = max(1, int(len(positions) * (1 - 0.15)))
+    fit_positions, val_positions = positions[:n_fit], positions[n_fit:]
+    model = models['lstm']
+    model.compile(optimizer=Adam(learning_rate=options['learning_rate']), loss='mse')
+    train_ds = window_dataset(X, y, fit_positions, options['batch_size'], options['shuffle_buffer'])
+    val_ds = window_dataset(X, y, val_positions, options['batch_size']) if len(val_positions) else None
+    history = model.fit(train_ds, validation_data=val_ds, epochs=options['epochs'], verbose=options['verbose'],
+                        callbacks=[EarlyStopping(monitor='val_loss', patience=2, restore_best_weights=True)]
+                        if val_ds is not None else [])
+    return {'windows': len(positions), 'epochs': len(history.history['loss']),
+            'loss': float(history.history['loss'][-1])}
+
+
+def run_incremental_update(data_path, model_dir, thresholds, options, retrain_on_drift=False, dry_run=False):
+    state = read_training_state(model_dir)
+    if state is None:
+        raise FileNotFoundError(f"No training state in {model_dir}; run train_pipeline.py first")
+    if state['data_path'] != os.path.abspath(data_path):
+        raise ValueError(f"Models were trained on {state['data_path']}, not {os.path.abspath(data_path)}")
+
+    n_rows = count_rows(data_path)
+    rows_seen = state['rows_seen']
+    if n_rows < rows_seen:
+        raise ValueError(f"{data_path} has {n_rows} rows but {rows_seen} were already used; "
+                         f"the dataset was rewritten, run a full retrain")
+    if n_rows - rows_seen < options['min_rows']:
+        print(f"Only {n_rows - rows_seen} new rows (minimum {options['min_rows']}), nothing to do")
+        return {'status': 'up to date', 'new_rows': n_rows - rows_seen}
+
+    # Keep time_steps rows before the new ones, so the first new rows get full LSTM windows
+    n_context = min(rows_seen, time_steps)
+    frame = read_new_rows(data_path, rows_seen - n_context)
+    new_df = frame.iloc[n_context:]
+    print(f"Loaded {len(new_df)} new rows (rows {rows_seen}..{n_rows - 1})")
+
+    models = load_models(model_dir)
+    windows = lstm_windows(frame, n_context, models)
+    drift = check_drift(models, new_df, windows, state.get('baseline'), thresholds)
+    print(f"Errors on the new rows: {drift['errors']}")
+
+    update = {'at': datetime.now().isoformat(timespec='seconds'), 'rows': [rows_seen, n_rows],
+              'errors': drift['errors']}
+    if drift['drift']:
+        print("Drift detected, a full retrain is needed:")
+        for reason in drift['reasons']:
+            print(f"  - {reason}")
+        if retrain_on_drift and not dry_run:
+            run_pipeline(data_path, model_dir, force=['all'])
+            return {'status': 'retrained', 'reasons': drift['reasons']}
+        return {'status': 'drift', 'reasons': drift['reasons'], 'mean_shift': drift['mean_shift']}
+    if dry_run:
+        return {'status': 'no drift', 'errors': drift['errors']}
+
+    start = time.perf_counter()
+    update['summary'] = update_models(models, new_df, windows, options)
+    manifest = save_models(models, model_dir)
+    update['bundle_version'] = manifest['version']
+    update['seconds'] = time.perf_counter() - start
+
+    state['rows_seen'] = n_rows
+    state['bundle_version'] = manifest['version']
+    state['updates'] = (state.get('updates', []) + [update])[-MAX_UPDATE_HISTORY:]
+    write_training_state(model_dir, state)
+    print(f"Updated models in {update['seconds']:.1f}s, bundle {manifest['version']}: {update['summary']}")
+    return {'status': 'updated', **update}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Update the trained models with newly appended rows")
+    parser.add_argument('--data', default=os.getenv('DATASET_PATH', 'cnc_machine_data_improved.csv'),
+                        help="The append-only dataset the models were trained on")
+    parser.add_argument('--models', default='.', help="Directory written by train_pipeline.py")
+    parser.add_argument('--new-trees', type=int, default=20, help="Trees added to each forest per update")
+    parser.add_argument('--max-trees', type=int, default=1000, help="Retrain once a forest would grow past this")
+    parser.add_argument('--epochs', type=int, default=5, help="LSTM fine-tuning epochs")
+    parser.add_argument('--learning-rate', type=float, default=1e-4, help="LSTM fine-tuning learning rate")
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--min-rows', type=int, default=100, help="Skip the update with fewer new rows")
+    parser.add_argument('--max-mean-shift', type=float, default=1.0, help="In reference standard deviations")
+    parser.add_argument('--max-var-ratio', type=float, default=4.0)
+    parser.add_argument('--max-out-of-range', type=float, default=0.05,
+                        help="Share of new values allowed outside the LSTM scalers' fitted range")
+    parser.add_argument('--max-error-ratio', type=float, default=1.5, help="New-row error vs the training baseline")
+    parser.add_argument('--ignore-features', default='',
+                        help="Comma-separated features left out of the drift check, e.g. ever-growing counters")
+    parser.add_argument('--retrain-on-drift', action='store_true', help="Run train_pipeline.py when drift is found")
+    parser.add_argument('--dry-run', action='store_true', help="Only run the drift check")
+    args = parser.parse_args()
+
+    thresholds = {'max_mean_shift': args.max_mean_shift, 'max_var_ratio': args.max_var_ratio,
+                  'max_error_ratio': args.max_error_ratio,
+                  'max_out_of_range': args.max_out_of_range, 'max_trees': args.max_trees, 'new_trees': args.new_trees,
+                  'ignore_features': [name for name in args.ignore_features.split(',') if name]}
+    options = {'new_trees': args.new_trees, 'epochs': args.epochs, 'learning_rate': args.learning_rate,
+               'batch_size': args.batch_size, 'shuffle_buffer': 8192, 'min_rows': args.min_rows,
+               'min_windows': 2, 'verbose': 2}
+    result = run_incremental_update(args.data, args.models, thresholds, options,
+                                    retrain_on_drift=args.retrain_on_drift, dry_run=args.dry_run)
+    sys.exit(2 if result['status'] in ('drift', 'retrained') else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -12,15 +12,22 @@ from tensorflow.keras.layers import Dense, LSTM, Dropout, GRU, Bidirectional
 from tensorflow.keras.optimizers import Adam
 from tensorflow.keras.callbacks import EarlyStopping
 import warnings
+import os
+import sys
 warnings.filterwarnings('ignore')
 
+# Shared helpers live with the server code
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Server'))
+from dataset_io import read_frame, write_frame
+from feature_schema import FEATURE_SCHEMA
+
 # Set seeds for reproducibility
 np.random.seed(42)
 tf.random.set_seed(42)
 
-# Load the dataset
+# Load the dataset (a CSV, or a columnar copy made with Server/dataset_io.py)
 print("Loading dataset...")
-df = pd.read_csv("cnc_machine_data_improved.csv")
+df = read_frame(os.getenv('DATASET_PATH', "cnc_machine_data_improved.csv"), mmap=False)
 
 # Convert timestamp to datetime
 df['timestamp'] = pd.to_datetime(df['timestamp'])
@@ -69,15 +76,8 @@ plt.tight_layout()
 plt.savefig('data_distributions.png')
 plt.close()
 
-# Select features for modeling
-feature_columns = [
-    'vibration_rms', 'motor_temp_C', 'spindle_current_A', 'rpm', 
-    'tool_usage_min', 'coolant_temp_C', 'cutting_force_N', 
-    'power_consumption_W', 'acoustic_level_dB', 'machine_hours_today',
-    'total_machine_hours', 'vibration_trend', 'motor_temp_trend',
-    'power_efficiency', 'tool_wear_rate', 'vibration_std_24h',
-    'temp_rate_change', 'current_stability', 'hour', 'day_of_week'
-]
+# Select features for modeling (shared with the server, see Server/feature_schema.py)
+feature_columns = FEATURE_SCHEMA.names
 
 # --------------------------
 # 1. Anomaly Detection Model
@@ -191,63 +191,21 @@ scaler_y = MinMaxScaler()
 X_maint_scaled = scaler_X.fit_transform(X_maint)
 y_maint_scaled = scaler_y.fit_transform(y_maint.reshape(-1, 1))
 
-# Create sequences for LSTM with more context
-def create_sequences(X, y, time_steps=10):
-    Xs, ys = [], []
-    for i in range(len(X) - time_steps):
-        Xs.append(X[i:(i + time_steps)])
-        ys.append(y[i + time_steps])
-    return np.array(Xs), np.array(ys)
-
-# Define sequence length - increase for more context
-time_steps = 48  # Use 48 hours of data to predict maintenance
-
-# Create sequences
-X_seq, y_seq = create_sequences(X_maint_scaled, y_maint_scaled, time_steps)
-
-# Try stratified sampling with appropriate settings and fallback option
-try:
-    # Use quantile strategy and fewer bins
-    from sklearn.preprocessing import KBinsDiscretizer
-    discretizer = KBinsDiscretizer(n_bins=5, encode='ordinal', strategy='quantile')
-    y_binned = discretizer.fit_transform(y_seq).flatten()
-    
-    X_train_maint, X_test_maint, y_train_maint, y_test_maint = train_test_split(
-        X_seq, y_seq, test_size=0.2, random_state=42, stratify=y_binned
-    )
-    print("Using stratified sampling for train/test split.")
-except ValueError:
-    # Fall back to regular split
-    print("Warning: Stratified split failed. Using regular train_test_split instead.")
-    X_train_maint, X_test_maint, y_train_maint, y_test_maint = train_test_split(
-        X_seq, y_seq, test_size=0.2, random_state=42
-    )
-
-# Build improved LSTM model with more complex architecture
-def build_advanced_lstm_model(input_shape):
-    model = Sequential()
-    
-    # First LSTM layer with more units
-    model.add(Bidirectional(LSTM(128, return_sequences=True, input_shape=input_shape)))
-    model.add(Dropout(0.3))
-    
-    # Second LSTM layer
-    model.add(Bidirectional(LSTM(64, return_sequences=True)))
-    model.add(Dropout(0.3))
-    
-    # Third LSTM layer
-    model.add(LSTM(32))
-    model.add(Dropout(0.2))
-    
-    # Dense layers for prediction
-    model.add(Dense(32, activation='relu'))
-    model.add(Dense(16, activation='relu'))
-    model.add(Dense(1))
-    
-    # Use a lower learning rate for better convergence
-    optimizer = Adam(learning_rate=0.0005)
-    model.compile(optimizer=optimizer, loss='mse')
-    return model
+# Create sequences for LSTM with more context (shared with train_pipeline.py)
+# Window i covers rows i .. i + time_steps - 1 and predicts row i + time_steps, so the
+# targets are aligned to window positions; windows are only built batch by batch
+from train_pipeline import build_advanced_lstm_model, split_window_indices, time_steps, window_dataset
+# time_steps = 48: use 48 hours of data to predict maintenance
+y_seq = y_maint_scaled[time_steps:]
+
+# Split window positions, not windows: stratified on binned targets, with a plain split as fallback
+train_windows, test_windows = split_window_indices(y_seq, test_size=0.2)
+# The last 15% of the training windows validate, as validation_split=0.15 did
+n_fit = int(len(train_windows) * (1 - 0.15))
+train_ds = window_dataset(X_maint_scaled, y_seq, train_windows[:n_fit], 64, shuffle_buffer=8192)
+val_ds = window_dataset(X_maint_scaled, y_seq, train_windows[n_fit:], 64)
+
+# Improved LSTM model with more complex architecture
 
 # Set up early stopping with more patience
 early_stopping = EarlyStopping(
@@ -260,10 +218,9 @@ early_stopping = EarlyStopping(
 print("Training improved LSTM model for maintenance prediction...")
 lstm_model = build_advanced_lstm_model((time_steps, X_maint_scaled.shape[1]))
 lstm_history = lstm_model.fit(
-    X_train_maint, y_train_maint,
+    train_ds,  # batches of 64 windows
+    validation_data=val_ds,
     epochs=200,  # Increase epochs
-    batch_size=64,  # Larger batch size
-    validation_split=0.15,
     callbacks=[early_stopping],
     verbose=1
 )
@@ -279,10 +236,11 @@ plt.legend()
 plt.savefig('lstm_training_history.png')
 plt.close()
 
-# Evaluate LSTM model
-y_pred_maint_scaled = lstm_model.predict(X_test_maint)
+# Evaluate LSTM model (window_dataset yields the test windows in position order)
+test_windows = np.sort(test_windows)
+y_pred_maint_scaled = lstm_model.predict(window_dataset(X_maint_scaled, y_seq, test_windows, 1024))
 y_pred_maint = scaler_y.inverse_transform(y_pred_maint_scaled)
-y_test_maint_orig = scaler_y.inverse_transform(y_test_maint)
+y_test_maint_orig = scaler_y.inverse_transform(y_seq[test_windows])
 
 maint_mse = mean_squared_error(y_test_maint_orig, y_pred_maint)
 maint_rmse = np.sqrt(maint_mse)
@@ -420,23 +378,27 @@ joblib.dump(rf_health, 'health_score_predictor.pkl')
 
 # Save the LSTM model
 lstm_model.save('maintenance_predictor_lstm.h5')
+# Also export it for the NumPy-only runtime used by the server
+from lstm_runtime import export_lstm_model
+export_lstm_model(lstm_model, 'maintenance_predictor_lstm.npz')
 
 # Save scalers
 joblib.dump(scaler_anomaly, 'scaler_anomaly.pkl')
 joblib.dump(scaler_X, 'scaler_X_maint.pkl')
 joblib.dump(scaler_y, 'scaler_y_maint.pkl')
 
+# Package everything above into one versioned bundle for the server (see Server/model_bundle.py)
+from model_bundle import build_bundle
+bundle_manifest = build_bundle('.', 'model_bundle')
+print(f"Model bundle {bundle_manifest['version']} saved to model_bundle/")
+
 # Create a summary dataframe with all predictions for further analysis
 df_results = df.copy()
 df_results['predicted_days_to_maintenance'] = np.nan
 df_results['predicted_health_score'] = np.nan
 
-# Fill in predictions where available (not all rows due to sequence requirements)
-start_idx = time_steps
-for i in range(len(y_pred_maint)):
-    true_idx = i + start_idx + len(X_train_maint)
-    if true_idx < len(df_results):
-        df_results.loc[true_idx, 'predicted_days_to_maintenance'] = y_pred_maint[i][0]
+# Fill in predictions where available (the test windows; each predicts the row after it)
+df_results.loc[test_windows + time_steps, 'predicted_days_to_maintenance'] = y_pred_maint[:, 0]
 
 # Add health score predictions
 df_results['predicted_health_score'] = np.nan
@@ -445,7 +407,7 @@ test_indices = df.index[:-len(X_test_health)]
 df_results.loc[X_test_health.index, 'predicted_health_score'] = y_pred_health
 
 # Save the results dataframe
-df_results.to_csv('cnc_machine_predictions.csv', index=False)
+write_frame(df_results, os.getenv('PREDICTIONS_PATH', 'cnc_machine_predictions.csv'))
 
 print("\nAnalysis complete. Models and results saved successfully.")
 
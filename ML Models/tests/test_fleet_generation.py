@@ -0,0 +1,29 @@
+import multiprocessing
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from fleet_generation import generate_machine
+
+# Machines 110, 337 and 720 used to hang on a 30-day chunk with the default seed
+N_MACHINES = 400
+TIMEOUT_SECONDS = 300
+
+
+def generate_fleet(out_dir):
+    for machine_id in range(1, N_MACHINES + 1):
+        generate_machine(machine_id, 30, 30, datetime(2025, 1, 1), out_dir, 'csv', 42)
+
+
+def test_short_chunks_always_finish(tmp_path):
+    # Anomaly placement must give up on a full chunk instead of retrying forever
+    worker = multiprocessing.Process(target=generate_fleet, args=(str(tmp_path),))
+    worker.start()
+    worker.join(TIMEOUT_SECONDS)
+    if worker.is_alive():
+        worker.terminate()
+        worker.join()
+    assert worker.exitcode == 0, f"fleet generation did not finish within {TIMEOUT_SECONDS}s"
+    assert len(os.listdir(tmp_path)) == N_MACHINES
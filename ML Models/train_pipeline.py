@@ -0,0 +1,621 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import StandardScaler, MinMaxScaler, KBinsDiscretizer
+from sklearn.ensemble import IsolationForest, RandomForestRegressor, RandomForestClassifier
+from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, mean_squared_error, r2_score
+warnings.filterwarnings('ignore')
+
+# Shared helpers live with the server code
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Server'))
+from sequences import shuffled_window_batches, window_batches
+from dataset_io import SCHEMA_FILE, count_rows, is_columnar_dataset, read_frame, write_transformed_matrix
+from feature_schema import FEATURE_SCHEMA
+
+# Stage-by-stage version of models.py for repeatable runs:
+#   python train_pipeline.py --data cnc_machine_data_improved.csv --out ./static
+#   python train_pipeline.py --stages lstm --force lstm     # retrain only the LSTM
+# Finished stages are cached, so a failed or interrupted run only redoes what didn't finish.
+
+feature_columns = FEATURE_SCHEMA.names
+time_steps = 48
+
+# Stages and the stages whose output they use, in run order
+STAGE_DEPENDENCIES = {
+    'scalers': [],
+    'iso_forest': ['scalers'],
+    'type_classifier': [],
+    'health': [],
+    'maintenance_rf': ['scalers'],
+    'lstm': ['scalers'],
+}
+# Fitted on the thread pool while the LSTM trains in the main thread
+SKLEARN_STAGES = ['iso_forest', 'type_classifier', 'health', 'maintenance_rf']
+# Stages that stream the dataset from disk themselves instead of using the loaded frame
+STREAMING_STAGES = ['lstm']
+# Stages whose models are saved to the output directory and the model bundle
+EXPORTED_STAGES = ['scalers', 'iso_forest', 'type_classifier', 'health', 'lstm']
+
+
+def add_time_features(df):
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    df['hour'] = df['timestamp'].dt.hour
+    df['day_of_week'] = df['timestamp'].dt.dayofweek
+    return df
+
+
+def load_training_data(path):
+    return add_time_features(read_frame(path, mmap=False))
+
+
+# Identifies the dataset contents cheaply, by path, size and modification time
+def dataset_fingerprint(path):
+    stat_path = os.path.join(path, SCHEMA_FILE) if is_columnar_dataset(path) else path
+    stat = os.stat(stat_path)
+    return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+# Train/test split stratified on `stratify`, falling back to a plain split when a class is too small
+def split(X, y, test_size, stratify=None):
+    if stratify is not None:
+        try:
+            return train_test_split(X, y, test_size=test_size, random_state=42, stratify=stratify)
+        except ValueError:
+            print("Warning: Stratified split failed. Using regular train_test_split instead.")
+    return train_test_split(X, y, test_size=test_size, random_state=42)
+
+
+# --------------------------
+# Stages
+# --------------------------
+def fit_scalers(df, results, options):
+    X = df[feature_columns]
+    return {
+        'scaler_anomaly': StandardScaler().fit(X),
+        'scaler_X': MinMaxScaler().fit(X),
+        'scaler_y': MinMaxScaler().fit(df['days_to_maintenance'].values.reshape(-1, 1)),
+    }
+
+
+def train_iso_forest(df, results, options):
+    X = pd.DataFrame(results['scalers']['scaler_anomaly'].transform(df[feature_columns]))
+    X = X.fillna(X.mean()).values
+    X_train, X_test, y_train, y_test = split(X, df['is_anomaly'].values, test_size=0.2)
+
+    contamination = float(df['is_anomaly'].mean())
+    model = IsolationForest(n_estimators=200, max_samples='auto', contamination=contamination,
+                            random_state=42, n_jobs=options['n_jobs'])
+    model.fit(X_train)
+    # Training parallelism is not a property of the saved model
+    model.n_jobs = None
+
+    y_pred = (model.predict(X_test) == -1).astype(int)
+    return {'model': model, 'metrics': {
+        'contamination': contamination,
+        'test_accuracy': accuracy_score(y_test, y_pred),
+        'test_precision': precision_score(y_test, y_pred),
+        'test_recall': recall_score(y_test, y_pred),
+        'test_f1': f1_score(y_test, y_pred),
+    }}
+
+
+def train_type_classifier(df, results, options):
+    # Only anomalies are used to train the anomaly type classifier
+    anomaly_df = df[df['is_anomaly'] == 1]
+    X, y = anomaly_df[feature_columns], anomaly_df['anomaly_type']
+    X_train, X_test, y_train, y_test = split(X, y, test_size=0.3, stratify=y)
+
+    model = RandomForestClassifier(n_estimators=100, random_state=42, class_weight='balanced',
+                                   n_jobs=options['n_jobs'])
+    model.fit(X_train, y_train)
+    model.n_jobs = None
+    return {'model': model, 'metrics': {'accuracy': accuracy_score(y_test, model.predict(X_test))}}
+
+
+def train_health_regressor(df, results, options):
+    X_train, X_test, y_train, y_test = split(df[feature_columns], df['machine_health_score'].values, test_size=0.2)
+
+    model = RandomForestRegressor(n_estimators=100, random_state=42, n_jobs=options['n_jobs'])
+    model.fit(X_train, y_train)
+    model.n_jobs = None
+
+    y_pred = model.predict(X_test)
+    return {'model': model,
+            'metrics': {'rmse': float(np.sqrt(mean_squared_error(y_test, y_pred))), 'r2': r2_score(y_test, y_pred)},
+            'evaluation': {'y_test': y_test, 'y_pred': y_pred}}
+
+
+# Random Forest baseline for days to maintenance, compared against the LSTM (not exported)
+def train_maintenance_rf(df, results, options):
+    scalers = results['scalers']
+    X = scalers['scaler_X'].transform(df[feature_columns])
+    y = scalers['scaler_y'].transform(df['days_to_maintenance'].values.reshape(-1, 1))
+    X_train, X_test, y_train, y_test = split(X, y, test_size=0.2)
+
+    model = RandomForestRegressor(n_estimators=200, max_depth=20, min_samples_split=5, min_samples_leaf=2,
+                                  random_state=42, n_jobs=options['n_jobs'])
+    model.fit(X_train, y_train.ravel())
+    model.n_jobs = None
+
+    y_pred = scalers['scaler_y'].inverse_transform(model.predict(X_test).reshape(-1, 1))
+    y_test = scalers['scaler_y'].inverse_transform(y_test)
+    return {'model': model, 'metrics': {'rmse': float(np.sqrt(mean_squared_error(y_test, y_pred))),
+                                        'r2': r2_score(y_test, y_pred)}}
+
+
+# Bidirectional LSTM used for days-to-maintenance prediction
+def build_advanced_lstm_model(input_shape):
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import Dense, LSTM, Dropout, Bidirectional
+    from tensorflow.keras.optimizers import Adam
+    model = Sequential()
+
+    # First LSTM layer with more units
+    model.add(Bidirectional(LSTM(128, return_sequences=True, input_shape=input_shape)))
+    model.add(Dropout(0.3))
+
+    # Second LSTM layer
+    model.add(Bidirectional(LSTM(64, return_sequences=True)))
+    model.add(Dropout(0.3))
+
+    # Third LSTM layer
+    model.add(LSTM(32))
+    model.add(Dropout(0.2))
+
+    # Dense layers for prediction
+    model.add(Dense(32, activation='relu'))
+    model.add(Dense(16, activation='relu'))
+    model.add(Dense(1))
+
+    # Use a lower learning rate for better convergence
+    optimizer = Adam(learning_rate=0.0005)
+    model.compile(optimizer=optimizer, loss='mse')
+    return model
+
+
+# Window positions for the LSTM train/test split, stratified on binned targets where possible
+def split_window_indices(y_seq, test_size=0.2):
+    indices = np.arange(len(y_seq))
+    try:
+        y_binned = KBinsDiscretizer(n_bins=5, encode='ordinal', strategy='quantile').fit_transform(y_seq).flatten()
+    except ValueError:
+        y_binned = None
+    # Same permutation as splitting the windows themselves, without copying any of them
+    train_indices, test_indices, _, _ = split(indices, indices, test_size=test_size, stratify=y_binned)
+    return train_indices, test_indices
+
+
+# tf.data pipeline of (windows, targets) batches generated from X on demand
+def window_dataset(X, y, indices, batch_size, shuffle_buffer=None, seed=42):
+    import tensorflow as tf
+    epochs = itertools.count()
+
+    def generate():
+        if shuffle_buffer:
+            # Reshuffled every epoch, holding at most shuffle_buffer windows
+            return shuffled_window_batches(X, y, indices, time_steps, batch_size, shuffle_buffer,
+                                           seed=seed + next(epochs))
+        return window_batches(X, time_steps, batch_size, y=y, indices=np.sort(indices))
+
+    signature = (tf.TensorSpec((None, time_steps, X.shape[1]), tf.float32),
+                 tf.TensorSpec((None, y.shape[1]), tf.float32))
+    return tf.data.Dataset.from_generator(generate, output_signature=signature).prefetch(tf.data.AUTOTUNE)
+
+
+def train_lstm(df, results, options):
+    """
+    Trains out of core, so memory use does not grow with the dataset:
+    1. The scaled features and targets are written chunk by chunk to float32 .npy files
+       and memory-mapped
+    2. The train/validation/test splits are arrays of window positions; windows are only
+       built batch by batch, shuffled through a bounded buffer
+    """
+    import tensorflow as tf
+    from tensorflow.keras.callbacks import BackupAndRestore, EarlyStopping
+    np.random.seed(42)
+    tf.random.set_seed(42)
+
+    scalers = results['scalers']
+    inputs_dir = os.path.join(options['cache_dir'], 'lstm_inputs')
+    os.makedirs(inputs_dir, exist_ok=True)
+    X_path = write_transformed_matrix(options['data_path'], feature_columns, scalers['scaler_X'].transform,
+                                      os.path.join(inputs_dir, 'X_scaled.npy'), options['chunk_rows'])
+    y_path = write_transformed_matrix(options['data_path'], ['days_to_maintenance'], scalers['scaler_y'].transform,
+                                      os.path.join(inputs_dir, 'y_scaled.npy'), options['chunk_rows'])
+    X = np.load(X_path, mmap_mode='r')
+    # Each window of time_steps rows predicts the value right after it, so y is aligned to window positions
+    y = np.load(y_path, mmap_mode='r')[time_steps:]
+
+    train_indices, test_indices = split_window_indices(np.asarray(y))
+    # The last 15% of the training windows validate, as validation_split=0.15 would
+    n_fit = int(len(train_indices) * (1 - 0.15))
+    train_ds = window_dataset(X, y, train_indices[:n_fit], options['batch_size'], options['shuffle_buffer'])
+    val_ds = window_dataset(X, y, train_indices[n_fit:], options['batch_size'])
+
+    callbacks = [EarlyStopping(monitor='val_loss', patience=20, restore_best_weights=True)]
+    if options.get('backup_dir'):
+        # Saves progress every epoch; an interrupted run resumes from the last finished epoch
+        callbacks.append(BackupAndRestore(options['backup_dir']))
+
+    model = build_advanced_lstm_model((time_steps, X.shape[1]))
+    # BackupAndRestore needs the weights to exist before fit()
+    model.build((None, time_steps, X.shape[1]))
+    history = model.fit(train_ds, validation_data=val_ds, epochs=options['epochs'],
+                        callbacks=callbacks, verbose=options.get('verbose', 2))
+    if options.get('backup_dir'):
+        # Training finished; the next run with this key loads the cached stage instead
+        shutil.rmtree(options['backup_dir'], ignore_errors=True)
+
+    # window_dataset yields unshuffled windows in position order
+    test_indices = np.sort(test_indices)
+    y_pred = model.predict(window_dataset(X, y, test_indices, 1024), verbose=0)
+    y_pred = scalers['scaler_y'].inverse_transform(y_pred)
+    y_test = scalers['scaler_y'].inverse_transform(y[test_indices])
+    return {'model': model, 'history': history.history,
+            'metrics': {'rmse': float(np.sqrt(mean_squared_error(y_test, y_pred))), 'r2': r2_score(y_test, y_pred)},
+            'evaluation': {'y_test': y_test, 'y_pred': y_pred}}
+
+
+TRAINERS = {
+    'scalers': fit_scalers,
+    'iso_forest': train_iso_forest,
+    'type_classifier': train_type_classifier,
+    'health': train_health_regressor,
+    'maintenance_rf': train_maintenance_rf,
+    'lstm': train_lstm,
+}
+
+
+# Options that change a stage's result; anything else (n_jobs, plots, verbosity) doesn't
+def stage_params(name, options):
+    if name == 'lstm':
+        return {'epochs': options['epochs'], 'batch_size': options['batch_size'], 'time_steps': time_steps,
+                'shuffle_buffer': options['shuffle_buffer']}
+    return {}
+
+
+def stage_key(name, params, fingerprint, dependency_keys):
+    payload = json.dumps({
+        'stage': name,
+        'params': params,
+        'data': fingerprint,
+        'dependencies': dependency_keys,
+        'features': feature_columns,
+        'sklearn_version': sklearn.__version__,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+class StageCache:
+    """
+    Stage results on disk, one file per stage:
+    1. Each entry stores the key it was computed under; a different key is a miss
+    2. Keras models are saved next to the entry as <stage>.h5
+    3. Files are written under a temporary name and renamed, so a crash never leaves a partial entry
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, name, extension='joblib'):
+        return os.path.join(self.cache_dir, f'{name}.{extension}')
+
+    def load(self, name, key):
+        path = self._path(name)
+        if not os.path.exists(path):
+            return None
+        try:
+            entry = joblib.load(path)
+            if entry['key'] != key:
+                return None
+            result = entry['result']
+            if entry['keras_model']:
+                # Only used for prediction and export, so the optimizer state isn't needed
+                from tensorflow.keras.models import load_model
+                result['model'] = load_model(self._path(name, 'h5'), compile=False)
+            return result
+        except Exception as e:
+            print(f"Ignoring unreadable cache entry for {name}: {e}")
+            return None
+
+    def save(self, name, key, result):
+        result = dict(result)
+        keras_model = hasattr(result.get('model'), 'to_json')
+        if keras_model:
+            tmp_path = self._path(f'{name}.tmp', 'h5')
+            result.pop('model').save(tmp_path)
+            os.replace(tmp_path, self._path(name, 'h5'))
+        tmp_path = self._path(name, 'joblib.tmp')
+        joblib.dump({'key': key, 'result': result, 'keras_model': keras_model}, tmp_path)
+        os.replace(tmp_path, self._path(name))
+
+
+# Exported models and their file names, as models.py saves them
+MODEL_FILES = {
+    'iso_forest': 'isolation_forest_model.pkl',
+    'type_classifier': 'anomaly_type_classifier.pkl',
+    'health': 'health_score_predictor.pkl',
+    'lstm': 'maintenance_predictor_lstm.h5',
+    'scaler_anomaly': 'scaler_anomaly.pkl',
+    'scaler_X': 'scaler_X_maint.pkl',
+    'scaler_y': 'scaler_y_maint.pkl',
+}
+# Written next to the exported models; incremental_training.py continues from it
+TRAINING_STATE_FILE = 'training_state.json'
+
+
+# Save {name: model} under MODEL_FILES in out_dir, then build the server bundle from them
+def save_models(models, out_dir):
+    from lstm_runtime import export_lstm_model
+    from model_bundle import build_bundle
+    os.makedirs(out_dir, exist_ok=True)
+    for name, filename in MODEL_FILES.items():
+        path = os.path.join(out_dir, filename)
+        if name == 'lstm':
+            models[name].save(path)
+            # Also export it for the NumPy-only runtime used by the server
+            export_lstm_model(models[name], os.path.join(out_dir, 'maintenance_predictor_lstm.npz'))
+        else:
+            joblib.dump(models[name], path)
+    return build_bundle(out_dir, os.path.join(out_dir, 'model_bundle'))
+
+
+def export_models(results, out_dir):
+    models = {name: results[name]['model'] for name in ['iso_forest', 'type_classifier', 'health', 'lstm']}
+    models.update(results['scalers'])
+    return save_models(models, out_dir)
+
+
+def read_training_state(out_dir):
+    path = os.path.join(out_dir, TRAINING_STATE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_training_state(out_dir, state):
+    path = os.path.join(out_dir, TRAINING_STATE_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f, indent=2, default=float)
+    os.replace(path + '.tmp', path)
+
+
+# Figures for whatever stage results are available; matplotlib is only imported when asked for
+def save_plots(df, results, plot_dir):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    os.makedirs(plot_dir, exist_ok=True)
+
+    plt.figure(figsize=(15, 10))
+    plt.subplot(2, 2, 1)
+    sns.histplot(df['machine_health_score'], bins=20)
+    plt.title('Machine Health Score Distribution')
+    plt.subplot(2, 2, 2)
+    sns.histplot(df['days_to_maintenance'], bins=20)
+    plt.title('Days to Maintenance Distribution')
+    plt.subplot(2, 2, 3)
+    sns.scatterplot(x='machine_health_score', y='days_to_maintenance', hue='is_anomaly', data=df, alpha=0.5)
+    plt.title('Health Score vs Days to Maintenance')
+    plt.subplot(2, 2, 4)
+    sns.boxplot(x='anomaly_type', y='machine_health_score', data=df)
+    plt.title('Health Score by Anomaly Type')
+    plt.xticks(rotation=45)
+    plt.tight_layout()
+    plt.savefig(os.path.join(plot_dir, 'data_distributions.png'))
+    plt.close()
+
+    for name, title, filename in (('type_classifier', 'Feature Importance for Anomaly Type Classification',
+                                   'anomaly_type_feature_importance.png'),
+                                  ('health', 'Feature Importance for Health Score Prediction',
+                                   'health_score_feature_importance.png')):
+        if name not in results:
+            continue
+        importance = results[name]['model'].feature_importances_
+        indices = np.argsort(importance)[::-1][:15]
+        plt.figure(figsize=(12, 8))
+        plt.bar(range(len(indices)), importance[indices])
+        plt.xticks(range(len(indices)), [feature_columns[i] for i in indices], rotation=45)
+        plt.title(title)
+        plt.tight_layout()
+        plt.savefig(os.path.join(plot_dir, filename))
+        plt.close()
+
+    if 'health' in results:
+        evaluation = results['health']['evaluation']
+        plt.figure(figsize=(12, 8))
+        plt.scatter(evaluation['y_test'], evaluation['y_pred'])
+        bounds = [evaluation['y_test'].min(), evaluation['y_test'].max()]
+        plt.plot(bounds, bounds, 'r--', linewidth=2)
+        plt.title('Health Score Prediction: Actual vs Predicted')
+        plt.tight_layout()
+        plt.savefig(os.path.join(plot_dir, 'health_score_prediction.png'))
+        plt.close()
+
+    if 'lstm' in results:
+        history = results['lstm']['history']
+        plt.figure(figsize=(10, 6))
+        plt.plot(history['loss'], label='Training Loss')
+        plt.plot(history['val_loss'], label='Validation Loss')
+        plt.title('LSTM Training and Validation Loss')
+        plt.xlabel('Epochs')
+        plt.ylabel('Loss')
+        plt.legend()
+        plt.savefig(os.path.join(plot_dir, 'lstm_training_history.png'))
+        plt.close()
+
+        evaluation = results['lstm']['evaluation']
+        sorted_indices = np.argsort(evaluation['y_test'].flatten())
+        plt.figure(figsize=(12, 6))
+        plt.plot(evaluation['y_test'][sorted_indices][:100], label='Actual Days to Maintenance', linewidth=2)
+        plt.plot(evaluation['y_pred'][sorted_indices][:100], label='Predicted Days to Maintenance', linewidth=2, alpha=0.7)
+        plt.title('Maintenance Prediction: Actual vs Predicted (Sorted)')
+        plt.xlabel('Samples (Sorted by Actual Value)')
+        plt.ylabel('Days to Maintenance')
+        plt.legend()
+        plt.savefig(os.path.join(plot_dir, 'maintenance_prediction_sorted.png'))
+        plt.close()
+
+
+def run_pipeline(data_path, out_dir='.', stages=None, force=(), cache_dir=None, n_jobs=-1,
+                 epochs=200, batch_size=64, shuffle_buffer=8192, chunk_rows=65536,
+                 plot_dir=None, export=True, verbose=2):
+    """
+    Train the selected stages and export the models:
+    1. A stage whose cache key matches (same data, parameters and inputs) is loaded, not
+       retrained, unless it is listed in `force`; unselected stages are only loaded from the cache
+    2. Scalers are fitted first; the sklearn models then train on a thread pool while the
+       LSTM trains in this thread; n_jobs threads (-1: every core) are split between them
+    3. Every finished stage is cached at once, so a failing stage doesn't lose the others
+    Returns the report written to <out_dir>/training_report.json.
+    """
+    force = list(STAGE_DEPENDENCIES) if 'all' in force else list(force)
+    # Forcing a stage also selects it
+    stages = list(STAGE_DEPENDENCIES) if stages is None else list(stages) + force
+    cache = StageCache(cache_dir or os.path.join(out_dir, '.train_cache'))
+    # Up to four forests train at once next to the LSTM; giving each one every core would oversubscribe
+    total_jobs = (os.cpu_count() or 1) if n_jobs is None or n_jobs < 1 else n_jobs
+    concurrent_stages = [name for name in SKLEARN_STAGES + STREAMING_STAGES if name in stages]
+    stage_jobs = max(1, total_jobs // max(1, len(concurrent_stages)))
+    options = {'n_jobs': stage_jobs, 'epochs': epochs, 'batch_size': batch_size, 'verbose': verbose,
+               'shuffle_buffer': shuffle_buffer, 'chunk_rows': chunk_rows, 'data_path': data_path,
+               'cache_dir': cache.cache_dir}
+
+    # Loaded on first use, so runs that only train streaming stages never hold the whole dataset
+    frame, frame_lock = {}, threading.Lock()
+
+    def get_frame():
+        with frame_lock:
+            if 'df' not in frame:
+                print(f"Loading dataset {data_path}...")
+                frame['df'] = load_training_data(data_path)
+                print("Dataset loaded with shape:", frame['df'].shape)
+            return frame['df']
+
+    # Keys only depend on the data, parameters and the dependencies' keys, so they are known up front
+    fingerprint = dataset_fingerprint(data_path)
+    keys = {}
+    for name, dependencies in STAGE_DEPENDENCIES.items():
+        keys[name] = stage_key(name, stage_params(name, options), fingerprint, [keys[d] for d in dependencies])
+    # Keyed like the stage, so an interrupted run only resumes with the same data and parameters
+    options['backup_dir'] = os.path.join(cache.cache_dir, 'lstm_backup', keys['lstm'])
+
+    results, report = {}, {}
+
+    def run_stage(name):
+        if name not in force:
+            cached = cache.load(name, keys[name])
+            if cached is not None:
+                results[name] = cached
+                report[name] = {'status': 'cached', 'metrics': cached.get('metrics')}
+                print(f"[{name}] loaded from cache")
+                return
+        if name not in stages:
+            report[name] = {'status': 'not run'}
+            return
+        missing = [dependency for dependency in STAGE_DEPENDENCIES[name] if dependency not in results]
+        if missing:
+            report[name] = {'status': 'skipped', 'error': f"missing {missing}"}
+            print(f"[{name}] skipped: {missing} not available")
+            return
+        print(f"[{name}] training...")
+        start = time.perf_counter()
+        try:
+            df = None if name in STREAMING_STAGES else get_frame()
+            result = TRAINERS[name](df, results, options)
+            cache.save(name, keys[name], result)
+        except Exception as e:
+            report[name] = {'status': 'failed', 'error': str(e), 'seconds': time.perf_counter() - start}
+            print(f"[{name}] failed: {e}")
+            return
+        results[name] = result
+        report[name] = {'status': 'trained', 'seconds': time.perf_counter() - start, 'metrics': result.get('metrics')}
+        print(f"[{name}] done in {report[name]['seconds']:.1f}s: {result.get('metrics')}")
+
+    run_stage('scalers')
+    with ThreadPoolExecutor(max_workers=len(SKLEARN_STAGES), thread_name_prefix='train') as pool:
+        futures = [pool.submit(run_stage, name) for name in SKLEARN_STAGES]
+        run_stage('lstm')
+        for future in futures:
+            future.result()
+
+    if 'lstm' in results and 'maintenance_rf' in results:
+        better = 'maintenance_rf' if results['maintenance_rf']['metrics']['r2'] > results['lstm']['metrics']['r2'] else 'lstm'
+        print(f"Better maintenance model by R²: {better}")
+
+    if export:
+        missing = [name for name in EXPORTED_STAGES if name not in results]
+        if missing:
+            print(f"Not exporting: {missing} not available")
+        else:
+            manifest = export_models(results, out_dir)
+            report['bundle'] = {'version': manifest['version']}
+            # What the exported models were trained on, and how well they did on held-out data
+            write_training_state(out_dir, {
+                'data_path': os.path.abspath(data_path),
+                'rows_seen': count_rows(data_path),
+                'bundle_version': manifest['version'],
+                'baseline': {'health_rmse': results['health']['metrics']['rmse'],
+                             'lstm_rmse': results['lstm']['metrics']['rmse']},
+                'updates': [],
+            })
+            print(f"Model bundle {manifest['version']} saved to {os.path.join(out_dir, 'model_bundle')}")
+
+    if plot_dir:
+        save_plots(get_frame(), results, plot_dir)
+
+    with open(os.path.join(out_dir, 'training_report.json'), 'w') as f:
+        json.dump(report, f, indent=2, default=float)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the predictive maintenance models stage by stage")
+    parser.add_argument('--data', default=os.getenv('DATASET_PATH', 'cnc_machine_data_improved.csv'),
+                        help="CSV, parquet/feather or columnar dataset directory")
+    parser.add_argument('--out', default='.', help="Directory for the trained models and model_bundle/")
+    parser.add_argument('--stages', default=','.join(STAGE_DEPENDENCIES),
+                        help=f"Comma-separated stages to train (default: all of {', '.join(STAGE_DEPENDENCIES)})")
+    parser.add_argument('--force', default='', help="Comma-separated stages to retrain even if cached, or 'all'")
+    parser.add_argument('--cache-dir', default=None, help="Stage cache directory (default: <out>/.train_cache)")
+    parser.add_argument('--jobs', type=int, default=-1, help="Threads shared by the concurrently training stages (-1: all cores)")
+    parser.add_argument('--epochs', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--shuffle-buffer', type=int, default=8192, help="LSTM windows held for shuffling")
+    parser.add_argument('--chunk-rows', type=int, default=65536, help="Rows read per chunk when scaling the LSTM inputs")
+    parser.add_argument('--plots', default=None, metavar='DIR', help="Save figures to DIR (off by default)")
+    parser.add_argument('--no-export', action='store_true', help="Train and cache only")
+    args = parser.parse_args()
+
+    stages = [name for name in args.stages.split(',') if name]
+    force = [name for name in args.force.split(',') if name]
+    unknown = [name for name in stages + force if name not in STAGE_DEPENDENCIES and name != 'all']
+    if unknown:
+        parser.error(f"Unknown stages: {unknown}")
+
+    report = run_pipeline(args.data, args.out, stages=stages, force=force, cache_dir=args.cache_dir,
+                          n_jobs=args.jobs, epochs=args.epochs, batch_size=args.batch_size,
+                          shuffle_buffer=args.shuffle_buffer, chunk_rows=args.chunk_rows,
+                          plot_dir=args.plots, export=not args.no_export)
+    failed = [name for name, entry in report.items() if entry.get('status') == 'failed']
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()